@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in of the Funkwhale API serving a synthetic catalog, used by
+the benchmarks. It can add latency to the responses and answer a part of
+the requests with 429.
+
+Run it alone with:
+
+    python benchmarks/mock_server.py --artists 1000 --latency 0.02
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+from urllib.parse import parse_qs, urlparse
+
+
+class Catalog(object):
+
+    def __init__(self, artists: int = 100, albums_by_artist: int = 3,
+                 tracks_by_album: int = 10, audio_size: int = 1048576):
+        """
+        Synthetic catalog of artists, albums and tracks
+
+        Parameters
+        ----------
+        artists : int, optional
+            Number of artists
+        albums_by_artist : int, optional
+            Number of albums of each artist
+        tracks_by_album : int, optional
+            Number of tracks of each album
+        audio_size : int, optional
+            Size in bytes of the audio file of each track
+        """
+        self.audio_size = audio_size
+        self.audio = bytes(random.Random(0).getrandbits(8)
+                           for _ in range(min(audio_size, 65536)))
+
+        self.artists = []
+        self.albums = []
+        self.tracks = []
+        for a in range(1, artists + 1):
+            artist = {'id': a, 'name': 'Artist {}'.format(a),
+                      'mbid': str(uuid.UUID(int=a)),
+                      'creation_date': self._date(a)}
+            self.artists.append(artist)
+            for b in range(albums_by_artist):
+                album = {'id': len(self.albums) + 1,
+                         'title': 'Album {} of {}'.format(b, a),
+                         'artist': artist,
+                         'creation_date': self._date(len(self.albums))}
+                self.albums.append(album)
+                for t in range(tracks_by_album):
+                    _id = len(self.tracks) + 1
+                    track_uuid = str(uuid.UUID(int=_id + 2 ** 64))
+                    self.tracks.append({
+                        'id': _id, 'uuid': track_uuid,
+                        'title': 'Track {} of {}'.format(t, album['title']),
+                        'artist': artist, 'album': album,
+                        'position': t + 1,
+                        'creation_date': self._date(_id),
+                        'listen_url': '/api/v1/listen/{}/'.format(track_uuid),
+                        'uploads': [{
+                            'uuid': str(uuid.UUID(int=_id + 2 ** 65)),
+                            'listen_url': '/api/v1/listen/{}/'.format(
+                                track_uuid),
+                            'size': audio_size, 'bitrate': 320000,
+                            'duration': 180, 'mimetype': 'audio/mpeg',
+                            'extension': 'mp3'}],
+                    })
+        self.by_uuid = {t['uuid']: t for t in self.tracks}
+
+    @staticmethod
+    def _date(n: int) -> str:
+        return '2020-01-01T00:00:00.{:06d}Z'.format(n % 1000000)
+
+    def audio_bytes(self, start: int, end: int) -> bytes:
+        """
+        Return the bytes `start` to `end` (excluded) of an audio file
+        """
+        size = len(self.audio)
+        chunks = []
+        while start < end:
+            offset = start % size
+            chunk = self.audio[offset:offset + min(end - start,
+                                                   size - offset)]
+            chunks.append(chunk)
+            start += len(chunk)
+        return b''.join(chunks)
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b'',
+              content_type: str = 'application/json', headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _json(self, data, status: int = 200):
+        self._send(status, json.dumps(data).encode())
+
+    def _delay(self) -> bool:
+        """
+        Apply the latency and the rate limit of the server, return False if
+        the request is answered with 429.
+        """
+        server = self.server
+        if server.latency:
+            sleep(server.latency + random.uniform(0, server.jitter))
+        with server.lock:
+            server.requests += 1
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(429, b'{}', headers={'Retry-After': '0'})
+            return False
+        return True
+
+    def _page(self, items: list, query: dict):
+        page = int(query.get('page', ['1'])[0])
+        page_size = int(query.get('page_size', ['25'])[0])
+
+        q = query.get('q', [None])[0]
+        if q:
+            items = [i for i in items
+                     if q.lower() in (i.get('name') or i.get('title')).lower()]
+        for key in ('artist', 'album'):
+            if key in query:
+                _id = int(query[key][0])
+                items = [i for i in items if i[key]['id'] == _id]
+        ordering = query.get('ordering', [None])[0]
+        if ordering:
+            items = sorted(items, key=lambda i: i.get(ordering.lstrip('-')),
+                           reverse=ordering.startswith('-'))
+
+        start = (page - 1) * page_size
+        results = items[start:start + page_size]
+        next_url = None
+        if start + page_size < len(items):
+            next_query = {k: v[0] for k, v in query.items()}
+            next_query['page'] = page + 1
+            next_url = 'http://{}{}?{}'.format(
+                self.headers['Host'], urlparse(self.path).path,
+                '&'.join('{}={}'.format(k, v) for k, v in next_query.items()))
+        self._json({'count': len(items), 'next': next_url,
+                    'previous': None, 'results': results})
+
+    def _listen(self, track_uuid: str):
+        catalog = self.server.catalog
+        if track_uuid not in catalog.by_uuid:
+            return self._json({'detail': 'Not found.'}, 404)
+
+        size = catalog.audio_size
+        start, end = 0, size
+        status = 200
+        headers = {'Accept-Ranges': 'bytes'}
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) + 1 if match.group(2) else size,
+                      size)
+            if start >= size:
+                return self._send(416, headers={
+                    'Content-Range': 'bytes */{}'.format(size)})
+            status = 206
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                start, end - 1, size)
+
+        self._send(status, catalog.audio_bytes(start, end), 'audio/mpeg',
+                   headers)
+
+    def do_GET(self):
+        if not self._delay():
+            return
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        path = '/' + url.path.strip('/')
+        catalog = self.server.catalog
+
+        match = re.match(r'^/api/v1/(artists|albums|tracks)(?:/(\d+))?$',
+                         path)
+        if match:
+            items = getattr(catalog, match.group(1))
+            if match.group(2) is None:
+                return self._page(items, query)
+            _id = int(match.group(2))
+            if not 0 < _id <= len(items):
+                return self._json({'detail': 'Not found.'}, 404)
+            return self._json(items[_id - 1])
+
+        match = re.match(r'^/api/v1/listen/([^/]+)$', path)
+        if match:
+            return self._listen(match.group(1))
+
+        if path == '/api/v1/favorites/tracks/all':
+            with self.server.lock:
+                favorites = sorted(self.server.favorites)
+            return self._json({'count': len(favorites), 'results': [
+                {'id': f, 'track': f} for f in favorites]})
+        if path == '/api/v1/rate-limit':
+            return self._json({'enabled': False, 'scopes': []})
+        if path in ('/api/v1/token', '/api/v1/users/users/me'):
+            return self._json({'username': 'demo'})
+
+        self._json({'detail': 'Not found.'}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = parse_qs(self.rfile.read(length).decode())
+        if not self._delay():
+            return
+
+        path = '/' + urlparse(self.path).path.strip('/')
+        if path == '/api/v1/oauth/token':
+            return self._json({
+                'access_token': uuid.uuid4().hex, 'token_type': 'Bearer',
+                'expires_in': 36000, 'expires_at': time() + 36000,
+                'refresh_token': uuid.uuid4().hex, 'scope': ['read']})
+        if path == '/api/v1/token':
+            return self._json({'token': uuid.uuid4().hex})
+        if path.startswith('/api/v1/favorites/tracks'):
+            track = int(body.get('track', ['0'])[0])
+            with self.server.lock:
+                if path.endswith('/remove'):
+                    self.server.favorites.discard(track)
+                else:
+                    self.server.favorites.add(track)
+            return self._json({'id': track, 'track': track})
+
+        self._json({'detail': 'Not found.'}, 404)
+
+
+class MockServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, catalog: Catalog, host: str = '127.0.0.1',
+                 port: int = 0, latency: float = 0, jitter: float = 0,
+                 error_rate: float = 0):
+        """
+        Threaded HTTP server answering like a Funkwhale instance
+
+        Parameters
+        ----------
+        catalog : Catalog
+            The catalog served
+        host : str, optional
+            Address to listen on
+        port : int, optional
+            Port to listen on, a free one by default
+        latency : float, optional
+            Seconds added to each response
+        jitter : float, optional
+            Maximum random seconds added to `latency`
+        error_rate : float, optional
+            Part of the requests answered with 429, between 0 and 1
+        """
+        super().__init__((host, port), Handler)
+        self.catalog = catalog
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.favorites = set()
+        self.lock = threading.Lock()
+
+    @property
+    def domain(self) -> str:
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def start(self) -> 'MockServer':
+        """
+        Serve in a background thread
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--artists', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    args = parser.parse_args()
+
+    server = MockServer(Catalog(args.artists), port=args.port,
+                        latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate)
+    print('Serving on {}'.format(server.domain))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of pyfunkwhale against a local mock of the Funkwhale API.
+
+    python benchmarks/run.py --label my-change --output results.jsonl
+
+Each run is appended to the output file, and compared with the previous run
+of the file when `--compare` is given.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, sleep, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from mock_server import Catalog, MockServer  # noqa: E402
+from pyfunkwhale.client import Client  # noqa: E402
+from pyfunkwhale.funkwhale import Funkwhale  # noqa: E402
+from pyfunkwhale.ratelimit import RateLimiter  # noqa: E402
+
+
+def measure(func, repeat: int) -> dict:
+    """
+    Call `func` `repeat` times and return the statistics of the durations
+    in seconds
+    """
+    durations = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        durations.append(perf_counter() - start)
+    return statistics_of(durations)
+
+
+def statistics_of(durations: list) -> dict:
+    """
+    Return the statistics of a list of durations in seconds
+    """
+    durations = sorted(durations)
+    return {
+        'repeat': len(durations),
+        'mean': statistics.mean(durations),
+        'p50': durations[len(durations) // 2],
+        'p95': durations[min(len(durations) - 1,
+                             int(len(durations) * 0.95))],
+        'min': durations[0],
+    }
+
+
+def plain_funkwhale(server: MockServer, **kwargs) -> Funkwhale:
+    if server.error_rate:
+        kwargs.setdefault('rate_limiter',
+                          RateLimiter(max_retries=20, backoff=0.01))
+    return Funkwhale('pyfunkwhale', 'urn:ietf:wg:oauth:2.0:oob', 'demo',
+                     'demo', server.domain, server.domain + '/api/v1/token/',
+                     **kwargs)
+
+
+def bench_pagination(server: MockServer, repeat: int,
+                     work: float = 0) -> dict:
+    funkwhale = plain_funkwhale(server)
+    count = len(server.catalog.tracks)
+
+    def run(prefetch):
+        n = 0
+        for _ in funkwhale.iter_tracks(page_size=50, prefetch=prefetch):
+            if work:
+                sleep(work)
+            n += 1
+        assert n == count
+
+    results = {}
+    for prefetch in (False, True):
+        result = measure(lambda: run(prefetch), repeat)
+        result['items_per_second'] = count / result['mean']
+        results['prefetch' if prefetch else 'serial'] = result
+    return results
+
+
+def bench_single(server: MockServer, repeat: int, **kwargs) -> dict:
+    funkwhale = plain_funkwhale(server)
+    ids = list(range(1, min(len(server.catalog.tracks), 200) + 1))
+
+    results = {
+        'track': measure(lambda: funkwhale.track(ids[0]), repeat * 10),
+        'tracks_by_ids': measure(
+            lambda: list(funkwhale.tracks_by_ids(ids, max_workers=16)),
+            repeat),
+    }
+    results['tracks_by_ids']['items_per_second'] = \
+        len(ids) / results['tracks_by_ids']['mean']
+    return results
+
+
+def bench_listen(server: MockServer, repeat: int, **kwargs) -> dict:
+    funkwhale = plain_funkwhale(server)
+    track_uuid = server.catalog.tracks[0]['uuid']
+    size = server.catalog.audio_size
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'audio')
+
+        def run(segments):
+            if os.path.exists(filename):
+                os.remove(filename)
+            assert funkwhale.download(track_uuid, filename,
+                                      segments=segments) == size
+
+        results = {}
+        for segments in (1, 4):
+            result = measure(lambda: run(segments), repeat)
+            result['bytes_per_second'] = size / result['mean']
+            results['segments_{}'.format(segments)] = result
+    return results
+
+
+def bench_token_refresh(server: MockServer, repeat: int,
+                        **kwargs) -> dict:
+    os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+    with tempfile.TemporaryDirectory() as directory:
+        token_filename = os.path.join(directory, 'token')
+        with open(token_filename, 'w') as f:
+            json.dump({'access_token': 'a', 'token_type': 'Bearer',
+                       'refresh_token': 'r', 'expires_in': 36000,
+                       'expires_at': time() + 36000}, f)
+
+        client = Client(
+            'pyfunkwhale', 'urn:ietf:wg:oauth:2.0:oob', 'demo', 'demo',
+            server.domain, server.domain + '/api/v1/oauth/token/',
+            client_secret='secret', scopes='read', client_id='id',
+            authorization_endpoint=server.domain + '/authorize',
+            token_filename=token_filename, lazy_login=False)
+
+        def run():
+            client.token_manager.refresh(force=True)
+
+        requests = server.requests
+        result = measure(run, repeat * 5)
+        assert server.requests - requests == result['repeat']
+        return {'refresh': result}
+
+
+# Run in a new interpreter, so the import is not already cached
+STARTUP_SCRIPT = '''
+import json
+import sys
+from time import perf_counter
+
+start = perf_counter()
+from pyfunkwhale.funkwhale import Funkwhale
+from pyfunkwhale.ratelimit import RateLimiter
+imported = perf_counter()
+kwargs = json.loads(sys.argv[2])
+if sys.argv[3] == 'retry':
+    kwargs['rate_limiter'] = RateLimiter(max_retries=20, backoff=0.01)
+funkwhale = Funkwhale(*json.loads(sys.argv[1]), **kwargs)
+built = perf_counter()
+funkwhale.track(1)
+print(json.dumps({'import': imported - start, 'construct': built - imported,
+                  'first_request': perf_counter() - built}))
+'''
+
+
+def bench_startup(server: MockServer, repeat: int, **kwargs) -> dict:
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    env = dict(os.environ, OAUTHLIB_INSECURE_TRANSPORT='1',
+               PYTHONPATH=root + os.pathsep + os.environ.get('PYTHONPATH',
+                                                             ''))
+    with tempfile.TemporaryDirectory() as directory:
+        token_filename = os.path.join(directory, 'token')
+
+        def start(mode_args: list, mode_kwargs: dict) -> dict:
+            # The token expires within the refresh margin, so the first call
+            # also starts a background refresh. A login blocked by it makes
+            # the run time out.
+            with open(token_filename, 'w') as f:
+                json.dump({'access_token': 'a', 'token_type': 'Bearer',
+                           'refresh_token': 'r', 'expires_in': 30,
+                           'expires_at': time() + 30}, f)
+            return json.loads(subprocess.check_output(
+                [sys.executable, '-c', STARTUP_SCRIPT, json.dumps(mode_args),
+                 json.dumps(mode_kwargs),
+                 # Retry the 429 like the other benchmarks
+                 'retry' if server.error_rate else ''],
+                env=env, timeout=60))
+
+        args = ['pyfunkwhale', 'urn:ietf:wg:oauth:2.0:oob', 'demo', 'demo',
+                server.domain]
+        modes = {
+            'plain': (args + [server.domain + '/api/v1/token/'], {}),
+            'oauth': (args + [server.domain + '/api/v1/oauth/token/'], {
+                'client_secret': 'secret', 'scopes': 'read',
+                'client_id': 'id',
+                'authorization_endpoint': server.domain + '/authorize',
+                'token_filename': token_filename}),
+        }
+
+        results = {}
+        for mode, (mode_args, mode_kwargs) in modes.items():
+            runs = [start(mode_args, mode_kwargs)
+                    for _ in range(repeat * 3)]
+            for phase in runs[0]:
+                results['{}_{}'.format(mode, phase)] = statistics_of(
+                    [run[phase] for run in runs])
+        return results
+
+
+BENCHMARKS = {
+    'pagination': bench_pagination,
+    'single': bench_single,
+    'listen': bench_listen,
+    'token_refresh': bench_token_refresh,
+    'startup': bench_startup,
+}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: dict, current: dict, path: str = ''):
+    """
+    Print the relative change of the mean durations between two runs
+    """
+    for key, value in current.items():
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if isinstance(value, dict) and 'mean' in value:
+            if old and old.get('mean'):
+                change = (value['mean'] - old['mean']) / old['mean'] * 100
+                print('{:<40} {:>10.2f}ms {:>+8.1f}%'.format(
+                    path + key, value['mean'] * 1000, change))
+            else:
+                print('{:<40} {:>10.2f}ms'.format(
+                    path + key, value['mean'] * 1000))
+        elif isinstance(value, dict):
+            compare(old or {}, value, path + key + '.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('benchmarks', nargs='*',
+                        help='Benchmarks to run among {}, all by default'
+                        .format(', '.join(BENCHMARKS)))
+    parser.add_argument('--artists', type=int, default=20)
+    parser.add_argument('--audio-size', type=int, default=4 * 1048576)
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--work', type=float, default=0.0002,
+                        help='Seconds of processing simulated by item '
+                        'during the pagination')
+    parser.add_argument('--label', default=None)
+    parser.add_argument('--output', default=None,
+                        help='JSON lines file where append the results')
+    parser.add_argument('--compare', action='store_true',
+                        help='Compare with the last run of --output')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark {}'.format(name))
+
+    catalog = Catalog(args.artists, audio_size=args.audio_size)
+    server = MockServer(catalog, latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate).start()
+
+    results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        results[name] = BENCHMARKS[name](server, args.repeat,
+                                         work=args.work)
+    server.shutdown()
+
+    run = {
+        'label': args.label,
+        'revision': git_revision(),
+        'date': time(),
+        'python': sys.version.split()[0],
+        'options': {k: v for k, v in vars(args).items()
+                    if k not in ('output', 'compare', 'label')},
+        'results': results,
+    }
+
+    previous = None
+    if args.output and os.path.exists(args.output):
+        with open(args.output) as f:
+            lines = [line for line in f if line.strip()]
+        if lines:
+            previous = json.loads(lines[-1])
+
+    compare(previous['results'] if args.compare and previous else {},
+            results)
+
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(run) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import re
+
+import httpx
+
+from pyfunkwhale.client import Client, InvalidTokenError
+from pyfunkwhale.deadline import DeadlineExceeded
+
+
+class AsyncClient(object):
+
+    def __init__(self, *args, concurrency: int = 100,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20, http2: bool = False,
+                 **kwargs):
+        """
+        Asynchronous client initialization.
+
+        The authentication (plain HTTP or OAuth2) is handled by a
+        `pyfunkwhale.client.Client` built with the same arguments, so the
+        token file and its refresh logic are shared with the synchronous
+        client. The requests themselves are sent with a pooled
+        `httpx.AsyncClient`.
+
+        Parameters
+        ----------
+        *args, **kwargs
+            Arguments given to `pyfunkwhale.client.Client`
+        concurrency : int, optional
+            Maximum number of requests in flight at the same time
+            Default value: 100
+        max_connections : int, optional
+            Maximum number of connections in the pool
+            Default value: 100
+        max_keepalive_connections : int, optional
+            Maximum number of idle connections kept alive in the pool
+            Default value: 20
+        http2 : bool, optional
+            Use HTTP/2 when the `h2` package is installed
+        """
+        self.client = Client(*args, **kwargs)
+        self.domain = self.client.domain
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._refresh_lock = asyncio.Lock()
+
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                http2 = False
+
+        timeout = httpx.Timeout(5.0)
+        if isinstance(self.client.timeout, tuple):
+            connect, read = self.client.timeout
+            timeout = httpx.Timeout(read, connect=connect)
+        elif self.client.timeout is not None:
+            timeout = httpx.Timeout(self.client.timeout)
+
+        auth = None
+        if not self.client.oauth:
+            auth = (self.client.username, self.client.password)
+
+        self.session = httpx.AsyncClient(
+            auth=auth,
+            timeout=timeout,
+            headers=None if self.client.compression
+            else {'Accept-Encoding': 'identity'},
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """
+        Close all the connections of the pool
+        """
+        await self.session.aclose()
+
+    async def login(self):
+        """
+        Load and refresh the OAuth2 token, which the first call does
+        otherwise. Nothing to do in plain HTTP mode, where the credentials
+        are sent with each request.
+        """
+        if self.client.oauth:
+            await self._refresh_token()
+
+    async def _refresh_token(self):
+        """
+        Refresh the OAuth2 token in a thread if it is about to expire. Only one
+        refresh is done at a time, other calls wait for its result. The saved
+        token is loaded by the first call.
+        """
+        if not self.client._logged_in:
+            async with self._refresh_lock:
+                await asyncio.to_thread(self.client._login)
+        if not self.client._token_expired():
+            return
+        async with self._refresh_lock:
+            if self.client._token_expired():
+                await asyncio.to_thread(self.client._refresh_token)
+
+    async def call(self, endpoint: str, method: str, params: dict = None,
+                   data: dict = None, headers: dict = None,
+                   deadline: float = None) -> httpx.Response:
+        """
+        Call the API
+
+        Parameters
+        ----------
+        endpoint : str
+            The endpoint to call on the API
+        method : str
+            The HTTP method to use for calling the endpoint
+        params : dict, optional
+            The uri params for a GET method
+        data : dict, optional
+            The uri data for a POST method
+        deadline : float, optional
+            Seconds the whole call may take, the deadline of the client by
+            default. The call can also be cancelled by cancelling its task.
+
+        Raises
+        ------
+        httpx.HTTPStatusError
+            If their is an error during requesting the API.
+        pyfunkwhale.client.InvalidTokenError
+            If current token is invalid
+        pyfunkwhale.deadline.DeadlineExceeded
+            If the call is not completed before its deadline
+        """
+        if deadline is None:
+            deadline = self.client.deadline
+        if deadline is None:
+            return await self._call(endpoint, method, params, data, headers)
+        try:
+            return await asyncio.wait_for(
+                self._call(endpoint, method, params, data, headers), deadline)
+        except asyncio.TimeoutError as e:
+            raise DeadlineExceeded(
+                "The deadline of the call is over") from e
+
+    async def _call(self, endpoint: str, method: str, params: dict = None,
+                    data: dict = None,
+                    headers: dict = None) -> httpx.Response:
+        """
+        Send the request to the API, see `call`.
+        """
+        headers = dict(headers or {})
+
+        if self.client.oauth:
+            await self._refresh_token()
+            token = self.client.token
+            headers.setdefault(
+                'Authorization',
+                token['token_type'] + ' ' + token['access_token'])
+
+        endpoint = re.sub(r'^\/', '', endpoint)
+
+        async with self._semaphore:
+            r = await self.session.request(
+                method, self.domain + '/api/v1/' + endpoint, headers=headers,
+                params=params, data=data)
+
+        if r.status_code == 401 and self.client.oauth:
+            raise InvalidTokenError(self.client)
+
+        r.raise_for_status()
+
+        return r
@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from pyfunkwhale.async_client import AsyncClient
+from pyfunkwhale.funkwhale import Funkwhale
+
+
+class AsyncFunkwhale(object):
+    """
+    Asynchronous version of `pyfunkwhale.funkwhale.Funkwhale`.
+
+    Every endpoint method is a coroutine with the same parameters as its
+    synchronous counterpart, see `pyfunkwhale.funkwhale.Funkwhale` for their
+    documentation. The responses returned as is are `httpx.Response`.
+
+    Entering the context loads and refreshes the OAuth2 token, otherwise the
+    first call does it. The plain HTTP mode sends the credentials with each
+    request.
+    """
+
+    _build_params = Funkwhale._build_params
+    _check_ordering = Funkwhale._check_ordering
+    _project = Funkwhale._project
+
+    def __init__(self, *args, **kwargs):
+        self.client = AsyncClient(*args, **kwargs)
+
+    async def __aenter__(self):
+        await self.client.login()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the underlying HTTP connections
+        """
+        await self.client.close()
+
+    async def _iter_pages(self, fetch: Callable[..., Awaitable[dict]],
+                          params: dict, max_items: int = None,
+                          prefetch: bool = False) -> AsyncIterator[dict]:
+        """
+        Iterate over all the results of a paginated endpoint, see
+        `pyfunkwhale.funkwhale.Funkwhale._iter_pages`.
+        """
+        if max_items is not None and max_items <= 0:
+            return
+
+        params = self._build_params(params)
+        for k in ('max_items', 'prefetch'):
+            params.pop(k, None)
+        page = params.pop('page', 1)
+        count = 0
+
+        task = asyncio.ensure_future(fetch(page=page, **params)) \
+            if prefetch else None
+        try:
+            while page is not None:
+                data = await task if task else await fetch(page=page,
+                                                           **params)
+
+                page = None
+                task = None
+                if data.get('next'):
+                    query = parse_qs(urlparse(data['next']).query)
+                    page = int(query.get('page', [0])[0]) or None
+                if prefetch and page is not None:
+                    task = asyncio.ensure_future(fetch(page=page, **params))
+
+                for item in data.get('results', []):
+                    yield item
+                    count += 1
+                    if max_items is not None and count >= max_items:
+                        return
+        finally:
+            if task:
+                task.cancel()
+
+    async def create_app(self, name: str, redirect_uris: str = None,
+                         scopes: str = None) -> dict:
+        """
+        Register an OAuth application
+        """
+
+        arguments = locals()
+
+        datas = self._build_params(arguments)
+
+        r = await self.client.call('/oauth/apps/', 'post', data=datas)
+        return r.json()
+
+    async def user_me(self) -> dict:
+        """
+        Retrieve profile informations of the current user
+        """
+
+        r = await self.client.call('/users/users/me', 'get')
+        return r.json()
+
+    async def rate_limit(self) -> dict:
+        """
+        Retrieve rate-limit information and current usage status
+        """
+
+        r = await self.client.call('/rate-limit', 'get')
+        return r.json()
+
+    async def artists(self, q: str = None, ordering: str = None,
+                      playable: bool = None, page: int = None,
+                      page_size: int = None,
+                      fields: Iterable[str] = None) -> dict:
+        """
+        List artists
+        """
+
+        arguments = locals()
+
+        self._check_ordering(ordering, ['creation_date', 'id', 'name'])
+
+        params = self._build_params(arguments)
+        params.pop('fields', None)
+
+        r = await self.client.call('/artists/', 'get', params)
+        return self._project(r.json(), fields)
+
+    def iter_artists(self, q: str = None, ordering: str = None,
+                     playable: bool = None, page_size: int = None,
+                     max_items: int = None,
+                     prefetch: bool = False,
+                     fields: Iterable[str] = None) -> AsyncIterator[dict]:
+        """
+        Iterate over all artists, page after page
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(self.artists, arguments, max_items, prefetch)
+
+    async def artist(self, _id: int, refresh: bool = False) -> dict:
+        """
+        Retrieve a single artist
+        """
+
+        arguments = locals()
+
+        params = self._build_params(arguments)
+
+        r = await self.client.call(f'/artists/{_id}', 'get', params)
+        return r.json()
+
+    async def artist_libraries(self, _id: int, page: int = None,
+                               page_size: int = None) -> dict:
+        """
+        List available user libraries containing work from this artist
+        """
+
+        arguments = locals()
+
+        params = self._build_params(arguments)
+
+        r = await self.client.call(f'/artists/{_id}/libraries/', 'get',
+                                   params)
+        return r.json()
+
+    def iter_artist_libraries(self, _id: int, page_size: int = None,
+                              max_items: int = None,
+                              prefetch: bool = False) -> AsyncIterator[dict]:
+        """
+        Iterate over all user libraries containing work from this artist
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(
+                lambda **kwargs: self.artist_libraries(_id, **kwargs),
+                arguments, max_items, prefetch)
+
+    async def albums(self, q: str = None, artist: int = None,
+                     ordering: str = None, playable: bool = None,
+                     page: int = None, page_size: int = None,
+                     fields: Iterable[str] = None) -> dict:
+        """
+        List albums
+        """
+
+        arguments = locals()
+
+        self._check_ordering(ordering,
+                             ['creation_date', 'release_date', 'title'])
+
+        params = self._build_params(arguments)
+        params.pop('fields', None)
+
+        r = await self.client.call('/albums/', 'get', params)
+        return self._project(r.json(), fields)
+
+    def iter_albums(self, q: str = None, artist: int = None,
+                    ordering: str = None, playable: bool = None,
+                    page_size: int = None, max_items: int = None,
+                    prefetch: bool = False,
+                    fields: Iterable[str] = None) -> AsyncIterator[dict]:
+        """
+        Iterate over all albums, page after page
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(self.albums, arguments, max_items, prefetch)
+
+    async def album(self, _id: int, refresh: bool = False) -> dict:
+        """
+        Retrieve a single album
+        """
+
+        arguments = locals()
+
+        params = self._build_params(arguments)
+
+        r = await self.client.call(f'/albums/{_id}', 'get', params)
+        return r.json()
+
+    async def album_libraries(self, _id: int, page: int = None,
+                              page_size: int = None) -> dict:
+        """
+        List available user libraries containing work from this album
+        """
+
+        arguments = locals()
+
+        params = self._build_params(arguments)
+
+        r = await self.client.call(f'/albums/{_id}/libraries/', 'get',
+                                   params)
+        return r.json()
+
+    def iter_album_libraries(self, _id: int, page_size: int = None,
+                             max_items: int = None,
+                             prefetch: bool = False) -> AsyncIterator[dict]:
+        """
+        Iterate over all user libraries containing work from this album
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(
+                lambda **kwargs: self.album_libraries(_id, **kwargs),
+                arguments, max_items, prefetch)
+
+    async def tracks(self, q: str = None, artist: int = None,
+                     ordering: str = None, playable: bool = None,
+                     page: int = None, page_size: int = None,
+                     album: int = None,
+                     fields: Iterable[str] = None) -> dict:
+        """
+        List tracks
+        """
+
+        arguments = locals()
+
+        self._check_ordering(ordering,
+                             ['creation_date', 'release_date', 'title'])
+
+        params = self._build_params(arguments)
+        params.pop('fields', None)
+
+        r = await self.client.call('/tracks/', 'get', params)
+        return self._project(r.json(), fields)
+
+    def iter_tracks(self, q: str = None, artist: int = None,
+                    ordering: str = None, playable: bool = None,
+                    page_size: int = None, max_items: int = None,
+                    prefetch: bool = False, album: int = None,
+                    fields: Iterable[str] = None) -> AsyncIterator[dict]:
+        """
+        Iterate over all tracks, page after page
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(self.tracks, arguments, max_items, prefetch)
+
+    async def track(self, _id: int, refresh: bool = False) -> dict:
+        """
+        Retrieve a single track
+        """
+
+        arguments = locals()
+
+        params = self._build_params(arguments)
+
+        r = await self.client.call(f'/tracks/{_id}', 'get', params)
+        return r.json()
+
+    async def track_libraries(self, _id: int, page: int = None,
+                              page_size: int = None) -> dict:
+        """
+        List available user libraries containing work from this track
+        """
+
+        arguments = locals()
+
+        params = self._build_params(arguments)
+
+        r = await self.client.call(f'/tracks/{_id}/libraries/', 'get',
+                                   params)
+        return r.json()
+
+    def iter_track_libraries(self, _id: int, page_size: int = None,
+                             max_items: int = None,
+                             prefetch: bool = False) -> AsyncIterator[dict]:
+        """
+        Iterate over all user libraries containing work from this track
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(
+                lambda **kwargs: self.track_libraries(_id, **kwargs),
+                arguments, max_items, prefetch)
+
+    async def listen(self, _uuid, to: str = None,
+                     upload: str = None) -> httpx.Response:
+        """
+        Download the audio file matching the given track uuid
+
+        Return the `httpx.Response`, read in memory.
+        """
+
+        arguments = locals()
+
+        to_fields = ['ogg', 'mp3']
+        if to is not None and to not in to_fields:
+            raise ValueError("The to field {} is not in the to"
+                             "fields accepted".format(to))
+
+        params = self._build_params(arguments)
+
+        return await self.client.call(f'/listen/{_uuid}', 'get', params)
+
+    async def licenses(self, page: str = None,
+                       page_size: str = None) -> dict:
+        """
+        List license
+        """
+
+        arguments = locals()
+
+        params = self._build_params(arguments)
+
+        r = await self.client.call('/licenses/', 'get', params)
+        return r.json()
+
+    def iter_licenses(self, page_size: int = None, max_items: int = None,
+                      prefetch: bool = False) -> AsyncIterator[dict]:
+        """
+        Iterate over all licenses, page after page
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(self.licenses, arguments, max_items,
+                                prefetch)
+
+    async def license(self, _code) -> dict:
+        """
+        Retrieve a single license
+        """
+
+        arguments = locals()
+
+        params = self._build_params(arguments)
+
+        r = await self.client.call(f'/licenses/{_code}', 'get', params)
+        return r.json()
+
+    async def favorites_tracks(self, q: str = None, user: str = None,
+                               page: int = None,
+                               page_size: int = None) -> dict:
+        """
+        List favorites tracks
+        """
+
+        arguments = locals()
+
+        params = self._build_params(arguments)
+
+        r = await self.client.call('/favorites/tracks/', 'get', params)
+        return r.json()
+
+    def iter_favorites_tracks(self, q: str = None, user: str = None,
+                              page_size: int = None, max_items: int = None,
+                              prefetch: bool = False) -> AsyncIterator[dict]:
+        """
+        Iterate over all favorites tracks, page after page
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(self.favorites_tracks, arguments, max_items,
+                                prefetch)
+
+    async def add_favorite_track(self, track: str) -> dict:
+        """
+        Add a track to favorite
+        """
+
+        arguments = locals()
+
+        data = self._build_params(arguments)
+
+        r = await self.client.call('/favorites/tracks', 'post', data=data)
+        return r.json()
+
+    async def delete_favorite_track(self, track: str) -> httpx.Response:
+        """
+        Remove a track from favorites.
+
+        Return the `httpx.Response`.
+        """
+
+        arguments = locals()
+
+        data = self._build_params(arguments)
+
+        return await self.client.call('/favorites/tracks/remove/', 'post',
+                                      data=data)
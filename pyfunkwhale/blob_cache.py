@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from time import time
+from typing import BinaryIO, Callable
+
+from pyfunkwhale.singleflight import SingleFlight
+from pyfunkwhale.utils import file_lock
+
+
+class BlobCache(object):
+
+    def __init__(self, directory: str, max_bytes: int = 1024 ** 3,
+                 policy: str = 'lru', verify: str = 'size'):
+        """
+        On-disk content-addressed cache of audio files.
+
+        Each file is stored once under its sha256, whatever the number of
+        requests returning it. The requests and the files are indexed in a
+        SQLite database, and the changes of the index and of the files are
+        done under a file lock, so several processes can share the same
+        directory. The cached files are returned opened, so they stay
+        readable if they are evicted meanwhile.
+
+        Parameters
+        ----------
+        directory : str
+            The directory of the cache, created if it does not exist
+        max_bytes : int, optional
+            Total size of the files kept, the least recently (lru) or least
+            frequently (lfu) used are removed beyond
+            Default value: 1 GiB
+        policy : str, optional
+            The eviction policy, 'lru' or 'lfu'
+            Default value: 'lru'
+        verify : str, optional
+            How a file is checked before being used: 'size' compares its
+            size with the indexed one, 'checksum' its sha256 with its name
+            Default value: 'size'
+
+        Raises
+        ------
+        ValueError
+            If `policy` or `verify` are set with wrong values
+        """
+        if policy not in ('lru', 'lfu'):
+            raise ValueError("The policy {} is not lru or lfu".format(policy))
+        if verify not in ('size', 'checksum'):
+            raise ValueError("The verify field {} is not size or "
+                             "checksum".format(verify))
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.verify = verify
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.corruptions = 0
+
+        self._lock = threading.Lock()
+        self._singleflight = SingleFlight()
+
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, 'index.db'),
+                                   timeout=30, check_same_thread=False)
+        with self._locked():
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS blobs ('
+                'digest TEXT PRIMARY KEY, size INTEGER, '
+                'accessed_at REAL, hits INTEGER)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS keys ('
+                'key TEXT PRIMARY KEY, digest TEXT, content_type TEXT)')
+            columns = [row[1] for row in self._db.execute(
+                'PRAGMA table_info(keys)')]
+            if 'content_type' not in columns:
+                self._db.execute(
+                    'ALTER TABLE keys ADD COLUMN content_type TEXT')
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the thread lock, the lock of the directory and a transaction
+        """
+        with self._lock, file_lock(os.path.join(self.directory, '.lock')), \
+                self._db:
+            yield
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def _remove(self, digest: str):
+        self._db.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+        self._db.execute('DELETE FROM keys WHERE digest = ?', (digest,))
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> BinaryIO:
+        """
+        Return the cached file of a request opened in binary mode, None if
+        it is not cached or if it is corrupted, in which case it is removed.
+        The caller closes the file.
+
+        The file is opened under the lock, so an eviction can not remove it
+        before, and its checksum is verified after releasing the lock.
+
+        Parameters
+        ----------
+        key : str
+            The key of the request, see `pyfunkwhale.cache.request_key`
+        """
+        with self._locked():
+            row = self._db.execute(
+                'SELECT blobs.digest, blobs.size FROM keys '
+                'JOIN blobs ON blobs.digest = keys.digest '
+                'WHERE keys.key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            digest, size = row
+            try:
+                f = open(self.path(digest), 'rb')
+            except OSError:
+                f = None
+            if f is not None and os.fstat(f.fileno()).st_size != size:
+                f.close()
+                f = None
+            if f is not None:
+                self._db.execute(
+                    'UPDATE blobs SET accessed_at = ?, hits = hits + 1 '
+                    'WHERE digest = ?', (time(), digest))
+
+        if f is not None and self.verify == 'checksum':
+            valid = _stream_digest(f) == digest
+            f.seek(0)
+            if not valid:
+                f.close()
+                f = None
+
+        if f is None:
+            with self._locked():
+                self._remove(digest)
+                self.corruptions += 1
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return f
+
+    def metadata(self, key: str) -> dict:
+        """
+        Return the metadata kept with a request, ie. its `content_type`,
+        None if the request is not cached
+
+        Parameters
+        ----------
+        key : str
+            The key of the request, see `pyfunkwhale.cache.request_key`
+        """
+        with self._locked():
+            row = self._db.execute(
+                'SELECT content_type FROM keys WHERE key = ?',
+                (key,)).fetchone()
+        if row is None:
+            return None
+        return {'content_type': row[0]}
+
+    def put(self, key: str, filename: str, content_type: str = None) -> str:
+        """
+        Move a file in the cache as the content of a request, return its
+        path in the cache
+
+        Parameters
+        ----------
+        key : str
+            The key of the request, see `pyfunkwhale.cache.request_key`
+        filename : str
+            The file to move, in the same filesystem as the cache
+        content_type : str, optional
+            The content type of the response, kept with the request
+        """
+        digest = _file_digest(filename)
+        size = os.path.getsize(filename)
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._locked():
+            os.replace(filename, path)
+            self._db.execute(
+                'INSERT INTO blobs VALUES (?, ?, ?, 0) '
+                'ON CONFLICT (digest) DO UPDATE SET accessed_at = ?',
+                (digest, size, time(), time()))
+            self._db.execute(
+                'INSERT OR REPLACE INTO keys VALUES (?, ?, ?)',
+                (key, digest, content_type))
+            self._evict(keep=digest)
+        return path
+
+    def fetch(self, key: str, writer: Callable[[str], dict]) -> BinaryIO:
+        """
+        Return the cached file of a request opened in binary mode, calling
+        `writer` to create it when it is not cached. The concurrent fetches
+        of the same key in a process call `writer` once. The caller closes
+        the file.
+
+        Parameters
+        ----------
+        key : str
+            The key of the request, see `pyfunkwhale.cache.request_key`
+        writer : Callable[[str], dict]
+            Write the content of the request in the given filename, and
+            return None or the metadata of the request, ie.
+            `{'content_type': 'audio/mpeg'}`
+
+        Raises
+        ------
+        RuntimeError
+            If the file is evicted each time before it can be opened
+        """
+        f = self.get(key)
+        if f is not None:
+            return f
+
+        def _fill():
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.blob')
+            os.close(fd)
+            try:
+                metadata = writer(tmp)
+                if not isinstance(metadata, dict):
+                    metadata = {}
+                return self.put(key, tmp, metadata.get('content_type'))
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+        # Another put can evict the new file before it is opened
+        for _ in range(3):
+            self._singleflight.do(key, _fill)
+            f = self.get(key)
+            if f is not None:
+                return f
+        raise RuntimeError(
+            "The file of {} is evicted before it can be opened, the cache "
+            "is too small".format(key))
+
+    def open(self, key: str,
+             writer: Callable[[str], None] = None) -> mmap.mmap:
+        """
+        Map the cached file of a request in memory, read-only. The mapping
+        stays valid if the file is evicted meanwhile. Empty files can not be
+        mapped, they are returned as empty bytes.
+
+        Return None if the request is not cached and no `writer` is given.
+
+        Parameters
+        ----------
+        key : str
+            The key of the request, see `pyfunkwhale.cache.request_key`
+        writer : Callable[[str], None], optional
+            Create the file when it is not cached, see `fetch`
+        """
+        f = self.get(key) if writer is None else self.fetch(key, writer)
+        if f is None:
+            return None
+        with f:
+            return _map(f)
+
+    def _evict(self, keep: str = None):
+        """
+        Remove the files beyond `max_bytes`, must be called locked.
+        """
+        total = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        order = 'accessed_at' if self.policy == 'lru' \
+            else 'hits, accessed_at'
+        rows = self._db.execute(
+            'SELECT digest, size FROM blobs WHERE digest != ? '
+            'ORDER BY ' + order, (keep or '',)).fetchall()
+        for digest, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._remove(digest)
+            self.evictions += 1
+            total -= size
+
+    def delete(self, key: str):
+        with self._locked():
+            self._db.execute('DELETE FROM keys WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._locked():
+            for (digest,) in self._db.execute(
+                    'SELECT digest FROM blobs').fetchall():
+                self._remove(digest)
+
+    def size(self) -> int:
+        """
+        Total size in bytes of the cached files
+        """
+        with self._locked():
+            return self._db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'corruptions': self.corruptions,
+            'size': self.size(),
+        }
+
+
+def _stream_digest(f: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _file_digest(filename: str) -> str:
+    with open(filename, 'rb') as f:
+        return _stream_digest(f)
+
+
+def _map(f: BinaryIO) -> mmap.mmap:
+    if os.fstat(f.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
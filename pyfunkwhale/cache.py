@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import time
+from urllib.parse import urlencode
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+# Audio files and the favorites of the user are never cached
+NEVER_CACHED = ('listen/', 'favorites/')
+
+
+def _normalize(endpoint: str) -> str:
+    return re.sub(r'^\/', '', endpoint)
+
+
+def request_key(endpoint: str, params: dict = None) -> str:
+    """
+    Build a key identifying a GET request from its endpoint and params
+
+    Parameters
+    ----------
+    endpoint : str
+        The endpoint called on the API
+    params : dict, optional
+        The uri params of the request
+    """
+    key = _normalize(endpoint)
+    if params:
+        key += '?' + urlencode(sorted(
+            (k, str(v)) for k, v in params.items() if v is not None))
+    return key
+
+
+class CacheEntry(object):
+    """
+    A cached response of the API.
+    """
+
+    __slots__ = ('url', 'status_code', 'headers', 'content', 'expires_at')
+
+    def __init__(self, url: str, status_code: int, headers: dict,
+                 content: bytes, expires_at: float):
+        self.url = url
+        self.status_code = status_code
+        self.headers = dict(headers)
+        self.content = content
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_response(cls, r: Response, ttl: float) -> 'CacheEntry':
+        return cls(r.url, r.status_code, r.headers, r.content, time() + ttl)
+
+    def fresh(self) -> bool:
+        """
+        Check if the entry can be used without asking the server
+        """
+        return time() < self.expires_at
+
+    def validators(self) -> dict:
+        """
+        Headers to send to the server to revalidate the entry
+        """
+        headers = {}
+        if 'ETag' in self.headers:
+            headers['If-None-Match'] = self.headers['ETag']
+        if 'Last-Modified' in self.headers:
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+    def to_response(self) -> Response:
+        """
+        Build a `requests.models.Response` from the entry
+        """
+        r = Response()
+        r.url = self.url
+        r.status_code = self.status_code
+        r.headers = CaseInsensitiveDict(self.headers)
+        r.encoding = get_encoding_from_headers(r.headers)
+        r._content = self.content
+        return r
+
+
+class BaseCache(ABC):
+
+    def __init__(self, ttl: dict = None, default_ttl: float = 0):
+        """
+        Base class of the caches used by `pyfunkwhale.client.Client` for the
+        GET requests.
+
+        Only the endpoints with a time to live are cached, the audio files
+        (`/listen/`) and the favorites never are.
+
+        Parameters
+        ----------
+        ttl : dict, optional
+            Time to live in seconds by endpoint prefix, ie.
+            `{'/licenses/': 86400, '/artists/': 300}`. The longest matching
+            prefix is used.
+        default_ttl : float, optional
+            Time to live in seconds of the endpoints not in `ttl`, not
+            cached by default
+            Default value: 0
+        """
+        self.ttl = {_normalize(k): v for k, v in (ttl or {}).items()}
+        self.default_ttl = default_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.RLock()
+
+    def key(self, endpoint: str, params: dict = None) -> str:
+        """
+        Build the cache key of a request, see `request_key`
+        """
+        return request_key(endpoint, params)
+
+    def ttl_for(self, endpoint: str) -> float:
+        """
+        Time to live of the responses of an endpoint
+
+        Parameters
+        ----------
+        endpoint : str
+            The endpoint called on the API
+        """
+        endpoint = _normalize(endpoint)
+        matches = [k for k in self.ttl if endpoint.startswith(k)]
+        if not matches:
+            return self.default_ttl
+        return self.ttl[max(matches, key=len)]
+
+    def cacheable(self, endpoint: str) -> bool:
+        """
+        Check if the responses of an endpoint go through the cache
+
+        Parameters
+        ----------
+        endpoint : str
+            The endpoint called on the API
+        """
+        if _normalize(endpoint).startswith(NEVER_CACHED):
+            return False
+        return self.ttl_for(endpoint) > 0
+
+    def count(self, counter: str):
+        """
+        Increment one of the `hits`, `misses` or `revalidations` counters
+        """
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict:
+        """
+        Return the counters of the cache
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'revalidations': self.revalidations}
+
+    @abstractmethod
+    def get(self, key: str) -> CacheEntry:
+        """
+        Return the entry of a key, None if it is not cached
+        """
+
+    @abstractmethod
+    def set(self, key: str, entry: CacheEntry):
+        """
+        Store the entry of a key
+        """
+
+    @abstractmethod
+    def delete(self, key: str):
+        """
+        Remove the entry of a key
+        """
+
+    @abstractmethod
+    def clear(self):
+        """
+        Remove all the entries
+        """
+
+
+class MemoryCache(BaseCache):
+
+    def __init__(self, maxsize: int = 1024, **kwargs):
+        """
+        In-memory LRU cache
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            Maximum number of responses kept
+            Default value: 1024
+        **kwargs
+            Arguments given to `BaseCache`
+        """
+        super().__init__(**kwargs)
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> CacheEntry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(BaseCache):
+
+    def __init__(self, filename: str, maxsize: int = 100000, **kwargs):
+        """
+        On-disk LRU cache stored in a SQLite database
+
+        Parameters
+        ----------
+        filename : str
+            The SQLite database filename
+        maxsize : int, optional
+            Maximum number of responses kept
+            Default value: 100000
+        **kwargs
+            Arguments given to `BaseCache`
+        """
+        super().__init__(**kwargs)
+        self.maxsize = maxsize
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, url TEXT, status_code INTEGER, '
+                'headers TEXT, content BLOB, expires_at REAL, '
+                'accessed_at REAL)')
+            self._db.execute(
+                'CREATE INDEX IF NOT EXISTS responses_accessed_at '
+                'ON responses (accessed_at)')
+
+    def get(self, key: str) -> CacheEntry:
+        with self._lock, self._db:
+            row = self._db.execute(
+                'SELECT url, status_code, headers, content, expires_at '
+                'FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                'UPDATE responses SET accessed_at = ? WHERE key = ?',
+                (time(), key))
+        url, status_code, headers, content, expires_at = row
+        return CacheEntry(url, status_code, json.loads(headers), content,
+                          expires_at)
+
+    def set(self, key: str, entry: CacheEntry):
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, entry.url, entry.status_code, json.dumps(entry.headers),
+                 entry.content, entry.expires_at, time()))
+            self._db.execute(
+                'DELETE FROM responses WHERE key IN ('
+                'SELECT key FROM responses ORDER BY accessed_at DESC '
+                'LIMIT -1 OFFSET ?)', (self.maxsize,))
+
+    def delete(self, key: str):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM responses')
@@ -3,13 +3,37 @@
 
 import json
 import re
-from time import time
+import threading
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import perf_counter, time
+from typing import Tuple, Union
 import requests
-from requests_oauthlib import OAuth2Session
-from oauthlib.oauth2.rfc6749.errors import InvalidScopeError
 from requests.models import Response
+from urllib3.util.request import ACCEPT_ENCODING
+
+from pyfunkwhale.blob_cache import BlobCache
+from pyfunkwhale.cache import BaseCache, CacheEntry, request_key
+from pyfunkwhale.deadline import Deadline, DeadlineExceeded
+from pyfunkwhale.hooks import (Hook, LatencyHistogram, RequestInfo,
+                               TimingHTTPAdapter, connect_time,
+                               endpoint_name)
+from pyfunkwhale.ratelimit import RateLimiter
+from pyfunkwhale.singleflight import SingleFlight
+from pyfunkwhale.token_manager import TokenManager
+from pyfunkwhale.utils import json_loads, read_file
+
+
+def accept_encoding() -> str:
+    """
+    Return the content encodings which can be decoded, the most compact
+    first: zstd and br are only available with the zstandard and brotli
+    packages.
+    """
+    available = [e.strip() for e in ACCEPT_ENCODING.split(',')]
+    return ', '.join(e for e in ('zstd', 'br', 'gzip', 'deflate')
+                     if e in available)
 
-from pyfunkwhale.utils import read_file, write_file
 
 class InvalidTokenError(Exception):
 
@@ -20,13 +44,44 @@ class InvalidTokenError(Exception):
         return self.message
 
 
+class APIResponse(Response):
+    """
+    Response of the API, decoding its JSON body with the fast decoder when
+    the client asks for it and reporting the time spent decoding to the
+    hooks of the client.
+    """
+
+    request_info = None
+    client = None
+
+    def json(self, **kwargs):
+        start = perf_counter()
+        if self.client is not None and self.client.fast_json and not kwargs:
+            data = json_loads(self.content)
+        else:
+            data = super().json(**kwargs)
+        if self.request_info is not None:
+            self.request_info.timings['decode'] = perf_counter() - start
+            self.client._emit('after_decode', self.request_info, self)
+        return data
+
+
 class Client(object):
 
     def __init__(
         self, client_name: str, redirect_uri: str, username: str,
         password: str, domain: str, login_endpoint: str,
         client_secret: str = None, scopes: str = None, client_id: str = None,
-        authorization_endpoint: str = None, token_filename: str = None
+        authorization_endpoint: str = None, token_filename: str = None,
+        cache: BaseCache = None, pool_connections: int = 10,
+        pool_maxsize: int = 10, keep_alive: bool = True,
+        thread_safe: bool = False, rate_limiter: RateLimiter = None,
+        hooks: list = None, fast_json: bool = False, coalesce: bool = False,
+        token_refresh_margin: float = 60, background_refresh: bool = True,
+        blob_cache: BlobCache = None, compression: bool = True,
+        timeout: Union[float, Tuple[float, float]] = None,
+        deadline: float = None, hedge: float = None,
+        hedge_min_samples: int = 20, lazy_login: bool = True
     ):
         """
         Client initialization.
@@ -34,6 +89,10 @@ class Client(object):
         If the login_endpoint contain the path 'oauth' then the OAuth2
         Authorization Code flow will be used instead of the plain HTTP login.
 
+        The login is done by the first call of the API, so building a client
+        sends no request and does not read the token file. The OAuth2
+        libraries are only imported in OAuth2 mode.
+
         Parameters
         ----------
         client_name: str
@@ -56,6 +115,52 @@ class Client(object):
             OAuth2 only. The authorization endpoint to use on the API
         token_filename: str
             OAuth2 only. The token filename where to save the token
+        cache: pyfunkwhale.cache.BaseCache
+            Cache used for the responses of GET requests
+        pool_connections: int
+            Number of connection pools (one by host) to keep
+        pool_maxsize: int
+            Maximum number of connections kept by host
+        keep_alive: bool
+            Reuse the connections between requests
+        thread_safe: bool
+            Allow to share the client between threads, the threads wait for a
+            free connection when the pool is full instead of opening a new
+            one
+        rate_limiter: pyfunkwhale.ratelimit.RateLimiter
+            Pace the requests and retry the ones answered with 429, or 503
+            for the idempotent ones
+        hooks: list
+            List of pyfunkwhale.hooks.Hook called around each request
+        fast_json: bool
+            Decode the responses with orjson when it is installed
+        coalesce: bool
+            Merge the identical GET requests sent at the same time by several
+            threads into one request whose response is shared
+        token_refresh_margin: float
+            OAuth2 only. Seconds before its expiration when the token is
+            refreshed
+        background_refresh: bool
+            OAuth2 only. Refresh the token in a background thread instead of
+            during a request
+        blob_cache: pyfunkwhale.blob_cache.BlobCache
+            Cache of the audio files downloaded with `Funkwhale.download`
+        compression: bool
+            Ask for compressed responses, with zstd or brotli when their
+            packages are installed, gzip otherwise
+        timeout: float or tuple
+            Default seconds to wait for the connection and between two bytes
+            of a response, as one value or `(connect, read)`
+        deadline: float
+            Default seconds a whole call may take, retries included
+        hedge: float
+            Percentile of the latencies of an endpoint, between 0 and 100,
+            after which a GET request is sent a second time, the first
+            response received being used
+        hedge_min_samples: int
+            Number of calls of an endpoint measured before hedging them
+        lazy_login: bool
+            Login on the first call instead of while building the client
         """
         self.client_name = client_name
         self.redirect_uri = redirect_uri
@@ -66,34 +171,158 @@ class Client(object):
         self.domain = domain
 
         self.login_endpoint = login_endpoint
+        self.cache = cache
+        self.blob_cache = blob_cache
+        self.rate_limiter = rate_limiter
+        self.hooks = list(hooks or [])
+        self.fast_json = fast_json
+        self.singleflight = SingleFlight() if coalesce else None
+
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.thread_safe = thread_safe
+        self.compression = compression
+        self.timeout = timeout
+        self.deadline = deadline
+
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._latencies = defaultdict(LatencyHistogram)
+        self._hedge_lock = threading.Lock()
+        self._hedge_executor = None
+
+        self.oauth = 'oauth' in self.login_endpoint
+        self._logged_in = False
+        self._login_lock = threading.Lock()
+        self._session_lock = threading.Lock()
+        self._oauth_client = None
+        self._authorization = None
 
-        if 'oauth' not in self.login_endpoint:
+        if not self.oauth:
             self.session = requests.Session()
             self.session.auth = (username, password)
-
-            self.session.get(self.domain + '/api/v1/token/')
+            self._configure_session(self.session)
         else:
             self.client_secret = client_secret
             self.scopes = scopes
             self.client_id = client_id
             self.authorization_endpoint = authorization_endpoint
             self.token_filename = token_filename
-            self.oauth_client = OAuth2Session(
-                            self.client_id,
-                            redirect_uri=self.redirect_uri,
-                            scope=self.scopes)
-            self.authorization_url, self.state = self.oauth_client. \
-                authorization_url(
+            self.token_manager = TokenManager(
+                self, token_refresh_margin, background_refresh)
+
+        if not lazy_login:
+            self._login(Deadline(self.deadline, self.timeout))
+
+    @property
+    def oauth_client(self):
+        """
+        The OAuth2 session, built on first use. None in plain HTTP mode.
+        """
+        if not self.oauth:
+            return None
+        if self._oauth_client is None:
+            # Not the login lock: the background refresh of the token uses
+            # the session while a login may be waiting for the refresh
+            with self._session_lock:
+                if self._oauth_client is None:
+                    from requests_oauthlib import OAuth2Session
+
+                    oauth_client = OAuth2Session(
+                                    self.client_id,
+                                    redirect_uri=self.redirect_uri,
+                                    scope=self.scopes)
+                    self._configure_session(oauth_client)
+                    self._oauth_client = oauth_client
+        return self._oauth_client
+
+    @property
+    def authorization_url(self) -> str:
+        """
+        OAuth2 only. The URL where the user authorizes the client
+        """
+        if self._authorization is None:
+            self._authorization = self.oauth_client.authorization_url(
                                 self.authorization_endpoint)
-            self._connect()
+        return self._authorization[0]
 
-    def _connect(self):
+    @property
+    def state(self) -> str:
         """
-        Use saved token or ask a new one to the API.
+        OAuth2 only. The state of the authorization request
         """
-        try:
-            self.token = json.loads(read_file(self.token_filename))
+        self.authorization_url
+        return self._authorization[1]
+
+    def _login(self, limits: Deadline = None):
+        """
+        Login once, before the first call: load the saved OAuth2 token, or
+        open the plain HTTP session within the limits of the call.
+        """
+        if self._logged_in:
+            return
+        loaded = False
+        with self._login_lock:
+            if self._logged_in:
+                return
+            if not self.oauth:
+                timeout = self.timeout
+                if limits is not None:
+                    limits.check()
+                    timeout = limits.request_timeout()
+                self._request(self.session.get, 'token/', None, None, None,
+                              False, timeout, limits)
+            elif self.token is None:
+                self.token = self._read_token()
+                loaded = True
+            self._logged_in = True
+        # The token manager has its own lock, it is not called while
+        # holding the login lock
+        if loaded:
             self._refresh_token()
+            self.token_manager.schedule()
+
+    def _configure_session(self, session: requests.Session):
+        """
+        Apply the connection pool settings to a session.
+        """
+        adapter = TimingHTTPAdapter(pool_connections=self.pool_connections,
+                                    pool_maxsize=self.pool_maxsize,
+                                    pool_block=self.thread_safe)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        session.headers['Accept-Encoding'] = accept_encoding() \
+            if self.compression else 'identity'
+
+    def add_hook(self, hook: Hook):
+        """
+        Add a hook called around each request
+
+        Parameters
+        ----------
+        hook : pyfunkwhale.hooks.Hook
+            The hook to add
+        """
+        self.hooks.append(hook)
+
+    def _emit(self, event: str, *args):
+        """
+        Call the method `event` of all the hooks.
+        """
+        for hook in self.hooks:
+            getattr(hook, event)(*args)
+
+    def _read_token(self) -> dict:
+        """
+        Read the saved token, ask a new one if there is none.
+        """
+        try:
+            return json.loads(read_file(self.token_filename))
         except FileNotFoundError:
             raise InvalidTokenError(self)
 
@@ -108,36 +337,52 @@ class Client(object):
             raise InvalidTokenError(self)
         self.authorization_code = authorization_code
 
-        self.token = self.oauth_client.fetch_token(
+        self.token_manager.set_token(self.oauth_client.fetch_token(
                                 self.login_endpoint,
                                 code=self.authorization_code,
-                                client_secret=self.client_secret)
-        write_file(self.token_filename, self.token)
+                                client_secret=self.client_secret))
+
+    def _token_expired(self) -> bool:
+        """
+        Check if the token expires in less than `token_refresh_margin`
+        seconds.
+        """
+        if self.token is None:
+            raise InvalidTokenError(self)
+        return self.token_manager.needs_refresh()
 
     def _refresh_token(self):
         """
-        Check if the token is expired in 60 seconds and if True will ask a new
-        token from the instance.
+        Make sure the token can be used, see
+        `pyfunkwhale.token_manager.TokenManager.ensure`.
         """
         if self.token is None:
             raise InvalidTokenError(self)
-        if time() - 60 > self.token["expires_at"]:
-            try:
-                self.token = self.oauth_client.refresh_token(
-                    self.login_endpoint,
-                    refresh_token=self.token["refresh_token"],
-                    client_id=self.client_id,
-                    client_secret=self.client_secret)
-                write_file(self.token_filename, self.token)
-            except InvalidScopeError:
-                raise InvalidTokenError(self)
+        self.token_manager.ensure()
+
+    def _fetch_refreshed_token(self) -> dict:
+        """
+        Ask a new token from the instance with the refresh token.
+        """
+        from oauthlib.oauth2.rfc6749.errors import InvalidScopeError
+
+        start = perf_counter()
+        try:
+            token = self.oauth_client.refresh_token(
+                self.login_endpoint,
+                refresh_token=self.token["refresh_token"],
+                client_id=self.client_id,
+                client_secret=self.client_secret)
+        except InvalidScopeError:
+            raise InvalidTokenError(self)
+        self._emit('on_token_refresh', perf_counter() - start)
+        return token
 
     def _force_refresh_token(self):
         """
         Force the refresh of the OAuth2 token
         """
         self._set_token()
-        write_file(self.token_filename, self.token)
 
     def _get_JWT_token(self) -> dict:
         """
@@ -147,7 +392,12 @@ class Client(object):
         return self.call('/token', 'post', data=data).json()
 
     def call(self, endpoint: str, method: str, params: dict = None,
-             data: dict = None, headers: dict = None) -> Response:
+             data: dict = None, headers: dict = None,
+             stream: bool = False,
+             timeout: Union[float, Tuple[float, float]] = None,
+             deadline: float = None,
+             cancel: threading.Event = None,
+             idempotent: bool = None) -> Response:
         """
         Call the API
 
@@ -161,6 +411,25 @@ class Client(object):
             The uri params for a GET method
         data : dict, optional
             The uri data for a POST method
+        headers : dict, optional
+            Additional headers of the request
+        stream : bool, optional
+            Do not download the body of the response immediately, it is
+            read with `Response.iter_content`. Never cached.
+        timeout : float or tuple, optional
+            Seconds to wait for the connection and between two bytes of the
+            response, as one value or `(connect, read)`. The timeout of the
+            client by default.
+        deadline : float, optional
+            Seconds the whole call may take, retries included. The deadline
+            of the client by default.
+        cancel : threading.Event, optional
+            Set it from another thread to cancel the call, it is checked
+            between the steps of the call and while reading the response
+        idempotent : bool, optional
+            Whether the request can be sent again after a 503, which the
+            server may answer once the request is processed. By default only
+            the GET, HEAD and DELETE requests are.
 
         Raises
         ------
@@ -168,29 +437,302 @@ class Client(object):
             If their is an error during requesting the API.
         pyfunkwhale.client.InvalidTokenError
             If current token is invalid
+        pyfunkwhale.deadline.DeadlineExceeded
+            If the call is not completed before its deadline
+        pyfunkwhale.deadline.RequestCancelled
+            If the call is cancelled
+        """
+        limits = Deadline(
+            deadline if deadline is not None else self.deadline,
+            timeout if timeout is not None else self.timeout, cancel)
+
+        if method == 'get' and not stream:
+            # Only the calls with the limits of the client are merged, a
+            # waiter still gives up at its own deadline
+            if self.singleflight is not None and not headers \
+                    and cancel is None and deadline is None \
+                    and timeout is None:
+                return self.singleflight.do(
+                    request_key(endpoint, params),
+                    lambda: self._get(endpoint, params, limits=limits),
+                    limits)
+            return self._get(endpoint, params, headers, limits)
+
+        return self._call(endpoint, method, params, data, headers, stream,
+                          limits, idempotent)
+
+    def _get(self, endpoint: str, params: dict = None,
+             headers: dict = None, limits: Deadline = None) -> Response:
+        """
+        Send a GET request, through the cache if there is one.
+        """
+        if self.cache is not None and self.cache.cacheable(endpoint):
+            return self._cached_call(endpoint, params, headers, limits)
+
+        return self._call(endpoint, 'get', params, headers=headers,
+                          limits=limits)
+
+    def _cached_call(self, endpoint: str, params: dict = None,
+                     headers: dict = None,
+                     limits: Deadline = None) -> Response:
+        """
+        Call the API with a GET request going through the cache. Stale
+        entries are revalidated with their `ETag` and `Last-Modified`
+        headers.
         """
-        if getattr(self, 'oauth_client', False):
+        key = self.cache.key(endpoint, params)
+        entry = self.cache.get(key)
+
+        if entry is not None and entry.fresh():
+            self.cache.count('hits')
+            return self._cached_response(entry)
+
+        headers = dict(headers or {})
+        if entry is not None:
+            headers.update(entry.validators())
+
+        r = self._call(endpoint, 'get', params, headers=headers,
+                       limits=limits)
+
+        ttl = self.cache.ttl_for(endpoint)
+        if r.status_code == 304 and entry is not None:
+            self.cache.count('revalidations')
+            entry.expires_at = time() + ttl
+            self.cache.set(key, entry)
+            return self._cached_response(entry)
+
+        self.cache.count('misses')
+        if (
+                r.status_code == 200
+                and 'no-store' not in r.headers.get('Cache-Control', '')
+        ):
+            self.cache.set(key, CacheEntry.from_response(r, ttl))
+
+        return r
+
+    def _cached_response(self, entry: CacheEntry) -> APIResponse:
+        """
+        Build the response of a cache entry.
+        """
+        r = entry.to_response()
+        r.__class__ = APIResponse
+        r.client = self
+        return r
+
+    def _call(self, endpoint: str, method: str, params: dict = None,
+              data: dict = None, headers: dict = None,
+              stream: bool = False, limits: Deadline = None,
+              idempotent: bool = None) -> Response:
+        """
+        Send the request to the API, see `call`. The GET requests are
+        hedged when the client has a hedge percentile.
+        """
+        if limits is None:
+            limits = Deadline(self.deadline, self.timeout)
+
+        if self.hedge is None or method != 'get' or stream:
+            return self._retrying_call(endpoint, method, params, data,
+                                       headers, stream, limits, idempotent)
+
+        latency = self._latencies[endpoint_name(endpoint)]
+        threshold = latency.percentile(self.hedge) \
+            if latency.count >= self.hedge_min_samples else None
+        start = perf_counter()
+        if threshold is None:
+            r = self._retrying_call(endpoint, method, params, data, headers,
+                                    stream, limits)
+        else:
+            r = self._hedged_call(endpoint, params, headers, limits,
+                                  threshold)
+        latency.add(perf_counter() - start)
+        return r
+
+    def _hedged_call(self, endpoint: str, params: dict, headers: dict,
+                     limits: Deadline, threshold: float) -> Response:
+        """
+        Send a GET request, and a second one if the first has not answered
+        after `threshold` seconds. The first response received is returned
+        and the other request is cancelled.
+        """
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=self.pool_maxsize * 2)
+            executor = self._hedge_executor
+
+        attempts = {}
+
+        def _submit():
+            child = limits.child()
+            future = executor.submit(self._retrying_call, endpoint, 'get',
+                                     params, None, headers, False, child)
+            attempts[future] = child
+            return future
+
+        first = _submit()
+        remaining = limits.remaining()
+        wait([first], timeout=threshold if remaining is None
+             else min(threshold, max(remaining, 0)))
+        if not first.done():
+            self.hedged += 1
+            _submit()
+
+        error = None
+        while attempts:
+            done, _ = wait(attempts, return_when=FIRST_COMPLETED)
+            for future in done:
+                attempts.pop(future)
+                try:
+                    r = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                for child in attempts.values():
+                    child.cancel.set()
+                if future is not first:
+                    self.hedge_wins += 1
+                return r
+        raise error
+
+    def _retrying_call(self, endpoint: str, method: str, params: dict = None,
+                       data: dict = None, headers: dict = None,
+                       stream: bool = False,
+                       limits: Deadline = None,
+                       idempotent: bool = None) -> Response:
+        """
+        Send the request to the API. With a rate limiter the request waits
+        for its turn and is retried on 429, and on 503 when it is
+        idempotent.
+        """
+        info = RequestInfo(endpoint, method, params)
+        while True:
+            limits.check()
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            r = self._timed_send(info, data, headers, stream, limits)
+
+            if self.rate_limiter is None:
+                break
+            self.rate_limiter.update(r)
+            delay = self.rate_limiter.retry_delay(r, info.attempt,
+                                                  idempotent)
+            if delay is None:
+                break
+            self._emit('on_retry', info, r, delay)
+            r.close()
+            limits.sleep(delay)
+            info.attempt += 1
+
+        try:
+            r.raise_for_status()
+        except Exception as e:
+            self._emit('on_error', info, e)
+            raise
+
+        return r
+
+    def _timed_send(self, info: RequestInfo, data: dict = None,
+                    headers: dict = None, stream: bool = False,
+                    limits: Deadline = None) -> APIResponse:
+        """
+        Send one request and fill the timings of `info`, see
+        `pyfunkwhale.hooks.RequestInfo`.
+        """
+        self._emit('before_request', info)
+
+        connect_time()
+        start = perf_counter()
+        try:
+            r = self._send(info.endpoint, info.method, info.params, data,
+                           headers, stream, limits)
+        except Exception as e:
+            self._emit('on_error', info, e)
+            raise
+        total = perf_counter() - start
+
+        connect = connect_time()
+        elapsed = r.elapsed.total_seconds()
+        info.timings.update({
+            'connect': connect,
+            'first_byte': max(elapsed - connect, 0),
+            'body': None if stream else max(total - elapsed, 0),
+            'total': total,
+        })
+        if stream:
+            info.bytes = int(r.headers.get('Content-Length', 0))
+        else:
+            info.bytes = len(r.content)
+
+        r.__class__ = APIResponse
+        r.request_info = info
+        r.client = self
+
+        self._emit('after_response', info, r)
+
+        return r
+
+    def _send(self, endpoint: str, method: str, params: dict = None,
+              data: dict = None, headers: dict = None,
+              stream: bool = False, limits: Deadline = None) -> Response:
+        """
+        Send one request with the session of the authentication mode. When
+        the call can expire or be cancelled, the body is read by chunks to
+        check it between them.
+        """
+        endpoint = re.sub(r'^\/', '', endpoint)
+        self._login(limits)
+
+        timeout = None
+        read_by_chunks = False
+        if limits is not None:
+            timeout = limits.request_timeout()
+            read_by_chunks = not stream and limits.bounded
+
+        if self.oauth:
             self._refresh_token()
-            if headers is None:
-                headers = {'Authorization': self.token['token_type'] + ' ' +
-                           self.token['access_token']}
+            headers = dict(headers or {})
+            headers.setdefault(
+                'Authorization',
+                self.token['token_type'] + ' ' + self.token['access_token'])
 
             _call = getattr(self.oauth_client, method)
 
-            endpoint = re.sub(r'^\/', '', endpoint)
-
-            r = _call(self.domain + '/api/v1/' + endpoint, headers=headers,
-                    params=params, data=data)
+            r = self._request(_call, endpoint, headers, params, data,
+                              stream or read_by_chunks, timeout, limits)
 
             if r.status_code == 401:
                 raise InvalidTokenError(self)
-
-            r.raise_for_status()
         else:
             _call = getattr(self.session, method)
-            r = _call(self.domain + '/api/v1/' + endpoint, headers=headers,
-                    params=params, data=data)
+            r = self._request(_call, endpoint, headers, params, data,
+                              stream or read_by_chunks, timeout, limits)
 
-            r.raise_for_status()
+        if read_by_chunks:
+            chunks = []
+            try:
+                for chunk in r.iter_content(chunk_size=65536):
+                    chunks.append(chunk)
+                    limits.check()
+            finally:
+                r.close()
+            r._content = b''.join(chunks)
 
         return r
+
+    def _request(self, _call, endpoint: str, headers: dict, params: dict,
+                 data: dict, stream: bool, timeout, limits: Deadline):
+        """
+        Send the request with the session method `_call`. A timeout caused
+        by the deadline of the call raises `DeadlineExceeded`.
+        """
+        try:
+            return _call(self.domain + '/api/v1/' + endpoint,
+                         headers=headers, params=params, data=data,
+                         stream=stream, timeout=timeout)
+        except requests.Timeout as e:
+            remaining = limits.remaining() if limits is not None else None
+            if remaining is not None and remaining <= 0.05:
+                raise DeadlineExceeded(
+                    "The deadline of the call is over") from e
+            raise
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+from time import monotonic
+from typing import Tuple, Union
+
+import requests
+
+
+class DeadlineExceeded(requests.Timeout):
+    """
+    Raised when a call is not completed before its deadline.
+    """
+
+
+class RequestCancelled(requests.RequestException):
+    """
+    Raised when a call is cancelled with its cancel event.
+    """
+
+
+class Deadline(object):
+    """
+    Time budget and cancellation of one call of the API, shared by its
+    retries.
+
+    Parameters
+    ----------
+    total : float, optional
+        Seconds the whole call may take, retries and waits included, no
+        limit if not set
+    timeout : float or tuple, optional
+        Seconds to wait for the connection and between two bytes of the
+        response, given as one value or as `(connect, read)`
+    cancel : threading.Event, optional
+        Event set to cancel the call, checked between the steps of the call
+    parent : Deadline, optional
+        Deadline whose expiration and cancellation also apply to this one
+    """
+
+    __slots__ = ('expires_at', 'timeout', 'cancel', 'parent')
+
+    # Seconds between two checks of the parent cancellation while waiting
+    poll_interval = 0.05
+
+    def __init__(self, total: float = None,
+                 timeout: Union[float, Tuple[float, float]] = None,
+                 cancel: threading.Event = None, parent: 'Deadline' = None):
+        self.expires_at = monotonic() + total if total is not None else None
+        if parent is not None and parent.expires_at is not None:
+            self.expires_at = parent.expires_at if self.expires_at is None \
+                else min(self.expires_at, parent.expires_at)
+        if timeout is None and parent is not None:
+            timeout = parent.timeout
+        self.timeout = timeout
+        self.cancel = cancel
+        self.parent = parent
+
+    def child(self) -> 'Deadline':
+        """
+        Return a deadline with the same limits and its own cancel event,
+        cancelled too when this one is
+        """
+        return Deadline(cancel=threading.Event(), parent=self)
+
+    @property
+    def bounded(self) -> bool:
+        """
+        Check if the call can expire or be cancelled
+        """
+        return self.expires_at is not None or self.cancel is not None \
+            or (self.parent is not None and self.parent.bounded)
+
+    def remaining(self) -> float:
+        """
+        Return the seconds left before the deadline, None if there is none
+        """
+        if self.expires_at is None:
+            return None
+        return self.expires_at - monotonic()
+
+    def cancelled(self) -> bool:
+        return (self.cancel is not None and self.cancel.is_set()) \
+            or (self.parent is not None and self.parent.cancelled())
+
+    def check(self):
+        """
+        Raise if the call is cancelled or its deadline is over
+
+        Raises
+        ------
+        RequestCancelled
+            If the cancel event is set
+        DeadlineExceeded
+            If the deadline is over
+        """
+        if self.cancelled():
+            raise RequestCancelled("The call was cancelled")
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("The deadline of the call is over")
+
+    def request_timeout(self) -> Union[float, Tuple[float, float]]:
+        """
+        Return the timeout to give to requests for the next request, capped
+        by the time left
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return self.timeout
+        remaining = max(remaining, 0.001)
+        if self.timeout is None:
+            return (remaining, remaining)
+        if isinstance(self.timeout, tuple):
+            connect, read = self.timeout
+        else:
+            connect = read = self.timeout
+        return (min(connect or remaining, remaining),
+                min(read or remaining, remaining))
+
+    def sleep(self, delay: float):
+        """
+        Wait `delay` seconds, unless the call is cancelled or the deadline
+        is over before
+
+        Raises
+        ------
+        RequestCancelled
+            If the call is cancelled while waiting
+        DeadlineExceeded
+            If the deadline is over before the end of the delay
+        """
+        remaining = self.remaining()
+        if remaining is not None and delay > remaining:
+            raise DeadlineExceeded(
+                "The deadline of the call is over before its next retry")
+        end = monotonic() + delay
+        event = self.cancel or threading.Event()
+        while True:
+            left = end - monotonic()
+            if left <= 0:
+                break
+            if self.parent is not None:
+                left = min(left, self.poll_interval)
+            if event.wait(left):
+                break
+            if self.cancelled():
+                break
+        self.check()
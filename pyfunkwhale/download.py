@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Union
+
+from requests.models import Response
+
+from pyfunkwhale.client import Client
+
+# The audio files are already compressed, and a content encoding would make
+# the ranges and the sizes apply to the encoded bytes
+_IDENTITY = {'Accept-Encoding': 'identity'}
+
+
+def _total_size(r) -> int:
+    """
+    Get the full size of a file from the `Content-Range` or `Content-Length`
+    headers of a response, None if unknown.
+    """
+    match = re.match(r'bytes [^/]*/(\d+)', r.headers.get('Content-Range', ''))
+    if match:
+        return int(match.group(1))
+    if r.status_code == 200 and 'Content-Length' in r.headers:
+        return int(r.headers['Content-Length'])
+    return None
+
+
+class _Progress(object):
+    """
+    Thread-safe counter of the downloaded bytes calling the user callback.
+    """
+
+    def __init__(self, callback: Callable[[int, int], None], done: int,
+                 total: int):
+        self.callback = callback
+        self.done = done
+        self.total = total
+        self._lock = threading.Lock()
+
+    def update(self, size: int):
+        with self._lock:
+            self.done += size
+            if self.callback is not None:
+                self.callback(self.done, self.total)
+
+
+def _write_range(client: Client, endpoint: str, params: dict, filename: str,
+                 start: int, end: int, chunk_size: int, progress: _Progress):
+    """
+    Download the bytes `start` to `end` (included) of a file and write them
+    at the same offset in `filename`.
+    """
+    headers = dict(_IDENTITY, Range='bytes={}-{}'.format(start, end))
+    with client.call(endpoint, 'get', params, headers=headers,
+                     stream=True) as r:
+        if r.status_code != 206:
+            raise ValueError("The server does not support range requests")
+        with open(filename, 'r+b') as f:
+            f.seek(start)
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                progress.update(len(chunk))
+
+
+def _download_segments(client: Client, endpoint: str, params: dict,
+                       filename: str, segments: int, chunk_size: int,
+                       progress: Callable[[int, int], None],
+                       on_response: Callable[[Response], None]) -> int:
+    """
+    Download a file as `segments` parallel ranges, return None if the server
+    does not give the size of the file or does not support range requests.
+    """
+    with client.call(endpoint, 'get', params,
+                     headers=dict(_IDENTITY, Range='bytes=0-0'),
+                     stream=True) as r:
+        total = _total_size(r) if r.status_code == 206 else None
+    if not total:
+        return None
+    if on_response is not None:
+        on_response(r)
+
+    # The file is preallocated, so it is only renamed once complete: a file
+    # with the full size would be seen as complete by a resume
+    part = os.fspath(filename) + '.part'
+    with open(part, 'wb') as f:
+        f.truncate(total)
+
+    counter = _Progress(progress, 0, total)
+    size = -(-total // segments)
+    try:
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            futures = [
+                executor.submit(_write_range, client, endpoint, params, part,
+                                start, min(start + size, total) - 1,
+                                chunk_size, counter)
+                for start in range(0, total, size)]
+            for future in futures:
+                future.result()
+    except BaseException:
+        os.remove(part)
+        raise
+    os.replace(part, filename)
+
+    return total
+
+
+def download(client: Client, endpoint: str,
+             destination: Union[str, BinaryIO], params: dict = None,
+             chunk_size: int = 65536, resume: bool = True,
+             segments: int = 1,
+             progress: Callable[[int, int], None] = None,
+             on_response: Callable[[Response], None] = None) -> int:
+    """
+    Stream a file from the API to a filename or a file-like object, without
+    keeping it in memory.
+
+    Return the number of bytes of the file.
+
+    Parameters
+    ----------
+    client : pyfunkwhale.client.Client
+        The client used to call the API
+    endpoint : str
+        The endpoint to download
+    destination : str or file-like object
+        The filename or the binary file-like object where write the file
+    params : dict, optional
+        The uri params of the request
+    chunk_size : int, optional
+        The size of the chunks read from the network and written
+        Default value: 65536
+    resume : bool, optional
+        If `destination` is an existing file, only download its missing
+        bytes with a range request
+    segments : int, optional
+        Download a new file as this number of parallel range requests. Only
+        used when `destination` is a filename.
+        Default value: 1
+    progress : Callable[[int, int], None], optional
+        Called after each chunk with the number of bytes downloaded and the
+        total size of the file (None if unknown)
+    on_response : Callable[[Response], None], optional
+        Called with the response of the file before reading its body, ie.
+        to get its headers
+    """
+    is_filename = isinstance(destination, (str, os.PathLike))
+    offset = 0
+    if is_filename and resume and os.path.exists(destination):
+        offset = os.path.getsize(destination)
+
+    if is_filename and segments > 1 and offset == 0:
+        total = _download_segments(client, endpoint, params, destination,
+                                   segments, chunk_size, progress,
+                                   on_response)
+        if total is not None:
+            return total
+
+    headers = dict(_IDENTITY)
+    if offset:
+        headers['Range'] = 'bytes={}-'.format(offset)
+    try:
+        r = client.call(endpoint, 'get', params, headers=headers, stream=True)
+    except Exception as e:
+        response = getattr(e, 'response', None)
+        if offset and response is not None and response.status_code == 416:
+            # The file is already complete
+            return offset
+        raise
+
+    with r:
+        if on_response is not None:
+            on_response(r)
+        if r.status_code != 206:
+            offset = 0
+        counter = _Progress(progress, offset, _total_size(r))
+
+        f = open(destination, 'ab' if offset else 'wb') \
+            if is_filename else destination
+        try:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                counter.update(len(chunk))
+        finally:
+            if is_filename:
+                f.close()
+
+    return counter.done
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor,
+                                TimeoutError, wait)
+from time import monotonic
+from typing import Dict, Iterator, List
+
+from pyfunkwhale.funkwhale import Funkwhale
+
+FederatedResult = namedtuple('FederatedResult', ['key', 'item', 'instances'])
+FederatedResult.__doc__ = """
+An object found on one or several instances: `item` is the payload of the
+first instance which answered and `instances` the names of all the instances
+having it, filled while the other instances answer.
+"""
+
+
+def result_key(resource: str, item: dict) -> str:
+    """
+    Return the key identifying an object across the instances: its MBID if
+    it has one, otherwise its normalized name and artist
+
+    Parameters
+    ----------
+    resource : str
+        'artists', 'albums' or 'tracks'
+    item : dict
+        The object as returned by the API
+    """
+    if item.get('mbid'):
+        return 'mbid:' + item['mbid']
+    key = [resource, (item.get('name') or item.get('title') or '').lower()]
+    if isinstance(item.get('artist'), dict):
+        key.append((item['artist'].get('name') or '').lower())
+    if isinstance(item.get('album'), dict):
+        key.append((item['album'].get('title') or '').lower())
+    return ':'.join(key)
+
+
+def match_score(item: dict, q: str) -> int:
+    """
+    Score how well the name or title of an object matches a query: 3 if
+    equal, 2 if it starts with it, 1 if it contains it, 0 otherwise
+    """
+    if not q:
+        return 0
+    q = q.lower()
+    text = (item.get('name') or item.get('title') or '').lower()
+    if text == q:
+        return 3
+    if text.startswith(q):
+        return 2
+    if q in text:
+        return 1
+    return 0
+
+
+class FederationPool(object):
+
+    def __init__(self, instances: Dict[str, Funkwhale] = None,
+                 timeout: float = 10, max_workers: int = None):
+        """
+        Query several Funkwhale instances at the same time and merge their
+        results.
+
+        Each instance keeps its own client, so its own authentication and
+        connection pool. An instance which does not answer within `timeout`
+        is left out of the results, its error is kept in `errors`.
+
+        The requests of the pool are given the time left before `timeout`
+        as deadline, so a late request ends with the search. The instances
+        added with `add_instance` also get `timeout` as the default deadline
+        of their client.
+
+        Parameters
+        ----------
+        instances : dict, optional
+            The `pyfunkwhale.funkwhale.Funkwhale` objects by name
+        timeout : float, optional
+            Seconds to wait for each instance
+            Default value: 10
+        max_workers : int, optional
+            Maximum number of instances queried at the same time, all by
+            default
+        """
+        self.instances = dict(instances or {})
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.errors = {}
+
+    def add_instance(self, name: str, *args, **kwargs) -> Funkwhale:
+        """
+        Connect to an instance and add it to the pool, the arguments are the
+        ones of `pyfunkwhale.funkwhale.Funkwhale`. The calls of the instance
+        end after the timeout of the pool unless another `deadline` is given.
+
+        Parameters
+        ----------
+        name : str
+            The name of the instance in the results
+        """
+        kwargs.setdefault('deadline', self.timeout)
+        funkwhale = self.instances[name] = Funkwhale(*args, **kwargs)
+        return funkwhale
+
+    def stream(self, resource: str, q: str = None,
+               **params) -> Iterator[FederatedResult]:
+        """
+        Search a resource on all the instances and yield each distinct
+        object as soon as an instance returns it. The objects returned by
+        several instances are yielded once, with their `instances` completed
+        as the other instances answer.
+
+        The errors and timeouts of the instances are kept in `errors`.
+
+        Parameters
+        ----------
+        resource : str
+            'artists', 'albums' or 'tracks'
+        q : str, optional
+            The search query
+        **params
+            The other parameters of the listing method, ie. `page_size`
+        """
+        if resource not in ('artists', 'albums', 'tracks'):
+            raise ValueError("The resource {} can not be searched".format(
+                resource))
+
+        self.errors = {}
+        results = {}
+        deadline = monotonic() + self.timeout
+
+        def _list(funkwhale):
+            return getattr(funkwhale, resource)(
+                q=q, deadline=max(deadline - monotonic(), 0), **params)
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_workers or max(len(self.instances), 1))
+        pending = {executor.submit(_list, funkwhale): name
+                   for name, funkwhale in self.instances.items()}
+
+        try:
+            while pending:
+                timeout = max(deadline - monotonic(), 0)
+                done, _ = wait(pending, timeout=timeout,
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        page = future.result()
+                    except Exception as e:
+                        self.errors[name] = e
+                        continue
+                    for item in page.get('results', []):
+                        key = result_key(resource, item)
+                        if key in results:
+                            if name not in results[key].instances:
+                                results[key].instances.append(name)
+                            continue
+                        result = results[key] = FederatedResult(
+                            key, item, [name])
+                        yield result
+        finally:
+            for name in pending.values():
+                self.errors[name] = TimeoutError(
+                    "The instance {} did not answer in {}s".format(
+                        name, self.timeout))
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def search(self, resource: str, q: str = None,
+               **params) -> List[FederatedResult]:
+        """
+        Search a resource on all the instances and return the distinct
+        objects ranked by match with the query, then by number of instances
+        having them, then by order of arrival
+
+        Parameters
+        ----------
+        resource : str
+            'artists', 'albums' or 'tracks'
+        q : str, optional
+            The search query
+        **params
+            The other parameters of the listing method, ie. `page_size`
+        """
+        results = list(self.stream(resource, q, **params))
+        order = {r.key: i for i, r in enumerate(results)}
+        return sorted(results, key=lambda r: (
+            -match_score(r.item, q), -len(r.instances), order[r.key]))
+
+    def artists(self, q: str = None, **params) -> List[FederatedResult]:
+        return self.search('artists', q, **params)
+
+    def albums(self, q: str = None, **params) -> List[FederatedResult]:
+        return self.search('albums', q, **params)
+
+    def tracks(self, q: str = None, **params) -> List[FederatedResult]:
+        return self.search('tracks', q, **params)
@@ -1,8 +1,47 @@
 #!/usr/bin/env python
 
+import mmap
+import os
+import random
+import re
+import shutil
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import sleep
+from typing import BinaryIO, Callable, Iterable, Iterator, Union
+from urllib.parse import parse_qs, urlparse
+
+import requests
 from requests.models import Response
 
+from pyfunkwhale.cache import CacheEntry, request_key
 from pyfunkwhale.client import Client
+from pyfunkwhale.download import download
+from pyfunkwhale.ratelimit import RateLimiter
+from pyfunkwhale.utils import compile_fields, project
+
+BulkResult = namedtuple('BulkResult', ['id', 'result', 'error'])
+BulkResult.__doc__ = """
+Result of one object fetched by a bulk method. `error` is the exception
+raised while fetching the object, in which case `result` is None.
+"""
+
+FavoritesReport = namedtuple('FavoritesReport',
+                             ['added', 'deleted', 'unchanged'])
+FavoritesReport.__doc__ = """
+Result of `Funkwhale.sync_favorites_tracks`: the `BulkResult` of each track
+added and deleted, and the number of tracks already in the wanted state.
+"""
+
+Partial = namedtuple('Partial', ['kind', 'id', 'data'])
+Partial.__doc__ = """
+Part of a composite object yielded as soon as it is fetched: `kind` is
+'artist', 'album' or 'tracks', `id` the id of the artist or album and `data`
+the object, or a page of tracks of the album.
+"""
+
+# Errors worth retrying a favorite change for
+_RETRY_STATUS = (429, 500, 502, 503, 504)
 
 
 class Funkwhale(object):
@@ -28,6 +67,232 @@ class Funkwhale(object):
 
         return params
 
+    def _project(self, page: dict, fields: Iterable[str]) -> dict:
+        """
+        Prune the results of a page down to the given fields, see
+        `pyfunkwhale.utils.project`. Return the page unchanged if `fields`
+        is None.
+        """
+        if fields is not None:
+            page['results'] = project(page.get('results', []),
+                                      compile_fields(fields))
+        return page
+
+    def _check_ordering(self, ordering: str, ordering_field: list):
+        """
+        Check that an ordering value is one of the accepted fields.
+
+        Parameters
+        ----------
+        ordering : str
+            The ordering asked by the user
+        ordering_field : list
+            The fields accepted by the endpoint, they can be prefixed with -
+            for DESC ordering
+
+        Raises
+        ------
+        ValueError
+            If `ordering` is not in `ordering_field`
+        """
+        if (
+                ordering is not None
+                and re.sub(r'^-', '', ordering) not in ordering_field
+        ):
+            raise ValueError(
+                "The ordering field '{}' is not in the ordering fields "
+                "accepted. Accepted values: {}".format(
+                    ordering, ordering_field
+                )
+            )
+
+    def _iter_pages(self, fetch: Callable[..., dict], params: dict,
+                    max_items: int = None,
+                    prefetch: bool = False) -> Iterator[dict]:
+        """
+        Iterate over all the results of a paginated endpoint.
+
+        The `next` link of each page is followed until the last page, so only
+        one page is kept in memory at a time.
+
+        Parameters
+        ----------
+        fetch : Callable[..., dict]
+            The listing method to call for each page, ie. `self.artists`
+        params : dict
+            The parameters to give to `fetch` for each page
+        max_items : int, optional
+            Stop after yielding this number of items
+        prefetch : bool, optional
+            Fetch the next page in background while the current one is
+            consumed
+        """
+        if max_items is not None and max_items <= 0:
+            return
+
+        params = self._build_params(params)
+        for k in ('max_items', 'prefetch'):
+            params.pop(k, None)
+        page = params.pop('page', 1)
+        count = 0
+
+        def _fetch(page):
+            return fetch(page=page, **params)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            future = executor.submit(_fetch, page) if executor else None
+            while page is not None:
+                data = future.result() if future else _fetch(page)
+
+                page = None
+                if data.get('next'):
+                    query = parse_qs(urlparse(data['next']).query)
+                    page = int(query.get('page', [0])[0]) or None
+                if executor and page is not None:
+                    future = executor.submit(_fetch, page)
+
+                for item in data.get('results', []):
+                    yield item
+                    count += 1
+                    if max_items is not None and count >= max_items:
+                        return
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_many(self, fetch: Callable[[object], dict], ids: Iterable,
+                    max_workers: int = 8,
+                    ordered: bool = False) -> Iterator[BulkResult]:
+        """
+        Fetch many objects concurrently with a bounded pool of threads.
+
+        Duplicated ids are fetched only once and an error on one id does not
+        stop the others, it is returned in its `BulkResult`.
+
+        Parameters
+        ----------
+        fetch : Callable[[object], dict]
+            The method used to fetch one object, ie. `self.artist`
+        ids : Iterable
+            The ids of the objects to fetch
+        max_workers : int, optional
+            Maximum number of requests in flight
+            Default value: 8
+        ordered : bool, optional
+            Yield the results in the order of `ids` instead of as soon as
+            they are completed
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = {}
+        seen = set()
+
+        def _done():
+            if ordered:
+                futures = [next(iter(pending))]
+                wait(futures)
+            else:
+                futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in futures:
+                _id = pending.pop(future)
+                try:
+                    yield BulkResult(_id, future.result(), None)
+                except Exception as e:
+                    yield BulkResult(_id, None, e)
+
+        try:
+            for _id in ids:
+                if _id in seen:
+                    continue
+                seen.add(_id)
+                pending[executor.submit(fetch, _id)] = _id
+                while len(pending) >= max_workers * 2:
+                    yield from _done()
+            while pending:
+                yield from _done()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _retrying(self, func: Callable[[object], object], retries: int,
+                  backoff: float = 0.5) -> Callable[[object], object]:
+        """
+        Wrap `func` to retry it on connection errors and on the server errors,
+        with an exponential backoff. When the client has a rate limiter, the
+        responses it retries itself are not retried again.
+        """
+        limiter = self.client.rate_limiter
+        retried = limiter.retryable if limiter is not None \
+            else lambda r: False
+        if limiter is None:
+            limiter = RateLimiter(backoff=backoff)
+
+        def _func(_id):
+            attempt = 0
+            while True:
+                try:
+                    return func(_id)
+                except requests.ConnectionError:
+                    if attempt >= retries:
+                        raise
+                    delay = None
+                except requests.HTTPError as e:
+                    if attempt >= retries or e.response is None \
+                            or e.response.status_code not in _RETRY_STATUS \
+                            or retried(e.response):
+                        raise
+                    delay = limiter.retry_delay(e.response, attempt)
+                if delay is None:
+                    delay = random.uniform(0, min(
+                        limiter.max_backoff, limiter.backoff * 2 ** attempt))
+                sleep(delay)
+                attempt += 1
+
+        return _func
+
+    def _run_graph(self, start: Callable, max_workers: int) -> Iterator:
+        """
+        Run a graph of dependent requests with a pool of threads.
+
+        `start` receives a `submit(handler, func, *args, **kwargs)` function
+        and submits the first requests. When a request is completed, its
+        handler is called with the result in the calling thread, it can
+        submit new requests and returns the items to yield.
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = {}
+
+        def submit(handler, func, *args, **kwargs):
+            pending[executor.submit(func, *args, **kwargs)] = handler
+
+        try:
+            start(submit)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    handler = pending.pop(future)
+                    yield from handler(future.result())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_listing(self, submit: Callable, fetch: Callable[..., dict],
+                        params: dict, page_size: int,
+                        on_results: Callable[[list], Iterable]):
+        """
+        Submit the first page of a listing, then all its other pages at the
+        same time once the count is known. `on_results` is called with the
+        results of each page.
+        """
+        def _first(data):
+            results = data.get('results', [])
+            if data.get('next') and results:
+                pages = -(-data.get('count', 0) // len(results))
+                for page in range(2, pages + 1):
+                    submit(lambda data: on_results(data.get('results', [])),
+                           fetch, page=page, page_size=page_size, **params)
+            return on_results(results)
+
+        submit(_first, fetch, page=1, page_size=page_size, **params)
+
     def create_app(self, name: str, redirect_uris: str = None,
                    scopes: str = None) -> dict:
         """
@@ -66,7 +331,9 @@ class Funkwhale(object):
 
     def artists(self, q: str = None, ordering: str = None,
                 playable: bool = None, page: int = None,
-                page_size: int = None) -> dict:
+                page_size: int = None,
+                fields: Iterable[str] = None,
+                deadline: float = None) -> dict:
         """
         List artists
 
@@ -83,6 +350,11 @@ class Funkwhale(object):
             Default value: 1
         page_size : int, optional
             Default value: 25
+        fields : Iterable[str], optional
+            Only keep these fields of each result, the fields of the nested
+            objects are given with a dot, ie. `artist.name`
+        deadline : float, optional
+            Seconds the call may take, see `Client.call`
 
         Raises
         ------
@@ -92,18 +364,48 @@ class Funkwhale(object):
 
         arguments = locals()
 
-        ordering_field = ['creation_date', 'id', 'name']
-        if ordering is not None and ordering not in ordering_field:
-            raise ValueError(
-                "The ordering field '{}' is not in the ordering fields "
-                "accepted. Accepted values: {}".format(
-                    ordering, ordering_field
-                )
-            )
+        self._check_ordering(ordering, ['creation_date', 'id', 'name'])
 
         params = self._build_params(arguments)
+        params.pop('fields', None)
+        params.pop('deadline', None)
+
+        return self._project(
+                self.client.call('/artists/', 'get', params,
+                                 deadline=deadline).json(), fields)
+
+    def iter_artists(self, q: str = None, ordering: str = None,
+                     playable: bool = None, page_size: int = None,
+                     max_items: int = None,
+                     prefetch: bool = False,
+                     fields: Iterable[str] = None) -> Iterator[dict]:
+        """
+        Iterate over all artists, page after page
+
+        Parameters
+        ----------
+        q : str, optional
+            Search query used to filter artists
+        ordering : str, optional
+            Ordering for the results, prefix with - for DESC ordering
+            Available values: creation_date, id, name
+        playable : bool, optional
+            Filter/exclude resources with playable artits
+        page_size : int, optional
+            Default value: 25
+        max_items : int, optional
+            Stop after yielding this number of items
+        prefetch : bool, optional
+            Fetch the next page in background while the current one is
+            consumed
+        fields : Iterable[str], optional
+            Only keep these fields of each result, the fields of the nested
+            objects are given with a dot, ie. `artist.name`
+        """
 
-        return self.client.call('/artists/', 'get', params).json()
+        arguments = locals()
+
+        return self._iter_pages(self.artists, arguments, max_items, prefetch)
 
     def artist(self, _id: int, refresh: bool = False) -> dict:
         """
@@ -123,6 +425,30 @@ class Funkwhale(object):
 
         return self.client.call(f'/artists/{_id}', 'get', params).json()
 
+    def artists_by_ids(self, _ids: Iterable, refresh: bool = False,
+                       max_workers: int = 8,
+                       ordered: bool = False) -> Iterator[BulkResult]:
+        """
+        Retrieve many artists concurrently
+
+        Parameters
+        ----------
+        _ids : Iterable
+            Objects IDs, duplicates are fetched only once
+        refresh : bool, optional
+            Trigger an ActivityPub fetch to refresh local data
+        max_workers : int, optional
+            Maximum number of requests in flight
+            Default value: 8
+        ordered : bool, optional
+            Yield the results in the order of `_ids` instead of as soon as
+            they are completed
+        """
+
+        return self._fetch_many(
+                lambda _id: self.artist(_id, refresh), _ids, max_workers,
+                ordered)
+
     def artist_libraries(self, _id: int, page: int = None,
                          page_size: int = None) -> dict:
         """
@@ -145,9 +471,36 @@ class Funkwhale(object):
         return self.client.call(
                 f'/artists/{_id}/libraries/', 'get', params).json()
 
+    def iter_artist_libraries(self, _id: int, page_size: int = None,
+                              max_items: int = None,
+                              prefetch: bool = False) -> Iterator[dict]:
+        """
+        Iterate over all user libraries containing work from this artist
+
+        Parameters
+        ----------
+        _id : int
+            Object ID
+        page_size : int, optional
+            Default value: 25
+        max_items : int, optional
+            Stop after yielding this number of items
+        prefetch : bool, optional
+            Fetch the next page in background while the current one is
+            consumed
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(
+                lambda **kwargs: self.artist_libraries(_id, **kwargs),
+                arguments, max_items, prefetch)
+
     def albums(self, q: str = None, artist: int = None, ordering: str = None,
                playable: bool = None, page: int = None,
-               page_size: int = None) -> dict:
+               page_size: int = None,
+               fields: Iterable[str] = None,
+               deadline: float = None) -> dict:
         """
         List albums
 
@@ -167,6 +520,11 @@ class Funkwhale(object):
             Default value: 1
         page_size : int, optional
             Default value: 25
+        fields : Iterable[str], optional
+            Only keep these fields of each result, the fields of the nested
+            objects are given with a dot, ie. `artist.name`
+        deadline : float, optional
+            Seconds the call may take, see `Client.call`
 
         Raises
         ------
@@ -176,18 +534,51 @@ class Funkwhale(object):
 
         arguments = locals()
 
-        ordering_field = ['creation_date', 'release_date', 'title']
-        if ordering is not None and ordering not in ordering_field:
-            raise ValueError(
-                "The ordering field '{}' is not in the ordering fields "
-                "accepted. Accepted values: {}".format(
-                    ordering, ordering_field
-                )
-            )
+        self._check_ordering(ordering,
+                             ['creation_date', 'release_date', 'title'])
 
         params = self._build_params(arguments)
+        params.pop('fields', None)
+        params.pop('deadline', None)
+
+        return self._project(
+                self.client.call('/albums/', 'get', params,
+                                 deadline=deadline).json(), fields)
+
+    def iter_albums(self, q: str = None, artist: int = None,
+                    ordering: str = None, playable: bool = None,
+                    page_size: int = None, max_items: int = None,
+                    prefetch: bool = False,
+                    fields: Iterable[str] = None) -> Iterator[dict]:
+        """
+        Iterate over all albums, page after page
+
+        Parameters
+        ----------
+        q : str, optional
+            Search query used to filter albums
+        artist : int, optional
+            Only include albums by the requested artist
+        ordering : str, optional
+            Ordering for the results, prefix with - for DESC ordering
+            Available values: creation_date, release_date, title
+        playable : bool, optional
+            Filter/exclude resources with playable albums
+        page_size : int, optional
+            Default value: 25
+        max_items : int, optional
+            Stop after yielding this number of items
+        prefetch : bool, optional
+            Fetch the next page in background while the current one is
+            consumed
+        fields : Iterable[str], optional
+            Only keep these fields of each result, the fields of the nested
+            objects are given with a dot, ie. `artist.name`
+        """
+
+        arguments = locals()
 
-        return self.client.call('/albums/', 'get', params).json()
+        return self._iter_pages(self.albums, arguments, max_items, prefetch)
 
     def album(self, _id: int, refresh: bool = False) -> dict:
         """
@@ -207,6 +598,30 @@ class Funkwhale(object):
 
         return self.client.call(f'/albums/{_id}', 'get', params).json()
 
+    def albums_by_ids(self, _ids: Iterable, refresh: bool = False,
+                      max_workers: int = 8,
+                      ordered: bool = False) -> Iterator[BulkResult]:
+        """
+        Retrieve many albums concurrently
+
+        Parameters
+        ----------
+        _ids : Iterable
+            Objects IDs, duplicates are fetched only once
+        refresh : bool, optional
+            Trigger an ActivityPub fetch to refresh local data
+        max_workers : int, optional
+            Maximum number of requests in flight
+            Default value: 8
+        ordered : bool, optional
+            Yield the results in the order of `_ids` instead of as soon as
+            they are completed
+        """
+
+        return self._fetch_many(
+                lambda _id: self.album(_id, refresh), _ids, max_workers,
+                ordered)
+
     def album_libraries(self, _id: int, page: int = None,
                         page_size: int = None) -> dict:
         """
@@ -229,9 +644,36 @@ class Funkwhale(object):
         return self.client.call(
                 f'/albums/{_id}/libraries/', 'get', params).json()
 
+    def iter_album_libraries(self, _id: int, page_size: int = None,
+                             max_items: int = None,
+                             prefetch: bool = False) -> Iterator[dict]:
+        """
+        Iterate over all user libraries containing work from this album
+
+        Parameters
+        ----------
+        _id : int
+            Object ID
+        page_size : int, optional
+            Default value: 25
+        max_items : int, optional
+            Stop after yielding this number of items
+        prefetch : bool, optional
+            Fetch the next page in background while the current one is
+            consumed
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(
+                lambda **kwargs: self.album_libraries(_id, **kwargs),
+                arguments, max_items, prefetch)
+
     def tracks(self, q: str = None, artist: int = None, ordering: str = None,
                playable: bool = None, page: int = None,
-               page_size: int = None) -> dict:
+               page_size: int = None, album: int = None,
+               fields: Iterable[str] = None,
+               deadline: float = None) -> dict:
         """
         List tracks
 
@@ -256,6 +698,11 @@ class Funkwhale(object):
             Default value: 1
         page_size : int, optional
             Default value: 25
+        fields : Iterable[str], optional
+            Only keep these fields of each result, the fields of the nested
+            objects are given with a dot, ie. `artist.name`
+        deadline : float, optional
+            Seconds the call may take, see `Client.call`
 
         Raises
         ------
@@ -265,18 +712,53 @@ class Funkwhale(object):
 
         arguments = locals()
 
-        ordering_field = ['creation_date', 'release_date', 'title']
-        if ordering is not None and ordering not in ordering_field:
-            raise ValueError(
-                "The ordering field '{}' is not in the ordering fields "
-                "accepted. Accepted values: {}".format(
-                    ordering, ordering_field
-                )
-            )
+        self._check_ordering(ordering,
+                             ['creation_date', 'release_date', 'title'])
 
         params = self._build_params(arguments)
+        params.pop('fields', None)
+        params.pop('deadline', None)
+
+        return self._project(
+                self.client.call('/tracks/', 'get', params,
+                                 deadline=deadline).json(), fields)
+
+    def iter_tracks(self, q: str = None, artist: int = None,
+                    ordering: str = None, playable: bool = None,
+                    page_size: int = None, max_items: int = None,
+                    prefetch: bool = False, album: int = None,
+                    fields: Iterable[str] = None) -> Iterator[dict]:
+        """
+        Iterate over all tracks, page after page
 
-        return self.client.call('/tracks/', 'get', params).json()
+        Parameters
+        ----------
+        q : str, optional
+            Search query used to filter tracks
+        artist : int, optional
+            Only include tracks by the requested artist
+        ordering : str, optional
+            Ordering for the results, prefix with - for DESC ordering
+            Available values: creation_date, release_date, title
+        playable : bool, optional
+            Filter/exclude resources with playable tracks
+        page_size : int, optional
+            Default value: 25
+        max_items : int, optional
+            Stop after yielding this number of items
+        prefetch : bool, optional
+            Fetch the next page in background while the current one is
+            consumed
+        album : int, optional
+            Only include tracks from the requested album
+        fields : Iterable[str], optional
+            Only keep these fields of each result, the fields of the nested
+            objects are given with a dot, ie. `artist.name`
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(self.tracks, arguments, max_items, prefetch)
 
     def track(self, _id: int, refresh: bool = False) -> dict:
         """
@@ -296,6 +778,30 @@ class Funkwhale(object):
 
         return self.client.call(f'/tracks/{_id}', 'get', params).json()
 
+    def tracks_by_ids(self, _ids: Iterable, refresh: bool = False,
+                      max_workers: int = 8,
+                      ordered: bool = False) -> Iterator[BulkResult]:
+        """
+        Retrieve many tracks concurrently
+
+        Parameters
+        ----------
+        _ids : Iterable
+            Objects IDs, duplicates are fetched only once
+        refresh : bool, optional
+            Trigger an ActivityPub fetch to refresh local data
+        max_workers : int, optional
+            Maximum number of requests in flight
+            Default value: 8
+        ordered : bool, optional
+            Yield the results in the order of `_ids` instead of as soon as
+            they are completed
+        """
+
+        return self._fetch_many(
+                lambda _id: self.track(_id, refresh), _ids, max_workers,
+                ordered)
+
     def track_libraries(self, _id: int, page: int = None,
                         page_size: int = None) -> dict:
         """
@@ -318,6 +824,131 @@ class Funkwhale(object):
         return self.client.call(
                 f'/tracks/{_id}/libraries/', 'get', params).json()
 
+    def iter_track_libraries(self, _id: int, page_size: int = None,
+                             max_items: int = None,
+                             prefetch: bool = False) -> Iterator[dict]:
+        """
+        Iterate over all user libraries containing work from this track
+
+        Parameters
+        ----------
+        _id : int
+            Object ID
+        page_size : int, optional
+            Default value: 25
+        max_items : int, optional
+            Stop after yielding this number of items
+        prefetch : bool, optional
+            Fetch the next page in background while the current one is
+            consumed
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(
+                lambda **kwargs: self.track_libraries(_id, **kwargs),
+                arguments, max_items, prefetch)
+
+    def iter_album_with_tracks(self, _id: int, page_size: int = 100,
+                               max_workers: int = 8) -> Iterator[Partial]:
+        """
+        Fetch an album and all its tracks at the same time, yielding each
+        part as soon as it arrives
+
+        Parameters
+        ----------
+        _id : int
+            Album ID
+        page_size : int, optional
+            Number of tracks by page
+            Default value: 100
+        max_workers : int, optional
+            Maximum number of requests in flight
+            Default value: 8
+        """
+
+        def _start(submit):
+            submit(lambda album: [Partial('album', _id, album)],
+                   self.album, _id)
+            self._submit_listing(
+                submit, self.tracks, {'album': _id}, page_size,
+                lambda tracks: [Partial('tracks', _id, tracks)])
+
+        return self._run_graph(_start, max_workers)
+
+    def album_with_tracks(self, _id: int, page_size: int = 100,
+                          max_workers: int = 8) -> dict:
+        """
+        Retrieve an album with all its tracks in its `tracks` field, ordered
+        by disc and position
+
+        See `iter_album_with_tracks` for the parameters.
+        """
+
+        return _assemble_album(
+            self.iter_album_with_tracks(_id, page_size, max_workers))
+
+    def iter_artist_discography(self, _id: int, page_size: int = 100,
+                                max_workers: int = 8) -> Iterator[Partial]:
+        """
+        Fetch an artist, all its albums and all their tracks, yielding each
+        part as soon as it arrives
+
+        The artist and the albums are requested at the same time, and the
+        tracks of each album as soon as the page listing it is received.
+
+        Parameters
+        ----------
+        _id : int
+            Artist ID
+        page_size : int, optional
+            Number of albums or tracks by page
+            Default value: 100
+        max_workers : int, optional
+            Maximum number of requests in flight
+            Default value: 8
+        """
+
+        def _start(submit):
+            def _albums(albums):
+                for album in albums:
+                    self._submit_listing(
+                        submit, self.tracks, {'album': album['id']},
+                        page_size,
+                        lambda tracks, _id=album['id']: [
+                            Partial('tracks', _id, tracks)])
+                    yield Partial('album', album['id'], album)
+
+            submit(lambda artist: [Partial('artist', _id, artist)],
+                   self.artist, _id)
+            self._submit_listing(submit, self.albums, {'artist': _id},
+                                 page_size, _albums)
+
+        return self._run_graph(_start, max_workers)
+
+    def artist_discography(self, _id: int, page_size: int = 100,
+                           max_workers: int = 8) -> dict:
+        """
+        Retrieve an artist with all its albums in its `albums` field, ordered
+        by release date, each with all its tracks in its `tracks` field
+
+        See `iter_artist_discography` for the parameters.
+        """
+
+        artist = None
+        parts = []
+        for part in self.iter_artist_discography(_id, page_size,
+                                                 max_workers):
+            if part.kind == 'artist':
+                artist = dict(part.data)
+            else:
+                parts.append(part)
+
+        albums = _assemble_albums(parts)
+        artist['albums'] = sorted(
+            albums, key=lambda a: (a.get('release_date') or '', a['id']))
+        return artist
+
     def listen(self, _uuid, to: str = None, upload: str = None) -> Response:
         """
         Download the audio file matching the given track uuid
@@ -328,6 +959,10 @@ class Funkwhale(object):
         In case of a remote upload, this endpoint will fetch the audio file
         from the remote and cache it before sending the response.
 
+        When the client has a blob cache, the file is read from it and only
+        downloaded the first time. The response is then built from the
+        cached file, without the headers of the instance.
+
         Parameters
         ----------
         _uuid : str
@@ -358,8 +993,137 @@ class Funkwhale(object):
                              "fields accepted".format(to))
 
         params = self._build_params(arguments)
+        endpoint = f'/listen/{_uuid}'
+
+        blob_cache = self.client.blob_cache
+        if blob_cache is None:
+            return self.client.call(endpoint, 'get', params)
+
+        key = request_key(endpoint, params)
+        with blob_cache.fetch(key, self._blob_writer(endpoint, params)) as f:
+            content = f.read()
+        headers = {'Content-Length': str(len(content))}
+        content_type = (blob_cache.metadata(key) or {}).get('content_type')
+        if content_type:
+            headers['Content-Type'] = content_type
+        return self.client._cached_response(CacheEntry(
+            self.client.domain + '/api/v1' + endpoint, 200, headers,
+            content, 0))
+
+    def _blob_writer(self, endpoint: str, params: dict,
+                     **kwargs) -> Callable[[str], dict]:
+        """
+        Build the function downloading an audio file in the blob cache,
+        which keeps the content type of the response.
+        """
+        def _write(filename: str) -> dict:
+            metadata = {}
+
+            def _on_response(r):
+                metadata['content_type'] = r.headers.get('Content-Type')
+
+            download(self.client, endpoint, filename, params, resume=False,
+                     on_response=_on_response, **kwargs)
+            return metadata
+
+        return _write
+
+    def download(self, _uuid, destination: Union[str, BinaryIO],
+                 to: str = None, upload: str = None,
+                 chunk_size: int = 65536, resume: bool = True,
+                 segments: int = 1,
+                 progress: Callable[[int, int], None] = None) -> int:
+        """
+        Download the audio file matching the given track uuid to a file
+
+        The file is streamed in chunks instead of being loaded in memory, see
+        `listen` for the meaning of `_uuid`, `to` and `upload`.
+
+        When the client has a blob cache, the file is served from it, and
+        downloaded in it first if it is not cached.
+
+        Return the size of the file in bytes.
+
+        Parameters
+        ----------
+        _uuid : str
+            Track uuid
+        destination : str or file-like object
+            The filename or the binary file-like object where write the audio
+        to : str, optional
+            Transcode the audio file, available values : ogg, mp3
+        upload: str, optional
+            If specified, will return the audio for the given upload uuid.
+        chunk_size : int, optional
+            The size of the chunks read and written
+            Default value: 65536
+        resume : bool, optional
+            If `destination` is a partially downloaded file, only download
+            the missing bytes with a range request
+        segments : int, optional
+            Download the file as this number of parallel range requests
+            Default value: 1
+        progress : Callable[[int, int], None], optional
+            Called after each chunk with the number of bytes downloaded and
+            the total size of the file (None if unknown)
+
+        Raises
+        ------
+        ValueError
+            If `to` are set with wrong values
+        """
+
+        to_fields = ['ogg', 'mp3']
+        if to is not None and to not in to_fields:
+            raise ValueError("The to field {} is not in the to"
+                             "fields accepted".format(to))
+
+        params = self._build_params({'to': to, 'upload': upload})
+        endpoint = f'/listen/{_uuid}'
+
+        blob_cache = self.client.blob_cache
+        if blob_cache is None:
+            return download(self.client, endpoint, destination, params,
+                            chunk_size, resume, segments, progress)
+
+        writer = self._blob_writer(endpoint, params, chunk_size=chunk_size,
+                                   segments=segments, progress=progress)
+        with blob_cache.fetch(request_key(endpoint, params), writer) as f:
+            if isinstance(destination, (str, os.PathLike)):
+                with open(destination, 'wb') as out:
+                    shutil.copyfileobj(f, out, chunk_size)
+            else:
+                shutil.copyfileobj(f, destination, chunk_size)
+            return os.fstat(f.fileno()).st_size
+
+    def open_audio(self, _uuid, to: str = None,
+                   upload: str = None) -> mmap.mmap:
+        """
+        Map the audio file matching the given track uuid in memory, from the
+        blob cache of the client, downloading it first if it is not cached
+
+        See `listen` for the meaning of the parameters.
+
+        Raises
+        ------
+        ValueError
+            If the client has no blob cache or if `to` are set with wrong
+            values
+        """
+        if self.client.blob_cache is None:
+            raise ValueError("The client has no blob cache")
+
+        to_fields = ['ogg', 'mp3']
+        if to is not None and to not in to_fields:
+            raise ValueError("The to field {} is not in the to"
+                             "fields accepted".format(to))
+
+        params = self._build_params({'to': to, 'upload': upload})
+        endpoint = f'/listen/{_uuid}'
 
-        return self.client.call(f'/listen/{_uuid}', 'get', params)
+        return self.client.blob_cache.open(
+            request_key(endpoint, params),
+            self._blob_writer(endpoint, params))
 
     def licenses(self, page: str = None, page_size: str = None) -> dict:
         """
@@ -379,6 +1143,26 @@ class Funkwhale(object):
 
         return self.client.call(f'/licenses/', 'get', params).json()
 
+    def iter_licenses(self, page_size: int = None, max_items: int = None,
+                      prefetch: bool = False) -> Iterator[dict]:
+        """
+        Iterate over all licenses, page after page
+
+        Parameters
+        ----------
+        page_size : int, optional
+            Default value: 25
+        max_items : int, optional
+            Stop after yielding this number of items
+        prefetch : bool, optional
+            Fetch the next page in background while the current one is
+            consumed
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(self.licenses, arguments, max_items, prefetch)
+
     def license(self, _code) -> dict:
         """
         Retrieve a single license
@@ -418,6 +1202,48 @@ class Funkwhale(object):
 
         return self.client.call(f'/favorites/tracks/', 'get', params).json()
 
+    def iter_favorites_tracks(self, q: str = None, user: str = None,
+                              page_size: int = None, max_items: int = None,
+                              prefetch: bool = False) -> Iterator[dict]:
+        """
+        Iterate over all favorites tracks, page after page
+
+        Parameters
+        ----------
+        q : str, optional
+            Search query used to filter favorites tracks
+        user : str, optional
+            Limit results to favorites tracks belonging to the given user
+        page_size : int, optional
+            Default value : 25
+        max_items : int, optional
+            Stop after yielding this number of items
+        prefetch : bool, optional
+            Fetch the next page in background while the current one is
+            consumed
+        """
+
+        arguments = locals()
+
+        return self._iter_pages(self.favorites_tracks, arguments, max_items,
+                                prefetch)
+
+    def all_favorites_tracks(self) -> dict:
+        """
+        List the ids of all the favorites tracks of the user, in a single
+        request
+        """
+
+        return self.client.call(f'/favorites/tracks/all/', 'get').json()
+
+    def favorites_tracks_ids(self) -> set:
+        """
+        Return the set of the ids of the favorites tracks of the user
+        """
+
+        return {int(favorite['track'])
+                for favorite in self.all_favorites_tracks()['results']}
+
     def add_favorite_track(self, track: str) -> dict:
         """
         Add a track to favorite
@@ -452,3 +1278,108 @@ class Funkwhale(object):
 
         return self.client.call(
                 f'/favorites/tracks/remove/', 'post', data=data)
+
+    def add_favorites_tracks(self, tracks: Iterable, max_workers: int = 8,
+                             retries: int = 3) -> Iterator[BulkResult]:
+        """
+        Add many tracks to favorites concurrently
+
+        The requests failing with a connection error, a 429 or a server
+        error are retried, give a `RateLimiter` to the client to pace them.
+
+        Parameters
+        ----------
+        tracks : Iterable
+            The tracks ids to add, duplicates are added only once
+        max_workers : int, optional
+            Maximum number of requests in flight
+            Default value: 8
+        retries : int, optional
+            Number of retries of each track
+            Default value: 3
+        """
+
+        return self._fetch_many(
+                self._retrying(self.add_favorite_track, retries), tracks,
+                max_workers)
+
+    def delete_favorites_tracks(self, tracks: Iterable, max_workers: int = 8,
+                                retries: int = 3) -> Iterator[BulkResult]:
+        """
+        Remove many tracks from favorites concurrently, see
+        `add_favorites_tracks`
+
+        Parameters
+        ----------
+        tracks : Iterable
+            The tracks ids to remove, duplicates are removed only once
+        max_workers : int, optional
+            Maximum number of requests in flight
+            Default value: 8
+        retries : int, optional
+            Number of retries of each track
+            Default value: 3
+        """
+
+        return self._fetch_many(
+                self._retrying(self.delete_favorite_track, retries), tracks,
+                max_workers)
+
+    def sync_favorites_tracks(self, tracks: Iterable, delete: bool = True,
+                              max_workers: int = 8,
+                              retries: int = 3) -> FavoritesReport:
+        """
+        Make the favorites tracks of the user match a set of tracks
+
+        The current favorites are fetched in one request, then only the
+        missing tracks are added and the extra ones removed, concurrently.
+
+        Parameters
+        ----------
+        tracks : Iterable
+            The ids of the wanted favorites tracks
+        delete : bool, optional
+            Remove the favorites which are not in `tracks`
+            Default value: True
+        max_workers : int, optional
+            Maximum number of requests in flight
+            Default value: 8
+        retries : int, optional
+            Number of retries of each track
+            Default value: 3
+        """
+
+        wanted = {int(track) for track in tracks}
+        current = self._retrying(
+                lambda _: self.favorites_tracks_ids(), retries)(None)
+
+        added = list(self.add_favorites_tracks(
+            wanted - current, max_workers, retries))
+        deleted = list(self.delete_favorites_tracks(
+            current - wanted, max_workers, retries)) if delete else []
+
+        return FavoritesReport(added, deleted, len(wanted & current))
+
+
+def _assemble_albums(parts: Iterable[Partial]) -> list:
+    """
+    Build the albums with their `tracks` from the parts yielded by a
+    composite fetcher.
+    """
+    albums = {}
+    tracks = {}
+    for part in parts:
+        if part.kind == 'album':
+            albums[part.id] = dict(part.data)
+        elif part.kind == 'tracks':
+            tracks.setdefault(part.id, []).extend(part.data)
+
+    for _id, album in albums.items():
+        album['tracks'] = sorted(tracks.get(_id, []), key=lambda t: (
+            t.get('disc_number') or 0, t.get('position') or 0, t['id']))
+    return list(albums.values())
+
+
+def _assemble_album(parts: Iterable[Partial]) -> dict:
+    albums = _assemble_albums(parts)
+    return albums[0] if albums else None
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+from collections import defaultdict, deque
+from time import perf_counter
+
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+_local = threading.local()
+
+
+def connect_time() -> float:
+    """
+    Return the time spent opening connections in the current thread since
+    the last call, and reset it.
+    """
+    elapsed = getattr(_local, 'connect', 0.0)
+    _local.connect = 0.0
+    return elapsed
+
+
+class _TimedConnection(object):
+
+    def connect(self):
+        start = perf_counter()
+        try:
+            super().connect()
+        finally:
+            _local.connect = getattr(_local, 'connect', 0.0) \
+                + perf_counter() - start
+
+
+class _TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimingHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter measuring the time spent opening connections (TCP and TLS
+    handshakes), read with `connect_time`.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
+
+class RequestInfo(object):
+    """
+    A call of `pyfunkwhale.client.Client` given to the hooks.
+
+    `timings` contains, in seconds, `connect` (connections opening),
+    `first_byte` (wait for the response headers after the connection),
+    `body` (download of the body, None for streamed responses), `total`
+    and, once `Response.json` is called, `decode`.
+    """
+
+    __slots__ = ('endpoint', 'method', 'params', 'attempt', 'timings',
+                 'bytes', 'context')
+
+    def __init__(self, endpoint: str, method: str, params: dict = None):
+        self.endpoint = endpoint
+        self.method = method
+        self.params = params
+        self.attempt = 0
+        self.timings = {}
+        self.bytes = 0
+        self.context = {}
+
+
+class Hook(object):
+    """
+    Base class of the hooks given to `pyfunkwhale.client.Client`, all the
+    methods do nothing by default.
+    """
+
+    def before_request(self, info: RequestInfo):
+        """
+        Called before each attempt of a request
+        """
+
+    def after_response(self, info: RequestInfo, r: Response):
+        """
+        Called after each response received, `info.timings` is filled
+        """
+
+    def after_decode(self, info: RequestInfo, r: Response):
+        """
+        Called after the JSON body of a response is decoded
+        """
+
+    def on_retry(self, info: RequestInfo, r: Response, delay: float):
+        """
+        Called when a request is retried after `delay` seconds
+        """
+
+    def on_error(self, info: RequestInfo, error: Exception):
+        """
+        Called when a request raises an exception
+        """
+
+    def on_token_refresh(self, duration: float):
+        """
+        Called after the OAuth2 token is refreshed
+        """
+
+
+def endpoint_name(endpoint: str) -> str:
+    """
+    Replace the ids and uuids of an endpoint by `{id}`, to aggregate the
+    metrics of the calls of a same endpoint.
+    """
+    endpoint = '/' + endpoint.strip('/')
+    return re.sub(r'/([0-9a-fA-F-]{32,36}|\d+)(?=/|$)', '/{id}', endpoint)
+
+
+class LatencyHistogram(object):
+
+    def __init__(self, size: int = 1024):
+        """
+        Percentiles of the last latencies observed
+
+        Parameters
+        ----------
+        size : int, optional
+            Number of latencies kept
+            Default value: 1024
+        """
+        self.count = 0
+        self.sum = 0.0
+        self._samples = deque(maxlen=size)
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        self._samples.append(value)
+
+    def percentile(self, p: float) -> float:
+        """
+        Return the `p` percentile (between 0 and 100) of the latencies
+        """
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(round(p / 100 * len(samples))))
+        return samples[index]
+
+    def summary(self) -> dict:
+        return {'count': self.count, 'sum': self.sum,
+                'p50': self.percentile(50), 'p95': self.percentile(95),
+                'p99': self.percentile(99)}
+
+
+class Metrics(Hook):
+
+    def __init__(self, size: int = 1024):
+        """
+        Hook aggregating by endpoint the latencies, bytes transferred,
+        retries and errors, and counting the token refreshes.
+
+        Parameters
+        ----------
+        size : int, optional
+            Number of latencies kept by endpoint for the percentiles
+            Default value: 1024
+        """
+        self._lock = threading.Lock()
+        self.latency = defaultdict(lambda: LatencyHistogram(size))
+        self.decode = defaultdict(lambda: LatencyHistogram(size))
+        self.bytes = defaultdict(int)
+        self.requests = defaultdict(int)
+        self.retries = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.token_refreshes = 0
+
+    def after_response(self, info: RequestInfo, r: Response):
+        name = endpoint_name(info.endpoint)
+        with self._lock:
+            self.latency[name].add(info.timings['total'])
+            self.bytes[name] += info.bytes
+            self.requests[name] += 1
+
+    def after_decode(self, info: RequestInfo, r: Response):
+        with self._lock:
+            self.decode[endpoint_name(info.endpoint)].add(
+                info.timings['decode'])
+
+    def on_retry(self, info: RequestInfo, r: Response, delay: float):
+        with self._lock:
+            self.retries[endpoint_name(info.endpoint)] += 1
+
+    def on_error(self, info: RequestInfo, error: Exception):
+        with self._lock:
+            self.errors[endpoint_name(info.endpoint)] += 1
+
+    def on_token_refresh(self, duration: float):
+        with self._lock:
+            self.token_refreshes += 1
+
+    def summary(self) -> dict:
+        """
+        Return the metrics by endpoint
+        """
+        with self._lock:
+            endpoints = {}
+            for name in set(self.requests) | set(self.errors):
+                endpoints[name] = {
+                    'requests': self.requests[name],
+                    'latency': self.latency[name].summary(),
+                    'decode': self.decode[name].summary(),
+                    'bytes': self.bytes[name],
+                    'retries': self.retries[name],
+                    'errors': self.errors[name],
+                }
+            return {'endpoints': endpoints,
+                    'token_refreshes': self.token_refreshes}
+
+    def prometheus(self) -> str:
+        """
+        Export the metrics in the Prometheus text format
+        """
+        summary = self.summary()
+        lines = []
+        for name, m in sorted(summary['endpoints'].items()):
+            label = '{{endpoint="{}"}}'.format(name)
+            for q in ('p50', 'p95', 'p99'):
+                if m['latency'][q] is not None:
+                    lines.append(
+                        'pyfunkwhale_request_seconds{{endpoint="{}",'
+                        'quantile="0.{}"}} {}'.format(
+                            name, q[1:], m['latency'][q]))
+            lines.append('pyfunkwhale_request_seconds_count{} {}'.format(
+                label, m['latency']['count']))
+            lines.append('pyfunkwhale_request_seconds_sum{} {}'.format(
+                label, m['latency']['sum']))
+            lines.append('pyfunkwhale_response_bytes_total{} {}'.format(
+                label, m['bytes']))
+            lines.append('pyfunkwhale_retries_total{} {}'.format(
+                label, m['retries']))
+            lines.append('pyfunkwhale_errors_total{} {}'.format(
+                label, m['errors']))
+        lines.append('pyfunkwhale_token_refreshes_total {}'.format(
+            summary['token_refreshes']))
+        return '\n'.join(lines) + '\n'
+
+
+class OpenTelemetryHook(Hook):
+
+    def __init__(self, tracer=None):
+        """
+        Hook recording a span by request with OpenTelemetry, needs the
+        `opentelemetry-api` package.
+
+        Parameters
+        ----------
+        tracer : opentelemetry.trace.Tracer, optional
+            The tracer to use, the one of the global tracer provider by
+            default
+        """
+        from opentelemetry import trace
+
+        self.tracer = tracer or trace.get_tracer('pyfunkwhale')
+
+    def before_request(self, info: RequestInfo):
+        info.context['span'] = self.tracer.start_span(
+            'funkwhale {} {}'.format(info.method.upper(),
+                                     endpoint_name(info.endpoint)),
+            attributes={'http.method': info.method.upper(),
+                        'pyfunkwhale.attempt': info.attempt})
+
+    def after_response(self, info: RequestInfo, r: Response):
+        span = info.context.pop('span', None)
+        if span is None:
+            return
+        span.set_attribute('http.status_code', r.status_code)
+        for name, value in info.timings.items():
+            if value is not None:
+                span.set_attribute('pyfunkwhale.' + name, value)
+        span.end()
+
+    def on_error(self, info: RequestInfo, error: Exception):
+        span = info.context.pop('span', None)
+        if span is None:
+            return
+        span.record_exception(error)
+        span.end()
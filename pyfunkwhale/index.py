@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import re
+import sqlite3
+import threading
+from time import time
+
+from pyfunkwhale.funkwhale import Funkwhale
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artists (
+    id INTEGER PRIMARY KEY, name TEXT, data TEXT);
+CREATE TABLE IF NOT EXISTS albums (
+    id INTEGER PRIMARY KEY, title TEXT, artist_id INTEGER, data TEXT);
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY, title TEXT, artist_id INTEGER, album_id INTEGER,
+    data TEXT);
+CREATE INDEX IF NOT EXISTS albums_artist_id ON albums (artist_id);
+CREATE INDEX IF NOT EXISTS tracks_artist_id ON tracks (artist_id);
+CREATE INDEX IF NOT EXISTS tracks_album_id ON tracks (album_id);
+CREATE TABLE IF NOT EXISTS updates (
+    resource TEXT PRIMARY KEY, updated_at REAL);
+CREATE VIRTUAL TABLE IF NOT EXISTS artists_fts USING fts5 (
+    name, tokenize = 'unicode61 remove_diacritics 2');
+CREATE VIRTUAL TABLE IF NOT EXISTS albums_fts USING fts5 (
+    title, artist, tokenize = 'unicode61 remove_diacritics 2');
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5 (
+    title, artist, album, tokenize = 'unicode61 remove_diacritics 2');
+"""
+
+
+def _fts_query(q: str) -> str:
+    """
+    Turn a user query in a FTS5 query matching all its words as prefixes
+    """
+    words = re.findall(r'\w+', q)
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def _name(obj, key: str) -> str:
+    return obj.get(key) if isinstance(obj, dict) else None
+
+
+def _id(obj):
+    return obj.get('id') if isinstance(obj, dict) else obj
+
+
+class CatalogIndex(object):
+
+    resources = ('artists', 'albums', 'tracks')
+
+    def __init__(self, funkwhale: Funkwhale, filename: str = ':memory:',
+                 max_age: float = 86400):
+        """
+        Local copy of the artists, albums and tracks of an instance in a
+        SQLite database with full-text search.
+
+        The searches are answered from the index while it is fresh, and from
+        the API when the resource has never been ingested or its last ingest
+        is older than `max_age`.
+
+        Parameters
+        ----------
+        funkwhale : pyfunkwhale.funkwhale.Funkwhale
+            The instance to index
+        filename : str, optional
+            The SQLite database filename
+            Default value: :memory:
+        max_age : float, optional
+            Number of seconds after which the index is considered stale
+            Default value: 86400
+        """
+        self.funkwhale = funkwhale
+        self.max_age = max_age
+
+        self._lock = threading.RLock()
+        self._ingest_lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _insert(self, resource: str, item: dict):
+        data = json.dumps(item)
+        if resource == 'artists':
+            self._db.execute(
+                'INSERT OR REPLACE INTO artists VALUES (?, ?, ?)',
+                (item['id'], item.get('name'), data))
+            self._db.execute(
+                'INSERT OR REPLACE INTO artists_fts (rowid, name) '
+                'VALUES (?, ?)', (item['id'], item.get('name')))
+        elif resource == 'albums':
+            artist = item.get('artist')
+            self._db.execute(
+                'INSERT OR REPLACE INTO albums VALUES (?, ?, ?, ?)',
+                (item['id'], item.get('title'), _id(artist), data))
+            self._db.execute(
+                'INSERT OR REPLACE INTO albums_fts (rowid, title, artist) '
+                'VALUES (?, ?, ?)',
+                (item['id'], item.get('title'), _name(artist, 'name')))
+        else:
+            artist = item.get('artist')
+            album = item.get('album')
+            self._db.execute(
+                'INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?)',
+                (item['id'], item.get('title'), _id(artist), _id(album),
+                 data))
+            self._db.execute(
+                'INSERT OR REPLACE INTO tracks_fts '
+                '(rowid, title, artist, album) VALUES (?, ?, ?, ?)',
+                (item['id'], item.get('title'), _name(artist, 'name'),
+                 _name(album, 'title')))
+
+    def ingest(self, resources: tuple = None, page_size: int = 100,
+               batch_size: int = 1000) -> dict:
+        """
+        Fetch all the items of the resources and store them in the index
+
+        The pages are fetched without locking the index, so the searches
+        are answered meanwhile. The items are written by batches, and the
+        items deleted on the instance are removed once the listing is
+        complete. Return the number of items ingested by resource.
+
+        Parameters
+        ----------
+        resources : tuple, optional
+            The resources to ingest, all of them by default
+        page_size : int, optional
+            Number of items by page of the listings
+            Default value: 100
+        batch_size : int, optional
+            Number of items written by transaction
+            Default value: 1000
+        """
+        counts = {}
+        for resource in resources or self.resources:
+            if resource not in self.resources:
+                raise ValueError(
+                    "The resource '{}' is not in the resources accepted. "
+                    "Accepted values: {}".format(resource, self.resources))
+
+            with self._ingest_lock:
+                counts[resource] = self._ingest(resource, page_size,
+                                                batch_size)
+
+        return counts
+
+    def _write(self, resource: str, items: list):
+        with self._lock, self._db:
+            for item in items:
+                self._insert(resource, item)
+            self._db.executemany(
+                'INSERT OR IGNORE INTO seen VALUES (?)',
+                [(item['id'],) for item in items])
+
+    def _ingest(self, resource: str, page_size: int, batch_size: int) -> int:
+        listing = getattr(self.funkwhale, 'iter_' + resource)
+        with self._lock, self._db:
+            self._db.execute('CREATE TEMP TABLE IF NOT EXISTS seen '
+                             '(id INTEGER PRIMARY KEY)')
+            self._db.execute('DELETE FROM seen')
+
+        count = 0
+        try:
+            batch = []
+            for item in listing(page_size=page_size, prefetch=True):
+                batch.append(item)
+                count += 1
+                if len(batch) >= batch_size:
+                    self._write(resource, batch)
+                    batch = []
+            if batch:
+                self._write(resource, batch)
+
+            with self._lock, self._db:
+                for table in (resource, resource + '_fts'):
+                    self._db.execute(
+                        'DELETE FROM {0} WHERE {1} NOT IN '
+                        '(SELECT id FROM seen)'.format(
+                            table,
+                            'rowid' if table.endswith('_fts') else 'id'))
+                self._db.execute(
+                    'INSERT OR REPLACE INTO updates VALUES (?, ?)',
+                    (resource, time()))
+        finally:
+            with self._lock, self._db:
+                self._db.execute('DELETE FROM seen')
+
+        return count
+
+    def is_stale(self, resource: str) -> bool:
+        """
+        Check if a resource has never been ingested or is older than
+        `max_age`
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT updated_at FROM updates WHERE resource = ?',
+                (resource,)).fetchone()
+        return row is None or time() - row[0] > self.max_age
+
+    def _search(self, table: str, q: str, filters: dict,
+                limit: int) -> list:
+        match = _fts_query(q) if q else None
+        sql = 'SELECT {0}.data FROM {0}'.format(table)
+        where = []
+        args = []
+        if match:
+            sql += ' JOIN {0}_fts ON {0}_fts.rowid = {0}.id'.format(table)
+            where.append('{}_fts MATCH ?'.format(table))
+            args.append(match)
+        for column, value in filters.items():
+            if value is not None:
+                where.append('{}.{} = ?'.format(table, column))
+                args.append(value)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY {}'.format(
+            '{}_fts.rank'.format(table) if match else table + '.id')
+        sql += ' LIMIT ?'
+        args.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def artists(self, q: str = None, limit: int = 25) -> list:
+        """
+        Search artists
+
+        Parameters
+        ----------
+        q : str, optional
+            Search query used to filter artists
+        limit : int, optional
+            Maximum number of results
+            Default value: 25
+        """
+        if self.is_stale('artists'):
+            return self.funkwhale.artists(q=q, page_size=limit)['results']
+        return self._search('artists', q, {}, limit)
+
+    def albums(self, q: str = None, artist: int = None,
+               limit: int = 25) -> list:
+        """
+        Search albums
+
+        Parameters
+        ----------
+        q : str, optional
+            Search query used to filter albums
+        artist : int, optional
+            Only include albums by the requested artist
+        limit : int, optional
+            Maximum number of results
+            Default value: 25
+        """
+        if self.is_stale('albums'):
+            return self.funkwhale.albums(q=q, artist=artist,
+                                         page_size=limit)['results']
+        return self._search('albums', q, {'artist_id': artist}, limit)
+
+    def tracks(self, q: str = None, artist: int = None, album: int = None,
+               limit: int = 25) -> list:
+        """
+        Search tracks
+
+        Parameters
+        ----------
+        q : str, optional
+            Search query used to filter tracks
+        artist : int, optional
+            Only include tracks by the requested artist
+        album : int, optional
+            Only include tracks from the requested album
+        limit : int, optional
+            Maximum number of results
+            Default value: 25
+        """
+        if self.is_stale('tracks'):
+            return self.funkwhale.tracks(q=q, artist=artist, album=album,
+                                         page_size=limit)['results']
+        return self._search('tracks', q, {'artist_id': artist,
+                                          'album_id': album}, limit)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+from typing import Callable
+
+from pyfunkwhale.funkwhale import Funkwhale
+from pyfunkwhale.utils import read_file, write_file
+
+
+def file_checksum(filename: str, chunk_size: int = 1048576) -> str:
+    """
+    Compute the sha256 checksum of a file
+
+    Parameters
+    ----------
+    filename : str
+        The file to hash
+    chunk_size : int, optional
+        The size of the chunks read
+    """
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class Throttle(object):
+
+    def __init__(self, rate: float):
+        """
+        Token bucket shared between threads to limit a rate of bytes
+
+        Parameters
+        ----------
+        rate : float
+            Maximum number of bytes by second
+        """
+        self.rate = rate
+        self._allowance = rate
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size: int):
+        """
+        Wait until `size` bytes can be consumed
+        """
+        with self._lock:
+            now = monotonic()
+            self._allowance = min(
+                self.rate, self._allowance + (now - self._last) * self.rate)
+            self._last = now
+            self._allowance -= size
+            wait = -self._allowance / self.rate
+        if wait > 0:
+            sleep(wait)
+
+
+class Mirror(object):
+
+    def __init__(self, funkwhale: Funkwhale, directory: str,
+                 state_filename: str = None, workers: int = 4,
+                 bandwidth: float = None, verify: str = 'size',
+                 page_size: int = 100, to: str = None,
+                 filename: Callable[[dict, dict], str] = None, **filters):
+        """
+        Mirror the audio files of the tracks of an instance in a directory.
+
+        The tracks are listed by creation date and downloaded by a pool of
+        workers. The progress is saved in a state file, so a new run starts
+        from the first page not fully mirrored and skips the tracks already
+        downloaded.
+
+        Parameters
+        ----------
+        funkwhale : pyfunkwhale.funkwhale.Funkwhale
+            The instance to mirror
+        directory : str
+            The directory where save the audio files
+        state_filename : str, optional
+            The file where the progress is saved
+            Default value: `directory`/.mirror-state.json
+        workers : int, optional
+            Number of concurrent downloads
+            Default value: 4
+        bandwidth : float, optional
+            Maximum bytes by second downloaded by all the workers
+        verify : str, optional
+            How the existing files are checked before being skipped
+            Available values: size, checksum
+        page_size : int, optional
+            Number of tracks by page of the listing
+            Default value: 100
+        to : str, optional
+            Transcode the audio files, see `Funkwhale.listen`
+        filename : Callable[[dict, dict], str], optional
+            Build the filename of a track, relative to `directory`, from the
+            track and its upload
+        **filters
+            Parameters given to `Funkwhale.tracks`, ie. `artist=1`
+
+        Raises
+        ------
+        ValueError
+            If `verify` is set with wrong values
+        """
+        if verify not in ('size', 'checksum'):
+            raise ValueError("The verify field {} is not in the verify "
+                             "fields accepted".format(verify))
+
+        self.funkwhale = funkwhale
+        self.directory = directory
+        self.state_filename = state_filename or os.path.join(
+            directory, '.mirror-state.json')
+        self.workers = workers
+        self.throttle = Throttle(bandwidth) if bandwidth else None
+        self.verify = verify
+        self.page_size = page_size
+        self.to = to
+        self.filename = filename or self._default_filename
+        self.filters = filters
+
+        self.stats = {'downloaded': 0, 'skipped': 0, 'failed': 0,
+                      'bytes': 0}
+        self._lock = threading.Lock()
+        self._load_state()
+
+    def _default_filename(self, track: dict, upload: dict) -> str:
+        extension = self.to or upload.get('extension') or 'audio'
+        return '{}.{}'.format(track['uuid'], extension)
+
+    def _load_state(self):
+        try:
+            self.state = json.loads(read_file(self.state_filename))
+        except FileNotFoundError:
+            self.state = {'page': 1, 'tracks': {}, 'errors': {}}
+
+    def _save_state(self):
+        with self._lock:
+            write_file(self.state_filename, self.state, atomic=True)
+
+    def _is_mirrored(self, track: dict, path: str, size: int) -> bool:
+        """
+        Check if a track is already downloaded at `path`. Files unknown from
+        the state are kept if they have the size of the upload.
+        """
+        if not os.path.exists(path):
+            return False
+        actual = os.path.getsize(path)
+        known = self.state['tracks'].get(track['uuid'])
+        if known is None:
+            return self.to is None and bool(size) and actual == size
+        if actual != known['size']:
+            return False
+        if self.verify == 'checksum':
+            return file_checksum(path) == known.get('sha256')
+        return True
+
+    def _record(self, track: dict, upload: dict, path: str, size: int):
+        record = {'path': os.path.relpath(path, self.directory),
+                  'size': size, 'upload': upload.get('uuid')}
+        if self.verify == 'checksum':
+            record['sha256'] = file_checksum(path)
+
+        with self._lock:
+            self.state['tracks'][track['uuid']] = record
+            self.state['errors'].pop(track['uuid'], None)
+
+    def _mirror_track(self, track: dict) -> bool:
+        uploads = track.get('uploads') or [{}]
+        upload = uploads[0]
+        path = os.path.join(self.directory, self.filename(track, upload))
+
+        if self._is_mirrored(track, path, upload.get('size')):
+            if track['uuid'] not in self.state['tracks']:
+                self._record(track, upload, path, os.path.getsize(path))
+            with self._lock:
+                self.stats['skipped'] += 1
+            return True
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        done = [0]
+
+        def _progress(downloaded, total):
+            if self.throttle is not None:
+                self.throttle.consume(max(downloaded - done[0], 0))
+            done[0] = downloaded
+
+        part = path + '.part'
+        try:
+            size = self.funkwhale.download(
+                track['uuid'], part, to=self.to, upload=upload.get('uuid'),
+                progress=_progress)
+            os.replace(part, path)
+        except Exception as e:
+            with self._lock:
+                self.stats['failed'] += 1
+                self.state['errors'][track['uuid']] = str(e)
+            return False
+
+        self._record(track, upload, path, size)
+        with self._lock:
+            self.stats['downloaded'] += 1
+            self.stats['bytes'] += size
+        return True
+
+    def run(self) -> dict:
+        """
+        Mirror all the tracks and return the statistics of the run
+
+        The tracks of the next page are listed while the current ones are
+        downloaded. The state file is saved each time all the tracks of a
+        page are mirrored. The saved page does not move past a page with a
+        failed track, so the next run retries it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        page = self.state['page']
+        failed = False
+        pages = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while page is not None:
+                data = self.funkwhale.tracks(
+                    ordering='creation_date', page=page,
+                    page_size=self.page_size, **self.filters)
+                futures = [executor.submit(self._mirror_track, track)
+                           for track in data.get('results', [])]
+                page = page + 1 if data.get('next') else None
+                pages.append((page, futures))
+
+                while pages and (page is None or len(pages) > 1):
+                    next_page, futures = pages.popleft()
+                    if not all([future.result() for future in futures]):
+                        failed = True
+                    if next_page is not None and not failed:
+                        self.state['page'] = next_page
+                    self._save_state()
+
+        return self.stats
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compact typed objects for the results of the API.
+
+They use `__slots__` and keep only the useful fields of the payloads, so a
+large listing takes a fraction of the memory of the decoded dicts. The
+repeated short strings (mimetypes, extensions, license codes) are interned.
+"""
+
+import sys
+from typing import Iterable, List, Union
+
+from pyfunkwhale.utils import json_loads
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Model(object):
+
+    __slots__ = ()
+
+    # Fields holding another model, by field name
+    _nested = {}
+    # Fields holding a tuple of another model, by field name
+    _nested_lists = {}
+    # Fields with few distinct values
+    _interned = ()
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Model':
+        """
+        Build an object from a decoded payload of the API. Missing fields
+        are set to None.
+
+        Parameters
+        ----------
+        data : dict
+            The payload
+        """
+        if data is None:
+            return None
+        obj = cls.__new__(cls)
+        for field in cls.__slots__:
+            value = data.get(field)
+            if value is not None:
+                if field in cls._nested and isinstance(value, dict):
+                    value = cls._nested[field].from_dict(value)
+                elif field in cls._nested_lists:
+                    value = tuple(cls._nested_lists[field].from_dict(v)
+                                  for v in value)
+                elif field in cls._interned:
+                    value = _intern(value)
+            setattr(obj, field, value)
+        return obj
+
+    @classmethod
+    def from_json(cls, data: Union[bytes, str]) -> 'Model':
+        """
+        Build an object from a JSON document
+
+        Parameters
+        ----------
+        data : bytes or str
+            The JSON payload of a single object
+        """
+        return cls.from_dict(json_loads(data))
+
+    @classmethod
+    def from_page(cls, data: Union[bytes, str, dict]) -> List['Model']:
+        """
+        Build the objects of a page of a listing
+
+        Parameters
+        ----------
+        data : bytes, str or dict
+            The JSON payload of the page, or the page already decoded
+        """
+        if not isinstance(data, dict):
+            data = json_loads(data)
+        return [cls.from_dict(item) for item in data.get('results', [])]
+
+    @classmethod
+    def from_iter(cls, items: Iterable[dict]) -> Iterable['Model']:
+        """
+        Build the objects of an iterator of payloads, ie. the result of
+        `Funkwhale.iter_tracks`
+        """
+        for item in items:
+            yield cls.from_dict(item)
+
+    def to_dict(self) -> dict:
+        data = {}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if isinstance(value, Model):
+                value = value.to_dict()
+            elif isinstance(value, tuple):
+                value = [v.to_dict() for v in value]
+            data[field] = value
+        return data
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(f, getattr(self, f)) for f in self.__slots__
+            if not isinstance(getattr(self, f), (Model, tuple))))
+
+
+class License(Model):
+
+    __slots__ = ('code', 'url', 'redistribute', 'derivative', 'attribution',
+                 'copyleft', 'commercial')
+    _interned = ('code',)
+
+
+class Artist(Model):
+
+    __slots__ = ('id', 'mbid', 'name', 'creation_date', 'is_local')
+
+
+class Album(Model):
+
+    __slots__ = ('id', 'mbid', 'title', 'artist', 'release_date',
+                 'creation_date', 'is_local', 'is_playable')
+    _nested = {'artist': Artist}
+
+
+class Upload(Model):
+
+    __slots__ = ('uuid', 'listen_url', 'size', 'duration', 'bitrate',
+                 'mimetype', 'extension')
+    _interned = ('mimetype', 'extension')
+
+
+class Track(Model):
+
+    __slots__ = ('id', 'uuid', 'mbid', 'title', 'artist', 'album',
+                 'position', 'disc_number', 'license', 'creation_date',
+                 'listen_url', 'is_local', 'uploads')
+    _nested = {'artist': Artist, 'album': Album}
+    _nested_lists = {'uploads': Upload}
+    _interned = ('license',)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+from pyfunkwhale.download import download
+from pyfunkwhale.funkwhale import Funkwhale
+
+
+class PrefetchCancelled(Exception):
+    """
+    Raised in a download when its track left the queue.
+    """
+
+
+class _Buffer(object):
+    """
+    Audio file being downloaded in a temporary file, which can be read while
+    it is written.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.discarded = False
+        self.readers = 0
+        self.future = None
+        self._cond = threading.Condition()
+
+    def write(self, chunk: bytes):
+        with self._cond:
+            if self.cancelled:
+                raise PrefetchCancelled()
+            self.file.seek(self.size)
+            self.file.write(chunk)
+            self.size += len(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: Exception = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+            self._close_unused()
+
+    def discard(self):
+        """
+        Forget the buffer, its download is cancelled unless it is read.
+        """
+        with self._cond:
+            self.discarded = True
+            if not self.readers:
+                self._cancel()
+            self._close_unused()
+
+    def _cancel(self):
+        self.cancelled = True
+        if self.future is not None and self.future.cancel():
+            self.done = True
+        self._cond.notify_all()
+
+    def acquire(self):
+        with self._cond:
+            self.readers += 1
+
+    def release(self):
+        with self._cond:
+            self.readers -= 1
+            if self.discarded and not self.readers:
+                self._cancel()
+            self._close_unused()
+
+    def _close_unused(self):
+        if self.discarded and self.done and not self.readers:
+            self.file.close()
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        """
+        Read up to `size` bytes at `offset`, waiting for them to be
+        downloaded. Return empty bytes at the end of the file.
+        """
+        with self._cond:
+            while self.size <= offset and not self.done:
+                self._cond.wait()
+            if self.error is not None:
+                raise self.error
+            if self.size <= offset:
+                return b''
+            self.file.seek(offset)
+            return self.file.read(min(size, self.size - offset))
+
+
+class AudioStream(io.RawIOBase):
+    """
+    Read-only file-like object over an audio file being prefetched. The
+    reads block until the requested bytes are downloaded, so the playback
+    can start with the first chunk.
+    """
+
+    def __init__(self, uuid: str, buffer: _Buffer):
+        self.uuid = uuid
+        self._buffer = buffer
+        self._position = 0
+        buffer.acquire()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._buffer.read_at(self._position, len(b))
+        b[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    @property
+    def downloaded(self) -> int:
+        """
+        Number of bytes of the file already downloaded
+        """
+        return self._buffer.size
+
+    def close(self):
+        if not self.closed:
+            self._buffer.release()
+        super().close()
+
+
+class QueuePrefetcher(object):
+
+    def __init__(self, funkwhale: Funkwhale, ahead: int = 2,
+                 workers: int = 2, to: str = None, chunk_size: int = 65536):
+        """
+        Download the next tracks of a playback queue before they are played.
+
+        The files are buffered in temporary files, so the memory used is a
+        chunk by download, and at most `ahead` tracks are buffered besides
+        the ones being read. Changing the queue cancels the downloads of the
+        tracks which left it. All the downloads, the ones of the tracks
+        opened outside of the queue included, share the `workers`.
+
+        Parameters
+        ----------
+        funkwhale : pyfunkwhale.funkwhale.Funkwhale
+            The instance serving the tracks
+        ahead : int, optional
+            Number of tracks of the queue downloaded in advance
+            Default value: 2
+        workers : int, optional
+            Number of downloads running at the same time
+            Default value: 2
+        to : str, optional
+            Transcode the audio files, see `Funkwhale.listen`
+        chunk_size : int, optional
+            The size of the chunks read and buffered
+            Default value: 65536
+        """
+        self.funkwhale = funkwhale
+        self.ahead = ahead
+        self.to = to
+        self.chunk_size = chunk_size
+
+        self.queue = []
+        self._buffers = {}
+        self._on_demand = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _download(self, uuid: str, buffer: _Buffer):
+        try:
+            params = self.funkwhale._build_params({'to': self.to})
+            download(self.funkwhale.client, f'/listen/{uuid}', buffer,
+                     params, self.chunk_size, resume=False)
+        except Exception as e:
+            buffer.finish(e)
+        else:
+            buffer.finish()
+
+    def set_queue(self, uuids: Iterable[str]):
+        """
+        Replace the queue, the first track being the next played. The
+        downloads of the tracks no more in the first `ahead` of the queue
+        are cancelled, unless the track is being read.
+
+        Parameters
+        ----------
+        uuids : Iterable[str]
+            The uuids of the tracks of the queue
+        """
+        with self._lock:
+            self.queue = list(uuids)
+            wanted = self.queue[:self.ahead]
+            for uuid in list(self._buffers):
+                if uuid not in wanted:
+                    self._buffers.pop(uuid).discard()
+            for uuid in wanted:
+                if uuid not in self._buffers:
+                    buffer = self._buffers[uuid] = _Buffer()
+                    buffer.future = self._executor.submit(
+                        self._download, uuid, buffer)
+
+    def open(self, uuid: str) -> AudioStream:
+        """
+        Return a stream of an audio file, from its prefetched buffer if
+        there is one, otherwise its download is given to the workers. The
+        download of the previous track opened outside of the queue is then
+        cancelled, unless it is being read.
+
+        Parameters
+        ----------
+        uuid : str
+            The track uuid
+        """
+        with self._lock:
+            buffer = self._buffers.get(uuid)
+            if buffer is None or \
+                    (buffer.done and buffer.error is not None):
+                previous = self._on_demand
+                if previous is not None and previous != uuid \
+                        and previous in self._buffers \
+                        and previous not in self.queue[:self.ahead]:
+                    self._buffers.pop(previous).discard()
+                self._on_demand = uuid
+                buffer = self._buffers[uuid] = _Buffer()
+                buffer.future = self._executor.submit(
+                    self._download, uuid, buffer)
+            return AudioStream(uuid, buffer)
+
+    def next(self) -> AudioStream:
+        """
+        Remove the first track of the queue and return its stream, the
+        prefetch moves to the following tracks
+
+        Raises
+        ------
+        IndexError
+            If the queue is empty
+        """
+        with self._lock:
+            uuid = self.queue[0]
+            queue = self.queue[1:]
+        stream = self.open(uuid)
+        self.set_queue(queue)
+        return stream
+
+    def close(self):
+        """
+        Cancel all the downloads
+        """
+        self.set_queue([])
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
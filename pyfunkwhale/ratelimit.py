@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep, time
+
+from requests.models import Response
+
+
+class RateLimiter(object):
+
+    retry_status = (429, 503)
+    # A 503 may be sent once the request is processed, so it is retried only
+    # when sending the request twice is harmless
+    idempotent_status = (503,)
+    idempotent_methods = ('get', 'head', 'delete')
+
+    def __init__(self, rate: float = None, burst: int = None,
+                 max_retries: int = 5, backoff: float = 0.5,
+                 max_backoff: float = 60):
+        """
+        Client-side token bucket pacing the requests sent by
+        `pyfunkwhale.client.Client`, shared by all the threads using the
+        client.
+
+        The bucket is adjusted with the `X-RateLimit-*` headers of the
+        responses and can be seeded with `Funkwhale.rate_limit()`. The
+        responses 429, and 503 to the GET, HEAD and DELETE requests, are
+        retried after the `Retry-After` delay, or with an exponential backoff
+        with jitter.
+
+        Parameters
+        ----------
+        rate : float, optional
+            Requests by second allowed, unlimited until the server tells it
+        burst : int, optional
+            Maximum number of requests sent at once
+            Default value: `rate` rounded up
+        max_retries : int, optional
+            Number of retries of a request answered with 429 or 503
+            Default value: 5
+        backoff : float, optional
+            Base delay in seconds of the exponential backoff
+            Default value: 0.5
+        max_backoff : float, optional
+            Maximum delay in seconds between two retries
+            Default value: 60
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._last = monotonic()
+        self._blocked_until = 0
+        self._set_rate(rate, burst)
+        self.tokens = self.capacity
+
+    def _set_rate(self, rate: float, burst: int = None):
+        self.rate = rate
+        if rate is None:
+            self.capacity = float('inf')
+        else:
+            self.capacity = burst or max(1, -(-rate // 1))
+
+    def _refill(self):
+        now = monotonic()
+        if self.rate is not None:
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self._last) * self.rate)
+        else:
+            self.tokens = self.capacity
+        self._last = now
+
+    @property
+    def remaining(self) -> float:
+        """
+        Number of requests which can be sent right now
+        """
+        with self._lock:
+            self._refill()
+            if monotonic() < self._blocked_until:
+                return 0
+            return self.tokens
+
+    def acquire(self):
+        """
+        Wait until a request can be sent
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                now = monotonic()
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+    def _block(self, seconds: float):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until,
+                                      monotonic() + seconds)
+
+    def seed(self, rate_limit: dict):
+        """
+        Configure the bucket with the response of `Funkwhale.rate_limit()`,
+        the most restrictive scope is used.
+
+        Parameters
+        ----------
+        rate_limit : dict
+            The response of the rate-limit endpoint
+        """
+        if not rate_limit.get('enabled', True):
+            return
+        scopes = [s for s in rate_limit.get('scopes', [])
+                  if s.get('limit') and s.get('duration')]
+        if not scopes:
+            return
+        scope = min(scopes, key=lambda s: s['limit'] / s['duration'])
+        with self._lock:
+            self._set_rate(scope['limit'] / scope['duration'])
+            self._refill()
+            if scope.get('remaining') is not None:
+                self.tokens = min(self.capacity, scope['remaining'])
+        if scope.get('remaining') == 0 and scope.get('reset_seconds'):
+            self._block(scope['reset_seconds'])
+
+    def update(self, r: Response):
+        """
+        Adjust the bucket with the `X-RateLimit-*` headers of a response
+
+        Parameters
+        ----------
+        r : requests.models.Response
+            A response of the API
+        """
+        headers = r.headers
+        try:
+            limit = int(headers['X-RateLimit-Limit'])
+            duration = int(headers['X-RateLimit-Duration'])
+        except (KeyError, ValueError):
+            limit = duration = None
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        with self._lock:
+            if limit and duration:
+                self._set_rate(limit / duration)
+            self._refill()
+            if remaining is not None and remaining.isdigit():
+                self.tokens = min(self.tokens, int(remaining))
+
+        reset = headers.get('X-RateLimit-ResetSeconds')
+        if remaining == '0' and reset and reset.isdigit():
+            self._block(int(reset))
+
+    def retryable(self, r: Response, idempotent: bool = None) -> bool:
+        """
+        Check if the status of a response is retried
+
+        Parameters
+        ----------
+        r : requests.models.Response
+            The response of the request
+        idempotent : bool, optional
+            Whether the request can be sent twice, by default according to
+            its method
+        """
+        if r.status_code not in self.retry_status:
+            return False
+        if r.status_code not in self.idempotent_status:
+            return True
+        if idempotent is None:
+            method = r.request.method if r.request is not None else ''
+            idempotent = method.lower() in self.idempotent_methods
+        return idempotent
+
+    def retry_delay(self, r: Response, attempt: int,
+                    idempotent: bool = None) -> float:
+        """
+        Return the delay before retrying a request, None if it must not be
+        retried
+
+        Parameters
+        ----------
+        r : requests.models.Response
+            The response of the request
+        attempt : int
+            Number of retries already done
+        idempotent : bool, optional
+            Whether the request can be sent twice, see `retryable`
+        """
+        if not self.retryable(r, idempotent) or attempt >= self.max_retries:
+            return None
+
+        retry_after = r.headers.get('Retry-After')
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() \
+                        - time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                delay = max(delay, 0)
+                self._block(delay)
+                return delay
+
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt))
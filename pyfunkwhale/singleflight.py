@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+from typing import Any, Callable
+
+from pyfunkwhale.deadline import Deadline, DeadlineExceeded
+
+
+class _Flight(object):
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Merge the concurrent calls of a same key into one: the first caller runs
+    the function, the others wait for it and get the same result, or the
+    same exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: str, func: Callable[[], Any],
+           deadline: Deadline = None) -> Any:
+        """
+        Run `func` unless a call with the same `key` is in flight, in which
+        case wait for its result
+
+        Parameters
+        ----------
+        key : str
+            Identify the calls which can be merged
+        func : Callable[[], Any]
+            The function to call
+        deadline : pyfunkwhale.deadline.Deadline, optional
+            Limit the wait for the call in flight
+
+        Raises
+        ------
+        Exception
+            The exception raised by `func`
+        pyfunkwhale.deadline.DeadlineExceeded
+            If the call in flight does not end before `deadline`
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+                self.calls += 1
+            else:
+                leader = False
+                self.shared += 1
+
+        if not leader:
+            remaining = deadline.remaining() if deadline is not None \
+                else None
+            if not flight.done.wait(None if remaining is None
+                                    else max(remaining, 0)):
+                raise DeadlineExceeded(
+                    "The deadline of the call is over while waiting for "
+                    "the same call in flight")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result
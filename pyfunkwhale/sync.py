@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+from datetime import datetime
+from typing import Iterator
+
+from pyfunkwhale.funkwhale import Funkwhale
+from pyfunkwhale.utils import read_file, write_file
+
+
+def _parse_date(date: str) -> datetime:
+    return datetime.fromisoformat(date.replace('Z', '+00:00'))
+
+
+class IncrementalSync(object):
+
+    resources = ('artists', 'albums', 'tracks')
+
+    def __init__(self, funkwhale: Funkwhale, checkpoint_filename: str,
+                 page_size: int = 100):
+        """
+        Fetch only the artists, albums and tracks created since the last
+        sync.
+
+        A high-water mark (the most recent creation date seen and the ids
+        created at this date) is saved by resource in a checkpoint file. The
+        listings are read newest first and stop at the first item older than
+        the mark.
+
+        Parameters
+        ----------
+        funkwhale : pyfunkwhale.funkwhale.Funkwhale
+            The instance to sync
+        checkpoint_filename : str
+            The file where the high-water marks are saved
+        page_size : int, optional
+            Number of items by page of the listings
+            Default value: 100
+        """
+        self.funkwhale = funkwhale
+        self.checkpoint_filename = checkpoint_filename
+        self.page_size = page_size
+
+        try:
+            self.checkpoint = json.loads(read_file(checkpoint_filename))
+        except FileNotFoundError:
+            self.checkpoint = {}
+
+    def _check_resource(self, resource: str):
+        if resource not in self.resources:
+            raise ValueError(
+                "The resource '{}' is not in the resources accepted. "
+                "Accepted values: {}".format(resource, self.resources))
+
+    def reset(self, resource: str = None):
+        """
+        Forget the high-water mark of a resource, or of all of them
+
+        Parameters
+        ----------
+        resource : str, optional
+            Available values: artists, albums, tracks
+        """
+        if resource is None:
+            self.checkpoint = {}
+        else:
+            self._check_resource(resource)
+            self.checkpoint.pop(resource, None)
+        write_file(self.checkpoint_filename, self.checkpoint, atomic=True)
+
+    def changes(self, resource: str, **filters) -> Iterator[dict]:
+        """
+        Yield the items of a resource created since the last sync, newest
+        first.
+
+        The checkpoint is saved only once all the changes have been
+        consumed, so an interrupted sync is started again on the next call.
+
+        Parameters
+        ----------
+        resource : str
+            Available values: artists, albums, tracks
+        **filters
+            Parameters given to the listing method, ie. `playable=True`
+
+        Raises
+        ------
+        ValueError
+            If `resource` is set with wrong values
+        """
+        self._check_resource(resource)
+
+        mark = self.checkpoint.get(resource)
+        mark_date = _parse_date(mark['creation_date']) if mark else None
+        mark_ids = set(mark['ids']) if mark else set()
+
+        new_mark = None
+        listing = getattr(self.funkwhale, 'iter_' + resource)
+        for item in listing(ordering='-creation_date',
+                            page_size=self.page_size, prefetch=True,
+                            **filters):
+            date = _parse_date(item['creation_date'])
+            if mark_date is not None and date < mark_date:
+                break
+
+            if new_mark is None:
+                new_mark = {'creation_date': item['creation_date'],
+                            'ids': []}
+            if date == _parse_date(new_mark['creation_date']):
+                new_mark['ids'].append(item['id'])
+
+            if date == mark_date and item['id'] in mark_ids:
+                continue
+            yield item
+
+        if new_mark is not None:
+            if mark and new_mark['creation_date'] == mark['creation_date']:
+                new_mark['ids'] = sorted(mark_ids | set(new_mark['ids']))
+            self.checkpoint[resource] = new_mark
+            write_file(self.checkpoint_filename, self.checkpoint,
+                       atomic=True)
+
+    def sync(self, **filters) -> dict:
+        """
+        Fetch the changes of all the resources
+
+        Return a dict with the list of new items by resource.
+
+        Parameters
+        ----------
+        **filters
+            Parameters given to all the listing methods
+        """
+        return {resource: list(self.changes(resource, **filters))
+                for resource in self.resources}
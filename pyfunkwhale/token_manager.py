@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import threading
+from time import time
+
+from pyfunkwhale.utils import file_lock, read_file, write_file
+
+logger = logging.getLogger(__name__)
+
+
+class TokenManager(object):
+
+    def __init__(self, client, margin: float = 60, background: bool = True):
+        """
+        Keep the OAuth2 token of a `pyfunkwhale.client.Client` valid.
+
+        The token is refreshed `margin` seconds before its expiration, in a
+        background thread, so the requests keep using the current token
+        meanwhile. A request only waits for a refresh when the token is
+        really expired. Only one refresh runs at a time: the threads share a
+        lock and the processes using the same token file a file lock. A
+        process finding a fresher token in the file uses it instead of
+        refreshing again. The token file is written atomically.
+
+        A failed background refresh is logged and kept in `error`, then
+        raised by the next refresh once the token is expired.
+
+        Parameters
+        ----------
+        client : pyfunkwhale.client.Client
+            The client whose token is managed
+        margin : float, optional
+            Seconds before the expiration when the token is refreshed
+            Default value: 60
+        background : bool, optional
+            Refresh the token in a background thread, before any request
+            needs it
+        """
+        self.client = client
+        self.margin = margin
+        self.background = background
+
+        self.error = None
+        self._lock = threading.RLock()
+        # Held only briefly, never while the token is refreshed, so a
+        # request starting a refresh does not wait for the running one
+        self._state_lock = threading.Lock()
+        self._timer = None
+        self._refreshing = threading.Event()
+
+    @property
+    def lock_filename(self) -> str:
+        return self.client.token_filename + '.lock'
+
+    def needs_refresh(self) -> bool:
+        """
+        Check if the token expires in less than `margin` seconds
+        """
+        return time() + self.margin > self.client.token['expires_at']
+
+    def expired(self) -> bool:
+        """
+        Check if the token is expired
+        """
+        return time() >= self.client.token['expires_at']
+
+    def ensure(self):
+        """
+        Make sure the token can be used for a request. Wait for a refresh
+        only if the token is expired, otherwise start it in background when
+        the token is about to expire.
+        """
+        if self.expired():
+            self.refresh()
+        elif self.needs_refresh():
+            if self.background:
+                self.refresh_async()
+            else:
+                self.refresh()
+
+    def refresh_async(self):
+        """
+        Start a refresh in a background thread, unless one is running
+        """
+        with self._state_lock:
+            if self._refreshing.is_set():
+                return
+            self._refreshing.set()
+        thread = threading.Thread(target=self._background_refresh,
+                                  daemon=True)
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("The background refresh of the OAuth2 token "
+                           "failed: %s", e, exc_info=True)
+            self.error = e
+        finally:
+            self._refreshing.clear()
+
+    def refresh(self, force: bool = False):
+        """
+        Refresh the token if it still needs it once the locks are acquired
+
+        Parameters
+        ----------
+        force : bool, optional
+            Refresh even if the token is not about to expire
+
+        Raises
+        ------
+        Exception
+            The error of the failed background refresh, once the token is
+            expired. It is raised once, the next call refreshes again.
+        """
+        with self._lock:
+            if not force and self.error is not None and self.expired():
+                error, self.error = self.error, None
+                raise error
+            if not force and not self.needs_refresh():
+                return
+            with file_lock(self.lock_filename):
+                if not force:
+                    self._load_fresher_token()
+                if force or self.needs_refresh():
+                    self.client.token = self.client._fetch_refreshed_token()
+                    self.save()
+            self.error = None
+            self.schedule()
+
+    def _load_fresher_token(self):
+        """
+        Use the token of the file if another process refreshed it.
+        """
+        try:
+            token = json.loads(read_file(self.client.token_filename))
+        except (FileNotFoundError, ValueError):
+            return
+        if token.get('expires_at', 0) > self.client.token['expires_at']:
+            self.client.token = token
+
+    def save(self):
+        """
+        Write the token in the token file atomically
+        """
+        write_file(self.client.token_filename, self.client.token,
+                   atomic=True)
+
+    def set_token(self, token: dict):
+        """
+        Replace the token, save it and schedule its refresh
+
+        Parameters
+        ----------
+        token : dict
+            The new OAuth2 token
+        """
+        with self._lock, file_lock(self.lock_filename):
+            self.client.token = token
+            self.save()
+        self.schedule()
+
+    def schedule(self):
+        """
+        Plan the background refresh of the current token
+        """
+        if not self.background:
+            return
+        with self._state_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            delay = self.client.token['expires_at'] - self.margin - time()
+            self._timer = threading.Timer(max(delay, 0), self.refresh_async)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def stop(self):
+        """
+        Cancel the planned background refresh
+        """
+        with self._state_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
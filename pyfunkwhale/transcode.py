@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+from collections import namedtuple
+from typing import Iterable, Union
+
+from pyfunkwhale.funkwhale import Funkwhale
+from pyfunkwhale.singleflight import SingleFlight
+
+# Audio format of the mimetypes served by Funkwhale
+MIMETYPE_FORMATS = {
+    'audio/mpeg': 'mp3',
+    'audio/mp3': 'mp3',
+    'audio/ogg': 'ogg',
+    'audio/opus': 'opus',
+    'audio/flac': 'flac',
+    'audio/x-flac': 'flac',
+    'audio/aac': 'aac',
+    'audio/x-m4a': 'aac',
+    'audio/mp4': 'aac',
+}
+
+# Formats which `Funkwhale.listen` can transcode to
+TRANSCODE_FORMATS = ('ogg', 'mp3')
+
+Plan = namedtuple('Plan', ['track', 'upload', 'format', 'to', 'cached'])
+Plan.__doc__ = """
+How to get the audio of a track: the upload to download, the format of the
+result, `to` if the upload must be transcoded and `cached` the local file of
+the transcoded audio if it was already fetched.
+"""
+
+
+def upload_format(upload: dict) -> str:
+    """
+    Return the audio format of an upload, from its mimetype or extension
+
+    Parameters
+    ----------
+    upload : dict
+        An upload of a track, as returned by `Funkwhale.track`
+    """
+    mimetype = (upload.get('mimetype') or '').split(';')[0].strip()
+    if mimetype in MIMETYPE_FORMATS:
+        return MIMETYPE_FORMATS[mimetype]
+    return (upload.get('extension') or '').lower() or None
+
+
+class TranscodePlanner(object):
+
+    def __init__(self, funkwhale: Funkwhale, formats: Iterable[str],
+                 cache_directory: str = None):
+        """
+        Choose how to fetch the audio of a track for a client supporting
+        some formats, asking the instance to transcode only when no upload
+        is playable.
+
+        The transcoded files are kept in `cache_directory` by upload uuid and
+        format, so a same transcoding is never requested twice, even by
+        concurrent threads.
+
+        Parameters
+        ----------
+        funkwhale : pyfunkwhale.funkwhale.Funkwhale
+            The instance serving the tracks
+        formats : Iterable[str]
+            The formats supported by the client, by order of preference,
+            ie. `['flac', 'ogg', 'mp3']`. The preference chooses between
+            uploads of the same cost and the format of a transcoding.
+        cache_directory : str, optional
+            The directory of the transcoded files, no cache if not set
+        """
+        self.funkwhale = funkwhale
+        self.formats = [f.lower() for f in formats]
+        self.cache_directory = cache_directory
+        self._singleflight = SingleFlight()
+
+        if cache_directory is not None:
+            os.makedirs(cache_directory, exist_ok=True)
+
+    def _cache_path(self, upload: dict, to: str) -> str:
+        if self.cache_directory is None:
+            return None
+        return os.path.join(self.cache_directory,
+                            '{}.{}'.format(upload['uuid'], to))
+
+    def plan(self, track: Union[int, dict]) -> Plan:
+        """
+        Choose the upload and the transcoding of a track
+
+        The smallest upload in a supported format is used, the preferred
+        format between uploads of the same size and bitrate. Otherwise the
+        smallest upload is transcoded in the preferred format which the
+        instance can transcode to.
+
+        Parameters
+        ----------
+        track : int or dict
+            The track id, or the track as returned by `Funkwhale.track`
+
+        Raises
+        ------
+        ValueError
+            If the track has no upload or if none of the client formats can
+            be transcoded to
+        """
+        if not isinstance(track, dict):
+            track = self.funkwhale.track(track)
+
+        uploads = track.get('uploads') or []
+        if not uploads:
+            raise ValueError("The track {} has no upload".format(
+                track.get('id')))
+
+        def cost(upload):
+            return (upload.get('size') or float('inf'),
+                    upload.get('bitrate') or float('inf'))
+
+        playable = [u for u in uploads if upload_format(u) in self.formats]
+        if playable:
+            upload = min(playable, key=lambda u: (
+                cost(u), self.formats.index(upload_format(u))))
+            return Plan(track, upload, upload_format(upload), None, None)
+
+        targets = [f for f in self.formats if f in TRANSCODE_FORMATS]
+        if not targets:
+            raise ValueError(
+                "No upload of the track {} is playable and the formats {} "
+                "can not be transcoded to".format(track.get('id'),
+                                                  self.formats))
+        upload = min(uploads, key=cost)
+        to = targets[0]
+        cached = self._cache_path(upload, to)
+        if cached is None or not os.path.exists(cached):
+            cached = None
+        return Plan(track, upload, to, to, cached)
+
+    def _transcode(self, plan: Plan) -> str:
+        """
+        Download the transcoded audio of a plan in the cache, return its
+        path.
+        """
+        path = self._cache_path(plan.upload, plan.to)
+        if os.path.exists(path):
+            return path
+        part = path + '.part'
+        self.funkwhale.download(plan.track['uuid'], part, to=plan.to,
+                                upload=plan.upload['uuid'], resume=False)
+        os.replace(part, path)
+        return path
+
+    def fetch(self, track: Union[int, dict], destination: str) -> Plan:
+        """
+        Download the audio of a track following its plan
+
+        Return the plan used.
+
+        Parameters
+        ----------
+        track : int or dict
+            The track id, or the track as returned by `Funkwhale.track`
+        destination : str
+            The filename where write the audio
+        """
+        plan = self.plan(track)
+
+        if plan.to is None:
+            self.funkwhale.download(plan.track['uuid'], destination,
+                                    upload=plan.upload['uuid'],
+                                    resume=False)
+            return plan
+
+        if self.cache_directory is None:
+            self.funkwhale.download(plan.track['uuid'], destination,
+                                    to=plan.to, upload=plan.upload['uuid'],
+                                    resume=False)
+            return plan
+
+        path = self._singleflight.do(
+            '{}.{}'.format(plan.upload['uuid'], plan.to),
+            lambda: self._transcode(plan))
+        shutil.copyfile(path, destination)
+        return plan._replace(cached=path)
@@ -2,6 +2,20 @@
 # -*- coding: utf-8 -*-
 
 import json
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterable
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def read_file(filename: str) -> str:
@@ -19,7 +33,7 @@ def read_file(filename: str) -> str:
     return data
 
 
-def write_file(filename: str, datas: str) -> str:
+def write_file(filename: str, datas: str, atomic: bool = False) -> str:
     """
     Simple wrapper for write data in file
 
@@ -29,8 +43,102 @@ def write_file(filename: str, datas: str) -> str:
         The filename where write the datas
     datas : str
         The datas to write in the filename
+    atomic : bool, optional
+        Write the datas in a temporary file then rename it, so the file is
+        never seen partially written
     """
-    with open(filename, 'w') as file:
-        file.write(json.dumps(datas))
+    if not atomic:
+        with open(filename, 'w') as file:
+            file.write(json.dumps(datas))
+
+        return datas
+
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)),
+        prefix='.' + os.path.basename(filename))
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(json.dumps(datas))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
     return datas
+
+
+def json_loads(data: bytes):
+    """
+    Decode a JSON document with orjson when it is installed, with the json
+    module otherwise
+
+    Parameters
+    ----------
+    data : bytes
+        The JSON document
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def compile_fields(fields: Iterable[str]) -> dict:
+    """
+    Build the tree of a projection from a list of dotted fields, ie.
+    `['id', 'artist.name']` gives `{'id': {}, 'artist': {'name': {}}}`
+
+    Parameters
+    ----------
+    fields : Iterable[str]
+        The fields to keep, a field of a nested object is prefixed by the
+        name of the object and a dot
+    """
+    tree = {}
+    for field in fields:
+        node = tree
+        for part in field.split('.'):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def project(data, tree: dict):
+    """
+    Keep only the fields of a tree built by `compile_fields` in a decoded
+    object, or in each object of a list. A field whose node is empty is
+    kept whole.
+
+    Parameters
+    ----------
+    data : dict or list
+        The decoded object
+    tree : dict
+        The fields to keep
+    """
+    if isinstance(data, list):
+        return [project(item, tree) for item in data]
+    if not tree or not isinstance(data, dict):
+        return data
+    return {k: project(data[k], sub) for k, sub in tree.items() if k in data}
+
+
+@contextmanager
+def file_lock(filename: str):
+    """
+    Hold an exclusive lock on a file, shared between processes. Does
+    nothing on the platforms without `fcntl`.
+
+    Parameters
+    ----------
+    filename : str
+        The lock file, created if it does not exist
+    """
+    with open(filename, 'a') as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
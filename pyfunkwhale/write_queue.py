@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import threading
+from time import time
+
+import requests
+
+from pyfunkwhale.funkwhale import Funkwhale
+
+
+class WriteQueue(object):
+
+    def __init__(self, funkwhale: Funkwhale, filename: str,
+                 batch_size: int = 50, flush_interval: float = 1,
+                 max_workers: int = 4, retries: int = 3,
+                 max_backoff: float = 300, background: bool = True):
+        """
+        Durable journal of the changes of the favorites tracks, sent to the
+        instance in background.
+
+        The changes are written in a SQLite database and acknowledged
+        without waiting for the instance, so they survive a restart or an
+        instance down. The changes of a same track are coalesced: adding
+        then removing a track cancels out, adding it twice sends one
+        request. The journal is sent by batches whose requests run
+        concurrently, the failed ones are retried with an exponential
+        backoff. A change refused by the instance (an error 4xx other than
+        429) is dropped and kept in `failures`.
+
+        Parameters
+        ----------
+        funkwhale : pyfunkwhale.funkwhale.Funkwhale
+            The instance receiving the changes
+        filename : str
+            The SQLite database of the journal
+        batch_size : int, optional
+            Maximum number of changes sent by flush
+            Default value: 50
+        flush_interval : float, optional
+            Seconds between two flushes of the background thread
+            Default value: 1
+        max_workers : int, optional
+            Maximum number of requests in flight
+            Default value: 4
+        retries : int, optional
+            Number of immediate retries of each request, see
+            `Funkwhale.add_favorites_tracks`
+            Default value: 3
+        max_backoff : float, optional
+            Maximum seconds before a failed change is sent again
+            Default value: 300
+        background : bool, optional
+            Flush the journal in a background thread, otherwise only when
+            `flush` is called
+        """
+        self.funkwhale = funkwhale
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_workers = max_workers
+        self.retries = retries
+        self.max_backoff = max_backoff
+
+        self.sent = 0
+        self.failures = []
+
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._db = sqlite3.connect(filename, timeout=30,
+                                   check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS favorites_tracks ('
+                'track INTEGER PRIMARY KEY, action TEXT, version INTEGER, '
+                'queued_at REAL, attempts INTEGER, next_at REAL, '
+                'error TEXT)')
+
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _queue(self, track: int, action: str):
+        with self._lock, self._db:
+            row = self._db.execute(
+                'SELECT action FROM favorites_tracks WHERE track = ?',
+                (track,)).fetchone()
+            if row is not None and row[0] == action:
+                pass
+            elif row is not None and track in self._in_flight:
+                # The queued change may already be applied, the new one
+                # is sent after it
+                self._db.execute(
+                    'UPDATE favorites_tracks SET action = ?, '
+                    'version = version + 1, attempts = 0, next_at = 0 '
+                    'WHERE track = ?', (action, track))
+            elif row is not None:
+                self._db.execute(
+                    'DELETE FROM favorites_tracks WHERE track = ?', (track,))
+            else:
+                self._db.execute(
+                    'INSERT INTO favorites_tracks '
+                    'VALUES (?, ?, 0, ?, 0, 0, NULL)',
+                    (track, action, time()))
+        self._wakeup.set()
+
+    def add_favorite_track(self, track: int):
+        """
+        Queue the addition of a track to favorites
+
+        Parameters
+        ----------
+        track : int
+            The track id to add to favorites
+        """
+        self._queue(int(track), 'add')
+
+    def delete_favorite_track(self, track: int):
+        """
+        Queue the removal of a track from favorites
+
+        Parameters
+        ----------
+        track : int
+            The track id to remove from favorites
+        """
+        self._queue(int(track), 'delete')
+
+    def pending(self) -> int:
+        """
+        Number of changes not yet sent
+        """
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM favorites_tracks').fetchone()[0]
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Send a batch of changes, return the number of changes sent
+
+        Parameters
+        ----------
+        force : bool, optional
+            Also send the changes waiting for their backoff delay
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows = self._db.execute(
+                    'SELECT track, action, version, attempts '
+                    'FROM favorites_tracks WHERE next_at <= ? '
+                    'ORDER BY queued_at LIMIT ?',
+                    (float('inf') if force else time(),
+                     self.batch_size)).fetchall()
+                queued = {track: (action, version, attempts)
+                          for track, action, version, attempts in rows}
+                self._in_flight.update(queued)
+            if not rows:
+                return 0
+
+            results = []
+            try:
+                for action, send in (
+                        ('add', self.funkwhale.add_favorites_tracks),
+                        ('delete', self.funkwhale.delete_favorites_tracks)):
+                    tracks = [t for t, (a, _, _) in queued.items()
+                              if a == action]
+                    if tracks:
+                        results.extend(send(tracks, self.max_workers,
+                                            self.retries))
+            except BaseException:
+                with self._lock:
+                    self._in_flight.difference_update(queued)
+                raise
+
+            sent = 0
+            with self._lock, self._db:
+                for result in results:
+                    action, version, attempts = queued[result.id]
+                    if result.error is None or _refused(result.error):
+                        self._db.execute(
+                            'DELETE FROM favorites_tracks '
+                            'WHERE track = ? AND version = ?',
+                            (result.id, version))
+                        if result.error is None:
+                            sent += 1
+                        else:
+                            self.failures.append(
+                                (result.id, action, result.error))
+                    else:
+                        delay = min(self.max_backoff,
+                                    self.flush_interval * 2 ** attempts)
+                        self._db.execute(
+                            'UPDATE favorites_tracks SET attempts = ?, '
+                            'next_at = ?, error = ? '
+                            'WHERE track = ? AND version = ?',
+                            (attempts + 1, time() + delay,
+                             str(result.error), result.id, version))
+                self._in_flight.difference_update(queued)
+            self.sent += sent
+            return sent
+
+    def join(self):
+        """
+        Send all the queued changes, retrying the failed ones without
+        waiting for their backoff, until the journal is empty or a flush
+        sends nothing
+        """
+        while self.pending() and self.flush(force=True):
+            pass
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                while self.flush():
+                    pass
+            except Exception:
+                # The journal is kept, the next flush retries
+                pass
+
+    def close(self, flush: bool = True):
+        """
+        Stop the background thread and close the journal
+
+        Parameters
+        ----------
+        flush : bool, optional
+            Try to send the queued changes before closing
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        if flush:
+            try:
+                self.join()
+            except requests.RequestException:
+                pass
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _refused(error: Exception) -> bool:
+    """
+    Check if an error means the instance will never accept the change
+    """
+    response = getattr(error, 'response', None)
+    return response is not None and 400 <= response.status_code < 500 \
+        and response.status_code != 429
@@ -9,6 +9,7 @@ setup(
     url="https://git.neodarz.net/neodarz/pyfunkwhale.git",
     license="GPLv3",
     packages=["pyfunkwhale"],
+    python_requires=">=3.9",
     classifiers=[
         'Development Status :: 1 - Planning',
         'Intended Audience :: Developers',
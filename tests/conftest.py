@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+import threading
+from time import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'benchmarks'))
+
+from mock_server import Catalog, MockServer  # noqa: E402
+
+from pyfunkwhale.funkwhale import Funkwhale  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def catalog():
+    return Catalog(artists=6, albums_by_artist=2, tracks_by_album=3,
+                   audio_size=200000)
+
+
+@pytest.fixture
+def make_server(catalog):
+    """
+    Start mock servers of the catalog, stopped at the end of the test
+    """
+    servers = []
+
+    def _make(**kwargs):
+        server = MockServer(catalog, **kwargs)
+        # Poll often so the server stops quickly
+        threading.Thread(target=server.serve_forever, args=(0.01,),
+                         daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield _make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def server(make_server):
+    return make_server()
+
+
+@pytest.fixture
+def make_funkwhale(server):
+    """
+    Build clients of a mock server, the one of `server` by default, logged
+    in with the plain HTTP mode
+    """
+    def _make(instance=None, **kwargs):
+        instance = instance or server
+        return Funkwhale('pyfunkwhale', 'urn:ietf:wg:oauth:2.0:oob', 'demo',
+                         'demo', instance.domain,
+                         instance.domain + '/api/v1/token/', **kwargs)
+    return _make
+
+
+@pytest.fixture
+def funkwhale(make_funkwhale):
+    return make_funkwhale()
+
+
+@pytest.fixture
+def oauth_funkwhale(server, tmp_path, monkeypatch):
+    """
+    Build clients of the mock server using the OAuth2 mode, whose token
+    expires in `expires_in` seconds
+    """
+    monkeypatch.setenv('OAUTHLIB_INSECURE_TRANSPORT', '1')
+
+    def _make(expires_in=3600, **kwargs):
+        token_filename = str(tmp_path / 'token.json')
+        with open(token_filename, 'w') as f:
+            json.dump({'access_token': 'access', 'token_type': 'Bearer',
+                       'refresh_token': 'refresh', 'expires_in': expires_in,
+                       'expires_at': time() + expires_in}, f)
+        return Funkwhale('pyfunkwhale', 'urn:ietf:wg:oauth:2.0:oob', 'demo',
+                         'demo', server.domain,
+                         server.domain + '/api/v1/oauth/token/', 'secret',
+                         'read', 'id', server.domain + '/authorize',
+                         token_filename, **kwargs)
+    return _make
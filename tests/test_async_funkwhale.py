@@ -0,0 +1,70 @@
+import asyncio
+import json
+from time import time
+
+import pytest
+
+from pyfunkwhale.deadline import DeadlineExceeded
+
+httpx = pytest.importorskip('httpx')
+
+from pyfunkwhale.async_funkwhale import AsyncFunkwhale  # noqa: E402
+
+
+def _plain(server, **kwargs):
+    return AsyncFunkwhale('pyfunkwhale', 'urn:ietf:wg:oauth:2.0:oob', 'demo',
+                          'demo', server.domain,
+                          server.domain + '/api/v1/token/', **kwargs)
+
+
+def test_listings(server):
+    async def _main():
+        async with _plain(server) as funkwhale:
+            page = await funkwhale.artists(page_size=2)
+            tracks = [t async for t in funkwhale.iter_tracks(
+                page_size=5, prefetch=True)]
+            r = await funkwhale.listen(server.catalog.tracks[0]['uuid'])
+            return page, tracks, r
+
+    page, tracks, r = asyncio.run(_main())
+    assert page['count'] == 6
+    assert [t['id'] for t in tracks] == list(range(1, 37))
+    assert r.content == server.catalog.audio_bytes(0, 200000)
+
+
+def test_oauth_login(server, tmp_path, monkeypatch):
+    monkeypatch.setenv('OAUTHLIB_INSECURE_TRANSPORT', '1')
+    token_filename = str(tmp_path / 'token.json')
+    with open(token_filename, 'w') as f:
+        json.dump({'access_token': 'access', 'token_type': 'Bearer',
+                   'refresh_token': 'refresh', 'expires_in': 3600,
+                   'expires_at': time() + 3600}, f)
+
+    async def _main():
+        async with AsyncFunkwhale(
+                'pyfunkwhale', 'urn:ietf:wg:oauth:2.0:oob', 'demo', 'demo',
+                server.domain, server.domain + '/api/v1/oauth/token/',
+                'secret', 'read', 'id', server.domain + '/authorize',
+                token_filename) as funkwhale:
+            # Logged in when entering the context
+            assert funkwhale.client.client.token['access_token'] == 'access'
+            return await funkwhale.user_me()
+
+    assert asyncio.run(_main()) == {'username': 'demo'}
+
+
+def test_errors(server):
+    async def _not_found():
+        async with _plain(server) as funkwhale:
+            await funkwhale.artist(99)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_not_found())
+
+    async def _slow():
+        async with _plain(server, deadline=0.1) as funkwhale:
+            server.latency = 0.5
+            await funkwhale.artists()
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(_slow())
@@ -0,0 +1,74 @@
+import pytest
+
+from pyfunkwhale.blob_cache import BlobCache
+
+
+def _write(tmp_path, name, content):
+    filename = tmp_path / name
+    filename.write_bytes(content)
+    return str(filename)
+
+
+def test_cached_downloads(server, make_funkwhale, tmp_path):
+    cache = BlobCache(str(tmp_path / 'blobs'))
+    funkwhale = make_funkwhale(blob_cache=cache, lazy_login=False)
+    uuid = server.catalog.tracks[0]['uuid']
+    audio = server.catalog.audio_bytes(0, server.catalog.audio_size)
+
+    for name in ('a.mp3', 'b.mp3'):
+        assert funkwhale.download(uuid, str(tmp_path / name)) == 200000
+        assert (tmp_path / name).read_bytes() == audio
+    r = funkwhale.listen(uuid)
+    assert r.headers['Content-Type'] == 'audio/mpeg'
+    assert r.content == audio
+    assert funkwhale.open_audio(uuid)[:] == audio
+
+    # The login and one download
+    assert server.requests == 2
+    assert cache.stats()['misses'] == 1
+
+
+def test_open_audio_without_cache(server, funkwhale):
+    with pytest.raises(ValueError):
+        funkwhale.open_audio(server.catalog.tracks[0]['uuid'])
+
+
+def test_put_and_get(tmp_path):
+    cache = BlobCache(str(tmp_path / 'blobs'))
+    cache.put('a', _write(tmp_path, 'a', b'audio'), 'audio/ogg')
+    cache.put('b', _write(tmp_path, 'b', b'audio'))
+
+    with cache.get('a') as f:
+        assert f.read() == b'audio'
+    assert cache.metadata('a') == {'content_type': 'audio/ogg'}
+    # Both keys share the same file
+    assert cache.size() == 5
+    assert cache.get('unknown') is None
+
+
+def test_eviction(tmp_path):
+    cache = BlobCache(str(tmp_path / 'blobs'), max_bytes=10)
+    cache.put('a', _write(tmp_path, 'a', b'123456'))
+    f = cache.get('a')
+    cache.put('b', _write(tmp_path, 'b', b'abcdef'))
+
+    assert cache.get('a') is None
+    assert cache.stats()['evictions'] == 1
+    # The file opened before its eviction stays readable
+    with f:
+        assert f.read() == b'123456'
+
+
+def test_corruption(tmp_path):
+    cache = BlobCache(str(tmp_path / 'blobs'), verify='checksum')
+    path = cache.put('a', _write(tmp_path, 'a', b'audio'))
+    with open(path, 'wb') as f:
+        f.write(b'other')
+
+    assert cache.get('a') is None
+    assert cache.stats()['corruptions'] == 1
+
+
+def test_invalid_policy(tmp_path):
+    with pytest.raises(ValueError):
+        BlobCache(str(tmp_path / 'blobs'), policy='fifo')
@@ -0,0 +1,39 @@
+import pytest
+
+from pyfunkwhale.cache import BaseCache, MemoryCache, SQLiteCache
+
+
+@pytest.mark.parametrize('cache', ['memory', 'sqlite'])
+def test_cached_calls(server, make_funkwhale, tmp_path, cache):
+    ttl = {'/artists/': 300}
+    if cache == 'memory':
+        cache = MemoryCache(ttl=ttl)
+    else:
+        cache = SQLiteCache(str(tmp_path / 'cache.db'), ttl=ttl)
+    funkwhale = make_funkwhale(cache=cache)
+
+    assert funkwhale.artist(1) == funkwhale.artist(1)
+    funkwhale.album(1)
+    funkwhale.album(1)
+
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'revalidations': 0}
+    # The login, the artist once and the album twice
+    assert server.requests == 4
+
+
+def test_never_cached(server, make_funkwhale):
+    cache = MemoryCache(default_ttl=300)
+    funkwhale = make_funkwhale(cache=cache)
+    funkwhale.favorites_tracks_ids()
+    funkwhale.favorites_tracks_ids()
+    assert not cache.cacheable('/favorites/tracks/all')
+    assert cache.stats()['hits'] == 0
+
+
+def test_base_cache_is_abstract():
+    class Incomplete(BaseCache):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,64 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from pyfunkwhale.client import InvalidTokenError
+from pyfunkwhale.hooks import Metrics
+
+
+def test_lazy_login(server, make_funkwhale):
+    funkwhale = make_funkwhale()
+    assert server.requests == 0
+    funkwhale.artists()
+    funkwhale.artists()
+    # The login and the two listings
+    assert server.requests == 3
+
+
+def test_oauth_login(oauth_funkwhale):
+    funkwhale = oauth_funkwhale()
+    assert funkwhale.user_me() == {'username': 'demo'}
+
+
+def test_oauth_without_token(oauth_funkwhale):
+    funkwhale = oauth_funkwhale()
+    os.remove(funkwhale.client.token_filename)
+    with pytest.raises(InvalidTokenError) as e:
+        funkwhale.artists()
+    assert '/authorize' in str(e.value)
+
+
+def test_thread_safe(make_funkwhale):
+    funkwhale = make_funkwhale(thread_safe=True, pool_maxsize=2,
+                               fast_json=True)
+    with ThreadPoolExecutor(8) as executor:
+        artists = list(executor.map(funkwhale.artist, range(1, 7)))
+    assert [a['name'] for a in artists] == [
+        'Artist {}'.format(i) for i in range(1, 7)]
+
+
+def test_metrics(make_funkwhale):
+    metrics = Metrics()
+    funkwhale = make_funkwhale(hooks=[metrics])
+    funkwhale.artist(1)
+    with pytest.raises(requests.HTTPError):
+        funkwhale.artist(99)
+
+    endpoint = metrics.summary()['endpoints']['/artists/{id}']
+    assert endpoint['requests'] == 2
+    assert endpoint['errors'] == 1
+    assert endpoint['latency']['count'] == 2
+    assert 'pyfunkwhale_errors_total{endpoint="/artists/{id}"} 1' \
+        in metrics.prometheus()
+
+
+def test_hedged_calls(server, make_funkwhale):
+    funkwhale = make_funkwhale(hedge=50, hedge_min_samples=2,
+                               thread_safe=True, lazy_login=False)
+    for _ in range(2):
+        funkwhale.artists()
+    server.latency = 0.2
+    assert funkwhale.artists()['count'] == 6
+    assert funkwhale.client.hedged == 1
@@ -0,0 +1,46 @@
+import threading
+
+import pytest
+
+from pyfunkwhale.deadline import Deadline, DeadlineExceeded, RequestCancelled
+
+
+def test_deadline():
+    deadline = Deadline(10, timeout=(1, 5))
+    assert deadline.bounded
+    assert 9 < deadline.remaining() <= 10
+    assert deadline.request_timeout() == (1, 5)
+    deadline.check()
+
+    assert Deadline().remaining() is None
+
+
+def test_deadline_exceeded():
+    deadline = Deadline(0)
+    with pytest.raises(DeadlineExceeded):
+        deadline.check()
+
+    cancel = threading.Event()
+    child = Deadline(10, cancel=cancel).child()
+    cancel.set()
+    with pytest.raises(RequestCancelled):
+        child.check()
+
+
+def test_call_deadline(server, make_funkwhale):
+    funkwhale = make_funkwhale(lazy_login=False)
+    server.latency = 0.5
+    with pytest.raises(DeadlineExceeded):
+        funkwhale.client.call('/artists/', 'get', deadline=0.1)
+
+    server.latency = 0
+    assert funkwhale.client.call('/artists/', 'get',
+                                 deadline=5).json()['count'] == 6
+
+
+def test_call_cancelled(server, make_funkwhale):
+    funkwhale = make_funkwhale(lazy_login=False)
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(RequestCancelled):
+        funkwhale.client.call('/artists/', 'get', cancel=cancel)
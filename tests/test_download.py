@@ -0,0 +1,53 @@
+import io
+
+import pytest
+import requests
+
+
+def _uuid(server, _id=1):
+    return server.catalog.tracks[_id - 1]['uuid']
+
+
+def _audio(server):
+    return server.catalog.audio_bytes(0, server.catalog.audio_size)
+
+
+def test_download(server, funkwhale, tmp_path):
+    destination = str(tmp_path / 'track.mp3')
+    progress = []
+    size = funkwhale.download(
+        _uuid(server), destination, chunk_size=65536,
+        progress=lambda done, total: progress.append((done, total)))
+    assert size == 200000
+    assert progress[-1] == (200000, 200000)
+    with open(destination, 'rb') as f:
+        assert f.read() == _audio(server)
+
+
+def test_download_resume(server, funkwhale, tmp_path):
+    destination = tmp_path / 'track.mp3'
+    destination.write_bytes(_audio(server)[:1000])
+    assert funkwhale.download(_uuid(server), str(destination)) == 200000
+    assert destination.read_bytes() == _audio(server)
+
+    # Already complete
+    assert funkwhale.download(_uuid(server), str(destination)) == 200000
+
+
+def test_download_segments(server, funkwhale, tmp_path):
+    destination = str(tmp_path / 'track.mp3')
+    assert funkwhale.download(_uuid(server), destination,
+                              segments=4) == 200000
+    with open(destination, 'rb') as f:
+        assert f.read() == _audio(server)
+
+
+def test_download_file_object(server, funkwhale):
+    f = io.BytesIO()
+    funkwhale.download(_uuid(server), f)
+    assert f.getvalue() == _audio(server)
+
+
+def test_download_not_found(funkwhale, tmp_path):
+    with pytest.raises(requests.HTTPError):
+        funkwhale.download('unknown', str(tmp_path / 'track.mp3'))
@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from pyfunkwhale.federation import FederationPool, match_score, result_key
+
+
+def test_search(make_server, make_funkwhale):
+    other = make_server()
+    pool = FederationPool({'one': make_funkwhale()}, timeout=5)
+    pool.add_instance('two', 'pyfunkwhale', 'urn:ietf:wg:oauth:2.0:oob',
+                      'demo', 'demo', other.domain,
+                      other.domain + '/api/v1/token/')
+
+    results = pool.artists(q='Artist 1')
+    assert results[0].item['name'] == 'Artist 1'
+    assert sorted(results[0].instances) == ['one', 'two']
+    assert len(results) == 1
+    assert pool.errors == {}
+
+
+def test_slow_instance(make_server, make_funkwhale):
+    slow = make_server(latency=2)
+    pool = FederationPool({'fast': make_funkwhale(),
+                           'slow': make_funkwhale(slow)}, timeout=0.3)
+
+    results = pool.tracks(page_size=5)
+    assert [r.instances for r in results] == [['fast']] * 5
+    assert isinstance(pool.errors['slow'], TimeoutError)
+    # The request to the slow instance ends with its deadline, before the
+    # instance answers
+    workers = [t for t in threading.enumerate()
+               if t.name.startswith('ThreadPoolExecutor')]
+    for thread in workers:
+        thread.join(1)
+    assert not any(thread.is_alive() for thread in workers)
+
+
+def test_invalid_resource():
+    with pytest.raises(ValueError):
+        list(FederationPool().stream('users'))
+
+
+def test_result_key():
+    assert result_key('artists', {'mbid': 'abc', 'name': 'A'}) == 'mbid:abc'
+    assert result_key('albums', {'title': 'B', 'artist': {'name': 'A'}}) \
+        == 'albums:b:a'
+    assert [match_score({'name': 'Nirvana'}, q)
+            for q in ('nirvana', 'nir', 'van', 'other')] == [3, 2, 1, 0]
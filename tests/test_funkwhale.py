@@ -0,0 +1,55 @@
+import pytest
+import requests
+
+
+def test_iter_pages(funkwhale):
+    tracks = list(funkwhale.iter_tracks(page_size=5, prefetch=True))
+    assert [t['id'] for t in tracks] == list(range(1, 37))
+
+    artists = list(funkwhale.iter_artists(page_size=4, max_items=5))
+    assert len(artists) == 5
+
+
+def test_iter_pages_invalid_ordering(funkwhale):
+    with pytest.raises(ValueError):
+        list(funkwhale.iter_artists(ordering='size'))
+
+
+def test_fields(funkwhale):
+    page = funkwhale.tracks(page_size=2, fields=['id', 'artist.name'])
+    assert page['results'] == [
+        {'id': 1, 'artist': {'name': 'Artist 1'}},
+        {'id': 2, 'artist': {'name': 'Artist 1'}}]
+
+
+def test_by_ids(funkwhale):
+    results = list(funkwhale.artists_by_ids([3, 1, 3, 99], ordered=True))
+    assert [r.id for r in results] == [3, 1, 99]
+    assert [r.result['name'] for r in results[:2]] == ['Artist 3',
+                                                      'Artist 1']
+    assert isinstance(results[2].error, requests.HTTPError)
+    assert results[2].result is None
+
+
+def test_artist_discography(funkwhale):
+    artist = funkwhale.artist_discography(2, page_size=2)
+    assert artist['name'] == 'Artist 2'
+    assert [len(album['tracks']) for album in artist['albums']] == [3, 3]
+
+    album = funkwhale.album_with_tracks(3)
+    assert [t['position'] for t in album['tracks']] == [1, 2, 3]
+
+
+def test_artist_discography_not_found(funkwhale):
+    with pytest.raises(requests.HTTPError):
+        funkwhale.artist_discography(99)
+
+
+def test_favorites(server, funkwhale):
+    results = list(funkwhale.add_favorites_tracks([1, 2, 3]))
+    assert all(r.error is None for r in results)
+    assert funkwhale.favorites_tracks_ids() == {1, 2, 3}
+
+    report = funkwhale.sync_favorites_tracks([2, 4])
+    assert server.favorites == {2, 4}
+    assert not [r for r in report.added + report.deleted if r.error]
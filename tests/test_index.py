@@ -0,0 +1,47 @@
+import pytest
+import requests
+
+from mock_server import Catalog
+from pyfunkwhale.index import CatalogIndex
+
+
+def test_ingest_and_search(server, funkwhale):
+    index = CatalogIndex(funkwhale)
+    assert index.ingest(page_size=10, batch_size=4) == {
+        'artists': 6, 'albums': 12, 'tracks': 36}
+    requests_count = server.requests
+
+    assert [a['name'] for a in index.artists('artist 3')] == ['Artist 3']
+    assert len(index.albums(artist=2)) == 2
+    tracks = index.tracks('track 0', album=4)
+    assert [t['title'] for t in tracks] == ['Track 0 of Album 1 of 2']
+    assert server.requests == requests_count
+
+
+def test_deleted_items(server, funkwhale):
+    index = CatalogIndex(funkwhale)
+    index.ingest(('artists',))
+    server.catalog = Catalog(artists=4, audio_size=1)
+    assert index.ingest(('artists',)) == {'artists': 4}
+    assert len(index.artists(limit=10)) == 4
+    assert index.artists('artist 6') == []
+
+
+def test_stale_index(server, funkwhale):
+    index = CatalogIndex(funkwhale, max_age=0)
+    assert index.is_stale('artists')
+    # Answered from the API
+    assert [a['name'] for a in index.artists('Artist 5')] == ['Artist 5']
+    assert server.requests == 2
+
+
+def test_failed_ingest(server, funkwhale):
+    index = CatalogIndex(funkwhale)
+    index.ingest(('artists',))
+    server.error_rate = 1
+    with pytest.raises(requests.HTTPError):
+        index.ingest(('artists',))
+    assert len(index.artists(limit=10)) == 6
+
+    with pytest.raises(ValueError):
+        index.ingest(('users',))
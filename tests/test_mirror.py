@@ -0,0 +1,43 @@
+import json
+import os
+
+import pytest
+
+from pyfunkwhale.mirror import Mirror
+
+
+def test_mirror(server, funkwhale, tmp_path):
+    directory = str(tmp_path / 'music')
+    stats = Mirror(funkwhale, directory, workers=3, page_size=4,
+                   verify='checksum', artist=1).run()
+    assert stats == {'downloaded': 6, 'skipped': 0, 'failed': 0,
+                     'bytes': 6 * 200000}
+    track = server.catalog.tracks[0]
+    with open(os.path.join(directory, track['uuid'] + '.mp3'), 'rb') as f:
+        assert f.read() == server.catalog.audio_bytes(0, 200000)
+
+    # The next run starts from the last page, its truncated file is
+    # downloaded again
+    last = server.catalog.tracks[5]
+    with open(os.path.join(directory, last['uuid'] + '.mp3'), 'r+b') as f:
+        f.truncate(10)
+    stats = Mirror(funkwhale, directory, page_size=4, verify='checksum',
+                   artist=1).run()
+    assert (stats['downloaded'], stats['skipped']) == (1, 1)
+
+
+def test_failed_tracks(funkwhale, tmp_path):
+    directory = str(tmp_path / 'music')
+    stats = Mirror(funkwhale, directory, page_size=4, to='wav',
+                   artist=1).run()
+    assert stats['failed'] == 6
+
+    with open(os.path.join(directory, '.mirror-state.json')) as f:
+        state = json.load(f)
+    assert state['page'] == 1
+    assert len(state['errors']) == 6
+
+
+def test_invalid_verify(funkwhale, tmp_path):
+    with pytest.raises(ValueError):
+        Mirror(funkwhale, str(tmp_path), verify='date')
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from pyfunkwhale.models import Artist, Track
+
+
+def test_from_page(funkwhale):
+    page = funkwhale.client.call('/tracks/', 'get', {'page_size': 2})
+    tracks = Track.from_page(page.content)
+    assert [t.id for t in tracks] == [1, 2]
+    assert tracks[0].artist == Artist.from_dict(
+        {'id': 1, 'name': 'Artist 1', 'mbid': tracks[0].artist.mbid,
+         'creation_date': tracks[0].artist.creation_date})
+    assert tracks[0].uploads[0].mimetype == 'audio/mpeg'
+    assert tracks[0].disc_number is None
+
+    assert [t.id for t in Track.from_iter(
+        funkwhale.iter_tracks(max_items=3))] == [1, 2, 3]
+
+
+def test_to_dict():
+    artist = Artist.from_json(json.dumps({'id': 1, 'name': 'A'}))
+    assert artist.to_dict() == {'id': 1, 'mbid': None, 'name': 'A',
+                                'creation_date': None, 'is_local': None}
+    assert Artist.from_dict(None) is None
+
+
+def test_invalid_json():
+    with pytest.raises(ValueError):
+        Artist.from_json(b'{')
+    with pytest.raises(AttributeError):
+        Artist.from_dict({'id': 1}).unknown = 1
@@ -0,0 +1,31 @@
+import pytest
+import requests
+
+from pyfunkwhale.prefetch import QueuePrefetcher
+
+
+def test_queue(server, funkwhale):
+    audio = server.catalog.audio_bytes(0, 200000)
+    uuids = [t['uuid'] for t in server.catalog.tracks[:4]]
+    with QueuePrefetcher(funkwhale, ahead=2) as prefetcher:
+        prefetcher.set_queue(uuids)
+        for _ in uuids:
+            with prefetcher.next() as stream:
+                assert stream.read() == audio
+        assert prefetcher.queue == []
+        with pytest.raises(IndexError):
+            prefetcher.next()
+
+
+def test_open_outside_queue(server, funkwhale):
+    uuid = server.catalog.tracks[10]['uuid']
+    with QueuePrefetcher(funkwhale) as prefetcher:
+        with prefetcher.open(uuid) as stream:
+            assert stream.read(1000) == server.catalog.audio_bytes(0, 1000)
+
+
+def test_download_error(funkwhale):
+    with QueuePrefetcher(funkwhale) as prefetcher:
+        with prefetcher.open('unknown') as stream:
+            with pytest.raises(requests.HTTPError):
+                stream.read()
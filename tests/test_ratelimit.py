@@ -0,0 +1,63 @@
+import pytest
+import requests
+from requests.models import Response
+
+from pyfunkwhale.hooks import Metrics
+from pyfunkwhale.ratelimit import RateLimiter
+
+
+def _response(status_code, method='GET', headers=None):
+    r = Response()
+    r.status_code = status_code
+    r.headers.update(headers or {})
+    r.request = requests.Request(method, 'http://localhost/').prepare()
+    return r
+
+
+def test_retry_delay():
+    limiter = RateLimiter(max_retries=2)
+    assert limiter.retry_delay(
+        _response(429, 'POST', {'Retry-After': '3'}), 0) == 3
+    assert limiter.remaining == 0
+    assert limiter.retry_delay(_response(503, 'GET'), 0) is not None
+    assert limiter.retry_delay(_response(429), 2) is None
+    assert limiter.retry_delay(_response(500), 0) is None
+
+
+def test_503_not_idempotent():
+    limiter = RateLimiter()
+    assert limiter.retry_delay(_response(503, 'POST'), 0) is None
+    assert limiter.retry_delay(_response(503, 'POST'), 0,
+                               idempotent=True) is not None
+
+
+def test_seed():
+    limiter = RateLimiter()
+    limiter.seed({'enabled': True, 'scopes': [
+        {'limit': 100, 'duration': 10, 'remaining': 40},
+        {'limit': 10, 'duration': 10, 'remaining': 0,
+         'reset_seconds': 30}]})
+    assert limiter.rate == 1
+    assert limiter.remaining == 0
+
+
+def test_retried_calls(server, make_funkwhale):
+    metrics = Metrics()
+    funkwhale = make_funkwhale(
+        rate_limiter=RateLimiter(max_retries=50, backoff=0.001),
+        hooks=[metrics], lazy_login=False)
+    server.error_rate = 0.5
+    for _id in range(1, 7):
+        assert funkwhale.artist(_id)['id'] == _id
+    assert metrics.summary()['endpoints']['/artists/{id}']['retries'] > 0
+
+
+def test_retries_exhausted(server, make_funkwhale):
+    funkwhale = make_funkwhale(rate_limiter=RateLimiter(max_retries=2),
+                               lazy_login=False)
+    server.error_rate = 1
+    with pytest.raises(requests.HTTPError) as e:
+        funkwhale.artist(1)
+    assert e.value.response.status_code == 429
+    # The request and its two retries
+    assert server.requests == 4
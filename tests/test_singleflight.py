@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pyfunkwhale.deadline import Deadline, DeadlineExceeded
+from pyfunkwhale.singleflight import SingleFlight
+
+
+def _slow(release, result):
+    def _func():
+        release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return _func
+
+
+def _run_two(flight, func, deadline=None):
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(flight.do, 'key', func)
+        while not flight.calls:
+            pass
+        waiter = executor.submit(flight.do, 'key', func, deadline)
+        return leader, waiter
+
+
+def test_shared_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    threading.Timer(0.1, release.set).start()
+    leader, waiter = _run_two(flight, _slow(release, 42))
+    assert leader.result() == waiter.result() == 42
+    assert (flight.calls, flight.shared) == (1, 1)
+
+
+def test_shared_error():
+    flight = SingleFlight()
+    release = threading.Event()
+    threading.Timer(0.1, release.set).start()
+    leader, waiter = _run_two(flight, _slow(release, ValueError('boom')))
+    for future in (leader, waiter):
+        with pytest.raises(ValueError):
+            future.result()
+
+
+def test_waiter_deadline():
+    flight = SingleFlight()
+    release = threading.Event()
+    threading.Timer(0.5, release.set).start()
+    leader, waiter = _run_two(flight, _slow(release, 42), Deadline(0.05))
+    with pytest.raises(DeadlineExceeded):
+        waiter.result()
+    assert leader.result() == 42
+
+
+def test_coalesced_calls(server, make_funkwhale):
+    funkwhale = make_funkwhale(coalesce=True, thread_safe=True,
+                               lazy_login=False)
+    server.latency = 0.2
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: funkwhale.artist(1), range(4)))
+    assert all(r == results[0] for r in results)
+    assert funkwhale.client.singleflight.calls == 1
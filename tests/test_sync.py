@@ -0,0 +1,32 @@
+import pytest
+
+from mock_server import Catalog
+from pyfunkwhale.sync import IncrementalSync
+
+
+def test_sync(server, funkwhale, tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    changes = IncrementalSync(funkwhale, checkpoint, page_size=4).sync()
+    assert [len(changes[r]) for r in ('artists', 'albums', 'tracks')] == [
+        6, 12, 36]
+
+    sync = IncrementalSync(funkwhale, checkpoint, page_size=4)
+    assert list(sync.changes('artists')) == []
+
+    server.catalog = Catalog(artists=8, audio_size=1)
+    assert [a['id'] for a in sync.changes('artists')] == [8, 7]
+
+
+def test_interrupted_sync(funkwhale, tmp_path):
+    sync = IncrementalSync(funkwhale, str(tmp_path / 'checkpoint.json'))
+    changes = sync.changes('artists')
+    next(changes)
+    changes.close()
+    assert 'artists' not in sync.checkpoint
+    assert len(list(sync.changes('artists'))) == 6
+
+
+def test_invalid_resource(funkwhale, tmp_path):
+    sync = IncrementalSync(funkwhale, str(tmp_path / 'checkpoint.json'))
+    with pytest.raises(ValueError):
+        list(sync.changes('users'))
@@ -0,0 +1,57 @@
+import json
+import logging
+from time import sleep, time
+
+import pytest
+
+from pyfunkwhale.hooks import Metrics
+
+
+def _wait(condition, timeout=2):
+    end = time() + timeout
+    while not condition() and time() < end:
+        sleep(0.01)
+    return condition()
+
+
+def test_background_refresh(oauth_funkwhale):
+    funkwhale = oauth_funkwhale(expires_in=30)
+    assert funkwhale.user_me() == {'username': 'demo'}
+
+    client = funkwhale.client
+
+    def _saved():
+        with open(client.token_filename) as f:
+            return json.load(f)['access_token'] != 'access'
+
+    assert _wait(_saved)
+    assert client.token['access_token'] != 'access'
+    assert not client.token_manager.needs_refresh()
+
+
+def test_expired_token(oauth_funkwhale):
+    metrics = Metrics()
+    funkwhale = oauth_funkwhale(expires_in=-1, hooks=[metrics])
+    funkwhale.user_me()
+    assert metrics.token_refreshes == 1
+    assert not funkwhale.client.token_manager.expired()
+
+
+def test_failed_background_refresh(server, oauth_funkwhale, caplog):
+    funkwhale = oauth_funkwhale(expires_in=1, token_refresh_margin=0.5)
+    funkwhale.user_me()
+    manager = funkwhale.client.token_manager
+
+    server.error_rate = 1
+    with caplog.at_level(logging.WARNING, 'pyfunkwhale.token_manager'):
+        assert _wait(lambda: manager.error is not None)
+    assert 'background refresh' in caplog.text
+    error = manager.error
+
+    # Raised once the token is expired, then refreshed again
+    server.error_rate = 0
+    assert _wait(manager.expired)
+    with pytest.raises(type(error)) as e:
+        funkwhale.user_me()
+    assert e.value is error
+    assert funkwhale.user_me() == {'username': 'demo'}
@@ -0,0 +1,43 @@
+import pytest
+
+from pyfunkwhale.transcode import TranscodePlanner, upload_format
+
+
+def test_plan(server, funkwhale):
+    planner = TranscodePlanner(funkwhale, ['flac', 'mp3'])
+    plan = planner.plan(1)
+    assert (plan.format, plan.to, plan.cached) == ('mp3', None, None)
+    assert plan.upload == server.catalog.tracks[0]['uploads'][0]
+
+    track = dict(server.catalog.tracks[0], uploads=[
+        {'uuid': 'a', 'mimetype': 'audio/flac', 'size': 30},
+        {'uuid': 'b', 'mimetype': 'audio/mpeg', 'size': 10}])
+    assert planner.plan(track).upload['uuid'] == 'b'
+
+
+def test_transcoded_fetch(server, funkwhale, tmp_path):
+    planner = TranscodePlanner(funkwhale, ['opus', 'ogg'],
+                               str(tmp_path / 'cache'))
+    first = planner.fetch(1, str(tmp_path / 'a.ogg'))
+    assert (first.format, first.to) == ('ogg', 'ogg')
+    requests_count = server.requests
+
+    second = planner.fetch(1, str(tmp_path / 'b.ogg'))
+    assert second.cached is not None
+    assert server.requests == requests_count + 1
+    assert (tmp_path / 'b.ogg').read_bytes() == \
+        server.catalog.audio_bytes(0, 200000)
+
+
+def test_no_playable_format(funkwhale):
+    planner = TranscodePlanner(funkwhale, ['flac', 'aac'])
+    with pytest.raises(ValueError):
+        planner.plan(1)
+    with pytest.raises(ValueError):
+        planner.plan({'id': 1, 'uploads': []})
+
+
+def test_upload_format():
+    assert upload_format({'mimetype': 'audio/ogg; codecs=opus'}) == 'ogg'
+    assert upload_format({'extension': 'FLAC'}) == 'flac'
+    assert upload_format({}) is None
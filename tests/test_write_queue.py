@@ -0,0 +1,43 @@
+from pyfunkwhale.write_queue import WriteQueue
+
+
+def test_coalesced_changes(server, funkwhale, tmp_path):
+    queue = WriteQueue(funkwhale, str(tmp_path / 'queue.db'),
+                       background=False)
+    queue.add_favorite_track(1)
+    queue.add_favorite_track(1)
+    queue.add_favorite_track(2)
+    queue.add_favorite_track(3)
+    queue.delete_favorite_track(3)
+    assert queue.pending() == 2
+
+    queue.join()
+    assert queue.pending() == 0
+    assert queue.sent == 2
+    assert server.favorites == {1, 2}
+    queue.close()
+
+
+def test_background_flush(server, funkwhale, tmp_path):
+    queue = WriteQueue(funkwhale, str(tmp_path / 'queue.db'),
+                       flush_interval=0.05)
+    queue.add_favorite_track(4)
+    queue.close()
+    assert server.favorites == {4}
+
+
+def test_instance_down(server, funkwhale, tmp_path):
+    filename = str(tmp_path / 'queue.db')
+    queue = WriteQueue(funkwhale, filename, retries=0, background=False)
+    queue.add_favorite_track(5)
+    server.error_rate = 1
+    assert queue.flush() == 0
+    queue.close(flush=False)
+
+    # The journal survives a restart
+    server.error_rate = 0
+    queue = WriteQueue(funkwhale, filename, background=False)
+    assert queue.pending() == 1
+    queue.join()
+    assert server.favorites == {5}
+    queue.close()